@@ -1,7 +1,7 @@
 """Django Admin models for Arklet."""
 
 from django.contrib import admin, messages
-from ark.models import Ark, Key, Naan, Shoulder, User
+from ark.models import Ark, Job, Key, Naan, Shoulder, User
 
 
 @admin.register(User)
@@ -27,7 +27,7 @@ class ShoulderAdmin(admin.ModelAdmin):
             defaults = tuple(defaults) + ('shoulder', )  
         return defaults
 
-    list_display = ["shoulder", "name", "naan"]
+    list_display = ["shoulder", "name", "naan", "template"]
 
 @admin.register(Key)
 class KeyAdmin(admin.ModelAdmin):
@@ -36,12 +36,35 @@ class KeyAdmin(admin.ModelAdmin):
     These access keys are used to mint and bind ARKs via the Arklet API.
     """
 
-    list_display = ["key", "naan", "active"]
+    list_display = ["key_id", "key", "naan", "active"]
     exclude=['key']
 
     def save_model(self, request, obj, form, change):
+        # Only issue a new API key when the Key is created. Regenerating it on
+        # change would save a new row and leave the old key active.
+        if change:
+            super().save_model(request, obj, form, change)
+            return
+
         obj, api_key = obj.generate_api_key()
         super().save_model(request, obj, form, change)
-        
+
         # Add a custom message after saving the model
         messages.success(request, f"Your new API key is {api_key}. Write this down in a secure location!")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Django Admin model for background bulk jobs, see ark/jobs.py."""
+
+    list_display = ["id", "naan", "operation", "status", "processed", "total", "failed", "created"]
+    list_filter = ["status", "operation"]
+    readonly_fields = ["naan", "operation", "total", "processed", "failed", "error", "finished", "leased_until"]
+    actions = ["requeue"]
+
+    @admin.action(description="Queue failed jobs again, resuming where they stopped")
+    def requeue(self, request, queryset):
+        count = queryset.filter(status=Job.FAILED).update(
+            status=Job.QUEUED, error="", finished=None
+        )
+        messages.success(request, f"Queued {count} job(s) again")
@@ -1,6 +1,29 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class ArkConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "ark"
+
+    def ready(self):
+        from ark import auth, bus, registry, resolver, snapshot
+
+        key_model = self.get_model("Key")
+        post_save.connect(auth.key_saved, sender=key_model)
+        post_delete.connect(auth.key_deleted, sender=key_model)
+
+        ark_model = self.get_model("Ark")
+        post_save.connect(resolver.ark_changed, sender=ark_model)
+        post_delete.connect(resolver.ark_changed, sender=ark_model)
+        post_delete.connect(snapshot.ark_deleted, sender=ark_model)
+
+        for model_name in ("Naan", "Shoulder"):
+            model = self.get_model(model_name)
+            post_save.connect(registry.changed, sender=model)
+            post_delete.connect(registry.changed, sender=model)
+
+        bus.subscribe("ark", resolver.evict_local)
+        bus.subscribe("key", auth.clear_tokens)
+        bus.subscribe("registry", registry.evict_local)
+        bus.subscribe("registry", resolver.forget_misses)
@@ -0,0 +1,87 @@
+"""API key authorization for the arklet management endpoints."""
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.crypto import salted_hmac
+
+from ark import bus
+from ark.cache import TTLCache
+from ark.models import Key
+
+# Tokens that already passed check_password, keyed by a keyed digest of
+# "<naan>:<token>" so the raw token is never held in memory. Values are
+# (key primary key, Naan) pairs so a revoked Key can be evicted.
+token_cache = TTLCache(
+    maxsize=settings.ARKLET_AUTH_CACHE_SIZE,
+    ttl=settings.ARKLET_AUTH_CACHE_TTL,
+)
+
+
+def _token_digest(naan, token: str) -> str:
+    return salted_hmac("ark.auth.token_cache", f"{naan}:{token}").hexdigest()
+
+
+def authorize(request, naan):
+    bearer_token = request.headers.get("Authorization")
+    if not bearer_token:
+        return None
+
+    key = bearer_token.split()[-1]
+
+    digest = _token_digest(naan, key)
+    cached = token_cache.get(digest)
+    if cached is not None:
+        return cached[1]
+
+    keys = Key.objects.filter(naan=naan, active=True).select_related("naan")
+    key_id, dot, secret = key.partition(".")
+    if dot:
+        # "<key_id>.<secret>" tokens address their Key directly: one indexed
+        # lookup and at most one hash check.
+        keys = keys.filter(key_id=key_id)[:1]
+    else:
+        # Legacy bare UUID keys have to be tried one by one.
+        keys = keys.filter(key_id__isnull=True)
+        secret = key
+
+    try:
+        for k in keys:
+            old_pk = k.pk
+            if k.check_password(secret):
+                if k.pk != old_pk:
+                    # Upgraded to the fast hasher, which moved the primary key.
+                    # Tokens cached against the old one would outlive a revoke.
+                    transaction.on_commit(lambda pk=old_pk: evict_key(pk))
+                    bus.publish("key")
+                token_cache.set(digest, (k.pk, k.naan))
+                return k.naan
+        return None
+    except ValidationError:  # probably an invalid key
+        return None
+
+
+def evict_key(key_pk) -> int:
+    """Forget every cached token that was verified against the given Key."""
+    return token_cache.evict_where(lambda value: value[0] == key_pk)
+
+
+def clear_tokens(_=None):
+    """Forget every cached token in this worker.
+
+    Run for "key" messages on the bus: other workers are told to drop all
+    their cached tokens rather than being sent the hashes of the keys that
+    changed.
+    """
+    token_cache.clear()
+
+
+def key_saved(sender, instance, **kwargs):
+    if not instance.active:
+        evict_key(instance.pk)
+        bus.publish("key")
+
+
+def key_deleted(sender, instance, **kwargs):
+    evict_key(instance.pk)
+    bus.publish("key")
@@ -0,0 +1,170 @@
+"""Per-NAAN Bloom filters over existing ARK strings.
+
+Most resolver misses are for NAANs and shoulders we host but identifiers
+that were never minted. When ARKLET_BLOOM_FILTER is enabled each worker
+builds one filter per NAAN in a background thread at start, and
+resolve_ark skips the ARK lookups whenever the filter says that neither
+the ARK nor any of its prefixes exist.
+
+A Bloom filter never gives false negatives, but only as long as it sees
+every ARK minted after it was built. Workers learn about ARKs minted in
+other processes through the invalidation bus, so the filters are only
+used when ARKLET_INVALIDATION_CHANNEL is set. Run the rebuild_bloom_filters
+management command to rebuild them in every worker, e.g. after the number
+of ARKs has grown well past the capacity they were sized for.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+from ark import bus
+from ark.models import Ark, Naan
+from ark.utils import gen_prefixes, keyset_chunks
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter sized for ``capacity`` items at ``error_rate``."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def stats(self) -> dict:
+        """Memory footprint and the false positive rate expected at the current fill."""
+        fill = 1 - math.exp(-self.num_hashes * self.count / self.num_bits)
+        return {
+            "items": self.count,
+            "capacity": self.capacity,
+            "bytes": len(self.bits),
+            "hashes": self.num_hashes,
+            "target_fpr": self.error_rate,
+            "estimated_fpr": fill ** self.num_hashes,
+        }
+
+
+_lock = threading.Lock()
+# NAAN -> BloomFilter in use, and the filters currently being rebuilt
+_filters = {}
+_building = {}
+skipped = {"count": 0}
+
+
+def build(naan: int) -> BloomFilter:
+    """Build a filter for one NAAN, streaming its ARKs from the database."""
+    arks = Ark.objects.filter(naan=naan)
+    capacity = math.ceil(arks.count() * settings.ARKLET_BLOOM_FILTER_HEADROOM) + 1000
+    bloom = BloomFilter(capacity, settings.ARKLET_BLOOM_FILTER_FPR)
+    with _lock:
+        _building[naan] = bloom
+    try:
+        for chunk in keyset_chunks(arks.values_list("ark", flat=True), "ark"):
+            for ark_str in chunk:
+                bloom.add(ark_str)
+    except Exception:
+        with _lock:
+            _building.pop(naan, None)
+        raise
+    with _lock:
+        _building.pop(naan, None)
+        _filters[naan] = bloom
+    return bloom
+
+
+def rebuild_all():
+    try:
+        for naan in Naan.objects.values_list("naan", flat=True):
+            build(naan)
+            logger.info("Built Bloom filter for NAAN %s: %s", naan, _filters[naan].stats())
+    finally:
+        connection.close()
+
+
+def add(*ark_strs):
+    """Record newly minted ARKs in this worker's filters."""
+    with _lock:
+        for ark_str in ark_strs:
+            naan = int(ark_str.split("/", 1)[0])
+            for bloom in (_filters.get(naan), _building.get(naan)):
+                if bloom is not None:
+                    bloom.add(ark_str)
+
+
+def definitely_absent(naan: int, identifier: str) -> bool:
+    """True if neither the ARK nor any of its prefixes can exist."""
+    bloom = _filters.get(naan)
+    if bloom is None:
+        return False
+    if f"{naan}/{identifier}" in bloom:
+        return False
+    if any(f"{naan}/{p}" in bloom for p in gen_prefixes(identifier)):
+        return False
+    skipped["count"] += 1
+    return True
+
+
+def stats() -> dict:
+    return {
+        "skipped_lookups": skipped["count"],
+        "naans": {naan: bloom.stats() for naan, bloom in _filters.items()},
+    }
+
+
+def _on_ark_changed(ark_strs):
+    if ark_strs:
+        add(*ark_strs)
+        return
+    # The bus may have missed mints: stop trusting the filters until rebuilt
+    with _lock:
+        _filters.clear()
+    _on_rebuild(None)
+
+
+_rebuilder = None
+
+
+def _on_rebuild(_):
+    global _rebuilder  # pylint: disable=global-statement
+    with _lock:
+        if _rebuilder is not None and _rebuilder.is_alive():
+            return
+        _rebuilder = threading.Thread(target=rebuild_all, name="arklet-bloom", daemon=True)
+        _rebuilder.start()
+
+
+def start_loading():
+    """Build this worker's filters in the background. Call once per process."""
+    if not settings.ARKLET_BLOOM_FILTER:
+        return
+    if not settings.ARKLET_INVALIDATION_CHANNEL:
+        logger.warning("ARKLET_BLOOM_FILTER needs ARKLET_INVALIDATION_CHANNEL, not loading filters")
+        return
+    bus.subscribe("ark", _on_ark_changed)
+    bus.subscribe("bloom", _on_rebuild)
+    _on_rebuild(None)
@@ -0,0 +1,155 @@
+"""Cross-process cache invalidation over Postgres LISTEN/NOTIFY.
+
+Every gunicorn worker, in both the minter and the resolver containers,
+keeps in-process caches. When ARKLET_INVALIDATION_CHANNEL is set, writes
+publish the identifiers they changed on that channel and each worker runs
+a listener thread that evicts the matching entries from its own caches.
+
+Identifiers published during a transaction are merged and sent as a single
+notification when it commits, so a 100-row bulk update sends one NOTIFY.
+The listener needs a session-level connection: it won't receive anything
+through pgbouncer in transaction pooling mode.
+"""
+
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# pg_notify payloads must be shorter than 8000 bytes
+MAX_PAYLOAD = 7900
+
+_subscribers = defaultdict(list)
+_local = threading.local()
+_listener = None
+
+
+def subscribe(kind: str, handler):
+    """Call handler(ids) in every worker when identifiers of kind change.
+
+    An empty list of ids means every cached entry of that kind is stale.
+    """
+    _subscribers[kind].append(handler)
+
+
+def publish(kind: str, *ids):
+    """Announce changed identifiers to the other workers once the transaction commits."""
+    if not settings.ARKLET_INVALIDATION_CHANNEL:
+        return
+    pending = getattr(_local, "pending", None)
+    if pending is None:
+        pending = _local.pending = defaultdict(set)
+    pending[kind].update(str(i) for i in ids)
+    # Outside a transaction this flushes right away. Inside one, every
+    # callback runs on commit but only the first finds anything pending.
+    transaction.on_commit(_flush)
+
+
+def announce(kind: str, *ids):
+    """Run this worker's handlers for the changed identifiers now and publish them."""
+    for handler in _subscribers.get(kind, []):
+        handler(list(ids))
+    publish(kind, *ids)
+
+
+def _flush():
+    pending = getattr(_local, "pending", None)
+    if not pending:
+        return
+    _local.pending = None
+    for payload in _payloads(pending):
+        _send(payload)
+
+
+def _payloads(pending):
+    """Split pending identifiers into payloads that fit in one notification."""
+    batch, size = defaultdict(list), 2
+    for kind, ids in pending.items():
+        if not ids:
+            batch[kind] = []
+            continue
+        for i in sorted(ids):
+            cost = len(json.dumps(i)) + len(kind) + 8
+            if size + cost > MAX_PAYLOAD and batch:
+                yield json.dumps(batch)
+                batch, size = defaultdict(list), 2
+            batch[kind].append(i)
+            size += cost
+    if batch:
+        yield json.dumps(batch)
+
+
+def _send(payload: str):
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_notify(%s, %s)", [settings.ARKLET_INVALIDATION_CHANNEL, payload]
+        )
+
+
+def dispatch(payload: str):
+    """Evict the identifiers in a notification payload from this worker's caches."""
+    try:
+        changes = json.loads(payload)
+    except json.JSONDecodeError:
+        logger.warning("Ignoring malformed invalidation payload %r", payload)
+        return
+    for kind, ids in changes.items():
+        for handler in _subscribers.get(kind, []):
+            handler(ids)
+
+
+def _flush_all():
+    # Notifications may be missed while disconnected
+    for handlers in _subscribers.values():
+        for handler in handlers:
+            handler([])
+
+
+def _listen(channel: str, poll_interval: float):
+    backoff = 1
+    while True:
+        db = connections.create_connection("default")
+        try:
+            db.ensure_connection()
+            db.set_autocommit(True)
+            raw = db.connection
+            with raw.cursor() as cursor:
+                cursor.execute('LISTEN "%s"' % channel.replace('"', '""'))
+            _flush_all()
+            backoff = 1
+            while True:
+                if select.select([raw], [], [], poll_interval) == ([], [], []):
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    dispatch(raw.notifies.pop(0).payload)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Invalidation listener lost its connection, reconnecting")
+            _flush_all()
+        finally:
+            db.close()
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+def start_listener():
+    """Start this worker's listener thread. Call once per process, after forking."""
+    global _listener  # pylint: disable=global-statement
+    channel = settings.ARKLET_INVALIDATION_CHANNEL
+    if not channel or _listener is not None:
+        return
+    if connections["default"].vendor != "postgresql":
+        return
+    _listener = threading.Thread(
+        target=_listen, args=(channel, 5.0), name="arklet-invalidation", daemon=True
+    )
+    _listener.start()
@@ -0,0 +1,85 @@
+"""Small in-process caches shared by the arklet hot paths."""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """A thread-safe, bounded LRU mapping whose entries expire after ``ttl`` seconds.
+
+    A ``maxsize`` of 0 disables the cache: every lookup is a miss and nothing
+    is stored. A ``ttl`` of None keeps entries until they are evicted.
+    """
+
+    def __init__(self, maxsize: int, ttl=None, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > self._timer():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = None if self.ttl is None else self._timer() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return None if entry is None else entry[0]
+
+    def evict_where(self, predicate) -> int:
+        """Drop every entry whose value satisfies ``predicate``."""
+        with self._lock:
+            stale = [k for k, (value, _) in self._data.items() if predicate(value)]
+            for k in stale:
+                del self._data[k]
+        return len(stale)
+
+    def evict_keys(self, predicate) -> int:
+        """Drop every entry whose key satisfies ``predicate``."""
+        with self._lock:
+            stale = [k for k in self._data if predicate(k)]
+            for k in stale:
+                del self._data[k]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def __len__(self):
+        return len(self._data)
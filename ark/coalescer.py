@@ -0,0 +1,129 @@
+"""Group commit for concurrent single-ARK mints.
+
+Every POST /mint is normally its own INSERT and commit, and at thousands of
+mints a minute the commit fsyncs dominate. With ARKLET_MINT_COALESCE_WINDOW
+set, mint_ark hands its validated request to mint() instead. The first
+caller waits up to the window (milliseconds) for others to join, or until
+ARKLET_MINT_COALESCE_BATCH have, then inserts the whole batch in one
+transaction with Ark.mint_batch and hands each caller its own ARK.
+
+Batches form among the threads of one worker process, so this only helps
+workers that serve requests concurrently, e.g. gunicorn --threads. Errors
+stay per request: a row that keeps colliding only fails its own caller,
+and if the batch insert fails outright each row is retried alone.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from ark.models import Ark
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending:
+    """One caller's mint request, waiting for its batch to be flushed."""
+
+    __slots__ = ("row", "done", "ark", "error")
+
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.ark = None
+        self.error = None
+
+
+class MintCoalescer:
+    """Collect concurrent mint requests into batches inserted together."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._batch = None
+        self.batches = 0
+        self.mints = 0
+
+    def mint(self, naan, shoulder, fields: dict, attempts: int):
+        """Mint one ARK in the next batch. Returns None if it kept colliding."""
+        item = _Pending((naan, shoulder, fields))
+        max_batch = settings.ARKLET_MINT_COALESCE_BATCH
+        with self._cond:
+            batch = self._batch
+            if batch is None:
+                batch = self._batch = [item]
+                leader = True
+            else:
+                batch.append(item)
+                leader = False
+                if len(batch) >= max_batch:
+                    # Close the batch and wake its leader
+                    self._batch = None
+                    self._cond.notify_all()
+        if leader:
+            self._lead(batch, attempts)
+        else:
+            item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.ark
+
+    def _lead(self, batch, attempts):
+        deadline = time.monotonic() + settings.ARKLET_MINT_COALESCE_WINDOW / 1000
+        with self._cond:
+            while self._batch is batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._batch = None
+                    break
+                self._cond.wait(remaining)
+        try:
+            self._flush(batch, attempts)
+        except BaseException as e:  # pylint: disable=broad-except
+            for item in batch:
+                if item.ark is None and item.error is None:
+                    item.error = e
+        finally:
+            with self._cond:
+                self.batches += 1
+                self.mints += len(batch)
+            for item in batch:
+                item.done.set()
+
+    @staticmethod
+    def _flush(batch, attempts):
+        try:
+            with transaction.atomic():
+                arks = Ark.mint_batch([item.row for item in batch], attempts)
+        except DatabaseError:
+            if len(batch) == 1:
+                raise
+            # One bad row fails the whole INSERT, so mint them one at a time
+            # to keep the failure to its own caller
+            logger.warning("Coalesced mint of %d ARKs failed, minting them one by one", len(batch))
+            for item in batch:
+                try:
+                    with transaction.atomic():
+                        item.ark = Ark.mint_batch([item.row], attempts)[0]
+                except DatabaseError as e:
+                    item.error = e
+            return
+        for item, ark in zip(batch, arks):
+            item.ark = ark
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "mints": self.mints,
+            "mean_batch": self.mints / self.batches if self.batches else 0,
+        }
+
+
+coalescer = MintCoalescer()
+
+
+def mint(naan, shoulder, fields: dict, attempts: int):
+    """Mint one ARK together with concurrent callers. See MintCoalescer.mint."""
+    return coalescer.mint(naan, shoulder, fields, attempts)
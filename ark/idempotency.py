@@ -0,0 +1,100 @@
+"""Idempotency-Key support for the mint endpoints.
+
+A client that times out on POST /mint or /bulk_mint can't tell whether its
+ARKs were minted. If it sends an Idempotency-Key header, retrying with the
+same key returns the response of the first request instead of minting again,
+for ARKLET_IDEMPOTENCY_RETENTION seconds.
+
+The response is recorded in the same transaction that mints the ARKs, with
+one INSERT ... ON CONFLICT, so a first request costs a single extra statement
+and no lookup. When the key is already taken the mint is rolled back and the
+stored response replayed. A concurrent duplicate waits on the unique index
+until the first request commits and then replays its response.
+"""
+
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from ark.models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+def request_key(request):
+    """The request's Idempotency-Key, or None if it didn't send one."""
+    return request.headers.get(HEADER)
+
+
+def _fingerprint(request) -> bytes:
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    digest.update(request.body)
+    return digest.digest()
+
+
+def _cutoff():
+    return timezone.now() - timedelta(seconds=settings.ARKLET_IDEMPOTENCY_RETENTION)
+
+
+def _record(naan, key, fingerprint, response) -> bool:
+    """Store the response under the key unless a live one is stored. True if stored."""
+    table = connection.ops.quote_name(IdempotencyKey._meta.db_table)
+    columns = ("naan_id", "key", "fingerprint", "status", "body", "created")
+    quoted = [connection.ops.quote_name(c) for c in columns]
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    cutoff = connection.ops.adapt_datetimefield_value(_cutoff())
+    updates = ", ".join(f"{c} = excluded.{c}" for c in quoted[2:])
+    with connection.cursor() as cursor:
+        # Keys past the retention window are taken over as if they were new
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(quoted)}) VALUES (%s, %s, %s, %s, %s, %s) "
+            f"ON CONFLICT ({quoted[0]}, {quoted[1]}) DO UPDATE SET {updates} "
+            f"WHERE {table}.{quoted[5]} < %s RETURNING id",
+            [naan.naan, key, fingerprint, response.status_code, response.content.decode(), now, cutoff],
+        )
+        return cursor.fetchone() is not None
+
+
+def _replay(naan, key, fingerprint):
+    stored = IdempotencyKey.objects.filter(naan=naan, key=key, created__gte=_cutoff()).first()
+    if stored is None:
+        # Purged between our insert and this read
+        return HttpResponse(f"The response stored for this {HEADER} expired, try again", status=409)
+    if bytes(stored.fingerprint) != fingerprint:
+        return HttpResponse(f"{HEADER} was already used for a different request", status=422)
+    response = HttpResponse(stored.body, status=stored.status, content_type="application/json")
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def once(request, naan, key: str, mint):
+    """Return mint()'s response, or the stored response of an earlier request with key.
+
+    mint must do all of its writes in the current transaction. Only
+    successful responses are stored, so failed requests can be retried.
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return HttpResponse(f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters", status=400)
+    fingerprint = _fingerprint(request)
+    with transaction.atomic():
+        response = mint()
+        if response.status_code >= 300 or _record(naan, key, fingerprint, response):
+            return response
+        transaction.set_rollback(True)
+    return _replay(naan, key, fingerprint)
+
+
+def purge(chunk_size=10000) -> int:
+    """Delete keys past the retention window. Returns how many were deleted."""
+    expired = IdempotencyKey.objects.filter(created__lt=_cutoff())
+    deleted = 0
+    while True:
+        ids = list(expired.values_list("id", flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
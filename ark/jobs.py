@@ -0,0 +1,143 @@
+"""Background jobs for bulk mints, updates and imports too large for one request.
+
+POST /jobs stores the records of a newline-delimited JSON body as JobRecord
+rows and answers at once with the job's id; clients poll GET /jobs/<id> for
+progress and read GET /jobs/<id>/results when it's done. The run_jobs
+command works through queued jobs ARKLET_JOB_CHUNK_SIZE records at a time
+with the same code as the stream_* views.
+
+Everything lives in the database, so no broker is needed. A worker leases a
+job with SELECT ... FOR UPDATE SKIP LOCKED and renews the lease with every
+chunk. Each chunk's ARKs, results and the job's checkpoint (Job.processed)
+are committed in one transaction, so a worker that dies loses at most the
+chunk it was on, and once the lease runs out another worker resumes the job
+from the checkpoint.
+"""
+
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ark import views
+from ark.models import Job, JobRecord
+from ark.resolver import invalidate, minted
+
+logger = logging.getLogger(__name__)
+
+PROCESSORS = {
+    Job.MINT: views.mint_chunk,
+    Job.UPDATE: views.update_chunk,
+    Job.IMPORT: views.import_chunk,
+}
+
+
+class LeaseLost(Exception):
+    """Another worker took the job over, so this one must stop."""
+
+
+def _lease():
+    return timezone.now() + timedelta(seconds=settings.ARKLET_JOB_LEASE)
+
+
+def claim():
+    """Lease the oldest queued or abandoned job, or return None if there is none."""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=Job.QUEUED) | Q(status=Job.RUNNING, leased_until__lt=now))
+            .select_related("naan")
+            .order_by("created")
+            .first()
+        )
+        if job is None:
+            return None
+        if job.status == Job.RUNNING:
+            logger.warning("Resuming %s at record %d", job, job.processed)
+        job.status = Job.RUNNING
+        job.leased_until = _lease()
+        job.save(update_fields=["status", "leased_until"])
+    return job
+
+
+def run_chunk(job: Job, chunk_size: int) -> bool:
+    """Process the job's next chunk of records. Returns False once there are none left."""
+    records = list(job.records.filter(position__gte=job.processed).order_by("position")[:chunk_size])
+    if not records:
+        Job.objects.filter(id=job.id, status=Job.RUNNING).update(
+            status=Job.DONE, finished=timezone.now(), leased_until=None
+        )
+        return False
+    # Lines that weren't records got their result when the job was submitted
+    pending = [(r.line, r.data) for r in records if r.result is None]
+    with transaction.atomic():
+        results = dict(PROCESSORS[job.operation](job.naan, pending)) if pending else {}
+        for record in records:
+            if record.result is None:
+                record.result = results[record.line]
+        JobRecord.objects.bulk_update(records, ["result"])
+        failed = sum("error" in record.result for record in records)
+        # Only move the checkpoint from where this worker found it; if another
+        # worker got there first, roll this chunk back
+        moved = Job.objects.filter(id=job.id, status=Job.RUNNING, processed=job.processed).update(
+            processed=F("processed") + len(records),
+            failed=F("failed") + failed,
+            leased_until=_lease(),
+        )
+        if not moved:
+            raise LeaseLost(str(job))
+    job.processed += len(records)
+    job.failed += failed
+    _evict(job, results.values())
+    return True
+
+
+def _evict(job: Job, results):
+    """Drop cached redirects and misses again, now that the chunk is committed.
+
+    The chunk functions already evict, but inside the job's transaction, so
+    a concurrent resolve could have cached the old state in between.
+    """
+    arks = [result["ark"] for result in results if "error" not in result]
+    if job.operation == Job.UPDATE:
+        invalidate(*arks)
+    else:
+        minted(*arks)
+
+
+def run(job: Job, chunk_size: int = None):
+    """Run a claimed job to the end, unless another worker takes it over."""
+    chunk_size = chunk_size or settings.ARKLET_JOB_CHUNK_SIZE
+    try:
+        while run_chunk(job, chunk_size):
+            pass
+    except LeaseLost:
+        logger.warning("Lost the lease on %s, another worker resumed it", job)
+    except Exception as e:  # pylint: disable=broad-except
+        # Records before the checkpoint stay done; the job can be queued again
+        # from the admin once the cause is fixed
+        logger.exception("%s failed at record %d", job, job.processed)
+        Job.objects.filter(id=job.id, status=Job.RUNNING).update(
+            status=Job.FAILED, error=str(e), finished=timezone.now(), leased_until=None
+        )
+
+
+def work(poll: float, once: bool = False):
+    """Run jobs as they are queued. With once, return when none are left."""
+    while True:
+        # A long-running worker must not hold on to a connection the
+        # database has dropped
+        close_old_connections()
+        job = claim()
+        if job is not None:
+            logger.info("Running %s", job)
+            run(job)
+        elif once:
+            return
+        else:
+            time.sleep(poll)
@@ -5,6 +5,7 @@ the given naan
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from ark.models import Ark, Naan, Shoulder
+from ark.routers import replica_reads
 from ark.utils import generate_noid
 from django.db.models import Count
 import json
@@ -18,6 +19,7 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("naan", type=int)
 
+    @replica_reads()
     def handle(self, *args, **options):
         naan = Naan.objects.get(pk=options["naan"])
         arks = Ark.objects.filter(naan=naan).values('shoulder__shoulder').annotate(total=Count('ark')).order_by('shoulder__shoulder')
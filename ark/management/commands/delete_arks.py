@@ -26,7 +26,7 @@ class Command(BaseCommand):
             naan = Naan(naan=options['naan'])
             naan.save()
 
-        shoulder = Shoulder.objects.get(shoulder=shoulder_str)
+        shoulder = Shoulder.objects.get(shoulder=shoulder_str, naan=naan)
         arks = Ark.objects.filter(shoulder=shoulder, naan=naan)
         info = arks.delete()
         print(f"Deleted {info[0]} objects")
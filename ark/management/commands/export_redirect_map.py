@@ -0,0 +1,53 @@
+"""Django Admin command to export ARK redirects as nginx map files.
+
+See ark/redirect_map.py. Run a full export periodically, e.g. nightly, and
+an incremental one as often as you like, then reload nginx.
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ark import redirect_map
+
+
+class Command(BaseCommand):
+
+    help = "Write bound ARKs to nginx map files so nginx can redirect without arklet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output_dir", type=str)
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="only rewrite the delta map with ARKs modified since the last full export",
+        )
+        parser.add_argument(
+            "--margin",
+            type=int,
+            default=300,
+            help="seconds before a full export starts that the delta map covers, "
+            "so writes still committing during the export aren't missed",
+        )
+        parser.add_argument("--chunk-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        output_dir = options["output_dir"]
+        if options["incremental"]:
+            try:
+                counts = redirect_map.export_delta(output_dir, options["chunk_size"])
+            except FileNotFoundError as e:
+                raise CommandError(f"{e}, run a full export first") from e
+            self.stdout.write(
+                f"Delta: {counts['exported']} redirects, "
+                f"{counts['fall_through']} sent back to arklet, {counts['skipped']} skipped"
+            )
+        else:
+            counts = redirect_map.export_full(
+                output_dir, timedelta(seconds=options["margin"]), options["chunk_size"]
+            )
+            self.stdout.write(
+                f"Base: {counts['exported']} redirects, {counts['skipped']} skipped. "
+                f"map_hash_max_size must be at least {counts['exported']}"
+            )
+        self.stdout.write(self.style.SUCCESS("Reload nginx to pick up the new maps"))
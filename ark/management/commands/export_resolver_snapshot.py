@@ -0,0 +1,40 @@
+"""Django Admin command to write the memory-mapped resolver snapshot.
+
+See ark/snapshot.py. Write it to a path that resolver workers read through
+ARKLET_RESOLVER_SNAPSHOT; they pick up the new file within
+ARKLET_RESOLVER_SNAPSHOT_REFRESH seconds.
+"""
+
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ark import snapshot
+
+
+class Command(BaseCommand):
+
+    help = "Write every ARK's redirect URL and the NAAN fallback URLs to a resolver snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=str)
+        parser.add_argument("--chunk-size", type=int, default=10000)
+        parser.add_argument(
+            "--keep-deleted",
+            type=int,
+            default=7,
+            help="days to keep records of ARKs deleted before this export, "
+            "for hosts still serving an older snapshot",
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        count = snapshot.write(options["path"], options["chunk_size"])
+        size = os.path.getsize(options["path"])
+        forgotten = snapshot.forget_deleted(started - timedelta(days=options["keep_deleted"]))
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {count} ARKs ({size} bytes) to {options['path']}, "
+            f"forgot {forgotten} deleted ARKs"
+        ))
@@ -5,6 +5,7 @@ the given naan and shoulder
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from ark.models import Ark, Naan, Shoulder
+from ark.routers import replica_reads
 from ark.utils import generate_noid
 import os
 import random
@@ -18,10 +19,11 @@ class Command(BaseCommand):
         parser.add_argument("naan", type=int)
         parser.add_argument("shoulder", type=str)
 
+    @replica_reads()
     def handle(self, *args, **options):
         shoulder_str = options['shoulder']
         naan = Naan.objects.get(pk=options["naan"])
-        shoulder = Shoulder.objects.get(shoulder=shoulder_str)
+        shoulder = Shoulder.objects.get(shoulder=shoulder_str, naan=naan)
         arks = Ark.objects.filter(shoulder=shoulder, naan=naan)
         possible_ids = list(arks.values_list('ark', flat=True))
         random_ids = random.choices(possible_ids, k=50)
@@ -26,7 +26,7 @@ class Command(BaseCommand):
             naan = Naan(naan=options['naan'])
             naan.save()
 
-        shoulder = Shoulder.objects.get(shoulder=options['shoulder'])
+        shoulder = Shoulder.objects.get(shoulder=options['shoulder'], naan=naan)
         if not shoulder:
             print('minting shoulder')
             shoulder = Shoulder(shoulder=options['shoulder'], naan=Naan)
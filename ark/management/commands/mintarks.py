@@ -6,8 +6,11 @@ ARKs, it doesn't bind URLs to them.
 
 from django.core.management.base import BaseCommand
 
-from ark.models import Ark, Naan
-from ark.utils import generate_noid
+from ark.models import Ark, Shoulder
+from ark.resolver import minted
+from ark.utils import generate_noids
+
+CHUNK_SIZE = 10000
 
 
 class Command(BaseCommand):
@@ -22,16 +25,14 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         ark_count = options["ark_count"]
-        naan_id = options["naan"]
-        naan = Naan.objects.get(pk=options["naan"])
-        shoulder = options["shoulder"]
-
-        Ark.objects.bulk_create(
-            Ark(
-                ark=f"{naan_id}{shoulder}{generate_noid(20)}",
-                naan=naan,
-                shoulder=shoulder,
-            )
-            for _ in range(ark_count)
+        shoulder = Shoulder.objects.select_related("naan").get(
+            naan=options["naan"], shoulder=options["shoulder"]
         )
+
+        for start in range(0, ark_count, CHUNK_SIZE):
+            noids = generate_noids(min(CHUNK_SIZE, ark_count - start), 20)
+            arks = Ark.objects.bulk_create(Ark.create_many(shoulder.naan, shoulder, noids))
+            # bulk_create sends no post_save, so tell the workers' Bloom
+            # filters and miss caches about the new ARKs like the mint views do
+            minted(*(ark.ark for ark in arks))
         self.stdout.write(self.style.SUCCESS(f"Successfully minted {ark_count} ARKs"))
@@ -0,0 +1,21 @@
+"""Django Admin command to delete expired Idempotency-Key responses.
+
+See ark/idempotency.py. Run it from cron; keys older than
+ARKLET_IDEMPOTENCY_RETENTION seconds are no longer replayed either way.
+"""
+
+from django.core.management.base import BaseCommand
+
+from ark import idempotency
+
+
+class Command(BaseCommand):
+
+    help = "Delete stored mint responses older than ARKLET_IDEMPOTENCY_RETENTION"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge(options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys"))
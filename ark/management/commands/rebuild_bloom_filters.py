@@ -0,0 +1,30 @@
+"""Django Admin command to rebuild the resolver Bloom filters.
+
+Builds a filter for each NAAN to report its size and false positive rate,
+then tells every running worker to rebuild its own filters.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ark import bloom, bus
+from ark.models import Naan
+
+
+class Command(BaseCommand):
+
+    help = "Rebuild the per-NAAN Bloom filters in every worker and report their size"
+
+    def handle(self, *args, **options):
+        for naan in Naan.objects.values_list("naan", flat=True):
+            stats = bloom.build(naan).stats()
+            self.stdout.write(
+                f"NAAN {naan}: {stats['items']} ARKs, {stats['bytes']} bytes, "
+                f"{stats['hashes']} hashes, estimated false positive rate "
+                f"{stats['estimated_fpr']:.6f} (target {stats['target_fpr']})"
+            )
+        if not settings.ARKLET_INVALIDATION_CHANNEL:
+            self.stdout.write(self.style.WARNING("ARKLET_INVALIDATION_CHANNEL is not set, workers don't use filters"))
+            return
+        bus.publish("bloom")
+        self.stdout.write(self.style.SUCCESS("Asked running workers to rebuild their filters"))
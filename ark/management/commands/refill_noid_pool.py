@@ -0,0 +1,26 @@
+"""Django Admin command to top up the pools of pre-generated NOIDs.
+
+See ark/noid_pool.py. Minter workers refill the pools in the background when
+ARKLET_NOID_POOL_SIZE is set; run this before a large ingest, or from cron
+when the background refill is off.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ark import noid_pool
+
+
+class Command(BaseCommand):
+
+    help = "Top up each random shoulder's pool of pre-generated NOIDs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=settings.ARKLET_NOID_POOL_SIZE)
+
+    def handle(self, *args, **options):
+        if options["size"] <= 0:
+            raise CommandError("Set ARKLET_NOID_POOL_SIZE or pass --size")
+        for shoulder, added in noid_pool.refill_all(options["size"]).items():
+            self.stdout.write(f"{shoulder}: added {added} NOIDs")
+        self.stdout.write(self.style.SUCCESS("Done"))
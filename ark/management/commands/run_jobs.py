@@ -0,0 +1,23 @@
+"""Django Admin command to run queued bulk mint, update and import jobs.
+
+See ark/jobs.py. Run one or more of these next to the minter; they share the
+work through the database, and a job whose worker died is resumed from its
+last checkpoint by another once ARKLET_JOB_LEASE seconds have passed.
+"""
+
+from django.core.management.base import BaseCommand
+
+from ark import jobs
+
+
+class Command(BaseCommand):
+
+    help = "Run queued bulk jobs, checking for new ones every --poll seconds"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--poll", type=float, default=5)
+        parser.add_argument("--once", action="store_true", help="exit when no jobs are left")
+
+    def handle(self, *args, **options):
+        jobs.work(options["poll"], once=options["once"])
+        self.stdout.write(self.style.SUCCESS("No jobs left"))
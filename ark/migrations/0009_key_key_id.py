@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ark', '0008_alter_shoulder_shoulder_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='key',
+            name='key_id',
+            field=models.CharField(editable=False, max_length=32, null=True, unique=True),
+        ),
+    ]
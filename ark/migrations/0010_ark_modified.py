@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ark', '0009_key_key_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ark',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Building the index concurrently doesn't block writes to a large table,
+    # but can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('ark', '0010_ark_modified'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS "ark_ark_modified_42022f6c" ON "ark_ark" ("modified")',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS "ark_ark_modified_42022f6c"',
+            state_operations=[
+                migrations.AlterField(
+                    model_name='ark',
+                    name='modified',
+                    field=models.DateTimeField(auto_now=True, db_index=True),
+                ),
+            ],
+        ),
+    ]
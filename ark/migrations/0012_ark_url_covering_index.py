@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Building the index concurrently doesn't block writes to a large table,
+    # but can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('ark', '0011_ark_modified_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS "ark_ark_url_covering" '
+            'ON "ark_ark" ("ark") INCLUDE ("url")',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS "ark_ark_url_covering"',
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='ark',
+                    index=models.Index(fields=['ark'], include=('url',), name='ark_ark_url_covering'),
+                ),
+            ],
+        ),
+    ]
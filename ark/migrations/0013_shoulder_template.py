@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ark', '0012_ark_url_covering_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoulderCounter',
+            fields=[
+                ('shoulder', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='ark.shoulder'
+                )),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='shoulder',
+            name='template',
+            field=models.CharField(
+                choices=[('random', 'Random NOIDs'), ('sequential', 'Sequential NOIDs, never collide')],
+                default='random',
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ark', '0013_shoulder_template'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PooledNoid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('noid', models.CharField(max_length=50)),
+                ('shoulder', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ark.shoulder')),
+            ],
+            options={
+                'unique_together': {('shoulder', 'noid')},
+            },
+        ),
+    ]
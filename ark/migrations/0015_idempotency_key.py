@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ark', '0014_pooled_noid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('fingerprint', models.BinaryField(max_length=32)),
+                ('status', models.PositiveSmallIntegerField()),
+                ('body', models.TextField()),
+                ('created', models.DateTimeField(db_index=True)),
+                ('naan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ark.naan')),
+            ],
+            options={
+                'unique_together': {('naan', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:45
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ark', '0015_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('operation', models.CharField(choices=[('mint', 'Mint'), ('update', 'Update'), ('import', 'Import')], max_length=10)),
+                ('status', models.CharField(
+                    choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')],
+                    db_index=True,
+                    default='queued',
+                    max_length=10,
+                )),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('leased_until', models.DateTimeField(blank=True, null=True)),
+                ('naan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ark.naan')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='JobRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('line', models.PositiveIntegerField()),
+                ('data', models.JSONField(null=True)),
+                ('result', models.JSONField(null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='records', to='ark.job')),
+            ],
+            options={
+                'unique_together': {('job', 'position')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:00
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Building the index concurrently doesn't block writes to a large table,
+    # but can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('ark', '0016_job'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS "ark_ark_byte_order" '
+            'ON "ark_ark" (("ark" COLLATE "C")) INCLUDE ("url")',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS "ark_ark_byte_order"',
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='ark',
+                    index=models.Index(
+                        django.db.models.functions.comparison.Collate('ark', 'C'),
+                        include=('url',),
+                        name='ark_ark_byte_order',
+                    ),
+                ),
+            ],
+        ),
+    ]
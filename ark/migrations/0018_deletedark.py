@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ark', '0017_ark_byte_order_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedArk',
+            fields=[
+                ('ark', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('deleted', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
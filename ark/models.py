@@ -1,15 +1,24 @@
+import logging
 import uuid
-import os
 import hashlib
+import secrets
+from collections import defaultdict
+from itertools import islice
 
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.hashers import make_password, check_password
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.db.models.functions import Collate
 
 
 from ark.forms import UpdateArkForm, validate_shoulder
-from ark.utils import generate_noid, noid_check_digit
+from ark.hashers import APIKeyHasher
+from ark.utils import betanumeric, generate_noids, noid_check_digits
+
+logger = logging.getLogger(__name__)
 
 class Naan(models.Model):
     naan = models.PositiveBigIntegerField(primary_key=True)
@@ -30,11 +39,15 @@ class User(AbstractUser):
 
 class Key(models.Model):
     key = models.CharField(max_length=4096, primary_key=True)
+    # Public half of a "<key_id>.<secret>" API token. Keys issued before
+    # key IDs existed are bare UUIDs and have no key_id.
+    key_id = models.CharField(max_length=32, unique=True, null=True, editable=False)
 
     def generate_api_key(self):
-        api_key = uuid.uuid4()
-        self.set_password(str(api_key))
-        return self, api_key
+        self.key_id = secrets.token_hex(6)
+        secret = uuid.uuid4()
+        self.set_password(str(secret))
+        return self, f"{self.key_id}.{secret}"
 
     @classmethod
     def create_for_naan(cls, naan_id):
@@ -50,11 +63,26 @@ class Key(models.Model):
 
     def set_password(self, raw_password):
         # Hash the raw password before storing it in the database
-        self.key = make_password(raw_password)
+        self.key = make_password(raw_password, hasher=APIKeyHasher.algorithm)
 
     def check_password(self, raw_password):
-        # Check if the provided raw password matches the hashed password in the database
-        return check_password(raw_password, self.key)
+        # Check if the provided raw password matches the hashed password in the database.
+        # Keys still hashed with a slower hasher are upgraded on first successful use.
+        return check_password(
+            raw_password, self.key, setter=self._rehash, preferred=APIKeyHasher.algorithm
+        )
+
+    def _rehash(self, raw_password):
+        # The hash is the primary key, so move the row rather than saving a
+        # new one. Lock it first: a revoke committed meanwhile must not be
+        # lost, and one still waiting on the lock finds the row gone.
+        old_key = self.key
+        with transaction.atomic():
+            active = Key.objects.select_for_update().filter(pk=old_key).values_list("active", flat=True).first()
+            if not active:
+                return
+            self.set_password(raw_password)
+            Key.objects.filter(pk=old_key).update(key=self.key)
 
     naan = models.ForeignKey(Naan, on_delete=models.CASCADE)
     active = models.BooleanField(default=True)
@@ -63,12 +91,24 @@ class Key(models.Model):
         return f"Key-{self.naan.naan}-{self.key[:8]}..."
 
 
+# Postgres sequences known to exist, so each is only created once per process
+_sequences = set()
+
+
 class Shoulder(models.Model):
+    RANDOM = "random"
+    SEQUENTIAL = "sequential"
+    TEMPLATES = [
+        (RANDOM, "Random NOIDs"),
+        (SEQUENTIAL, "Sequential NOIDs, never collide"),
+    ]
+
     shoulder = models.CharField(max_length=50, validators=[validate_shoulder])
     naan = models.ForeignKey(Naan, on_delete=models.DO_NOTHING)
 
     name = models.CharField(max_length=200)
     description = models.TextField()
+    template = models.CharField(max_length=20, choices=TEMPLATES, default=RANDOM)
 
     class Meta:
         unique_together = ('shoulder', 'naan')
@@ -76,6 +116,78 @@ class Shoulder(models.Model):
     def __str__(self):
         return f"{self.naan.naan}{self.shoulder}"
 
+    def mint_noids(self, count: int) -> list:
+        """Return count NOIDs for new ARKs on this shoulder, without check digits."""
+        length = settings.ARKLET_NOID_LENGTH
+        if self.template == self.SEQUENTIAL:
+            return [betanumeric(value, length) for value in self.reserve(count)]
+        noids = PooledNoid.claim(self, count) if settings.ARKLET_NOID_POOL_SIZE else []
+        # An empty pool falls back to drawing NOIDs here and retrying collisions
+        return noids + generate_noids(count - len(noids), length)
+
+    def reserve(self, count: int) -> list:
+        """Take the next count values of this shoulder's counter.
+
+        On Postgres the counter is a sequence and the whole range is taken in
+        one round trip. Other databases use a ShoulderCounter row.
+        """
+        if connection.vendor == "postgresql":
+            sequence = f"ark_shoulder_{self.pk}_seq"
+            with connection.cursor() as cursor:
+                if sequence not in _sequences:
+                    cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS "{sequence}"')
+                    transaction.on_commit(lambda: _sequences.add(sequence))
+                cursor.execute("SELECT nextval(%s) FROM generate_series(1, %s)", [sequence, count])
+                return [row[0] for row in cursor.fetchall()]
+        with transaction.atomic():
+            ShoulderCounter.objects.get_or_create(shoulder=self)
+            # The update locks the row until the transaction ends
+            ShoulderCounter.objects.filter(shoulder=self).update(value=F("value") + count)
+            last = ShoulderCounter.objects.get(shoulder=self).value
+        return list(range(last - count + 1, last + 1))
+
+
+class ShoulderCounter(models.Model):
+    """Last counter value used by a sequential shoulder on databases without sequences."""
+
+    shoulder = models.OneToOneField(Shoulder, on_delete=models.CASCADE, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+
+class PooledNoid(models.Model):
+    """A NOID generated ahead of time for a random shoulder. See ark/noid_pool.py."""
+
+    shoulder = models.ForeignKey(Shoulder, on_delete=models.CASCADE)
+    noid = models.CharField(max_length=50)
+
+    class Meta:
+        unique_together = ("shoulder", "noid")
+
+    @classmethod
+    def claim(cls, shoulder: Shoulder, count: int) -> list:
+        """Remove and return up to count NOIDs from the shoulder's pool.
+
+        Rows locked by concurrent claims are skipped rather than waited for,
+        so minters never block on each other or get the same NOID.
+        """
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {cls._meta.db_table} WHERE id IN ("
+                    f"SELECT id FROM {cls._meta.db_table} WHERE shoulder_id = %s "
+                    "LIMIT %s FOR UPDATE SKIP LOCKED) RETURNING noid",
+                    [shoulder.pk, count],
+                )
+                return [row[0] for row in cursor.fetchall()]
+        with transaction.atomic():
+            rows = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(shoulder=shoulder)
+                .values_list("id", "noid")[:count]
+            )
+            cls.objects.filter(id__in=[pk for pk, _ in rows]).delete()
+        return [noid for _, noid in rows]
+
 
 class Ark(models.Model):
     ark = models.CharField(primary_key=True, max_length=200, editable=False)
@@ -94,6 +206,20 @@ class Ark(models.Model):
     relation = models.TextField(default="", blank=True)
     source = models.TextField(default="", blank=True)
 
+    # Served as Last-Modified by the ?info and ?json views, and indexed for
+    # incremental redirect map exports
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Lets Postgres answer redirect lookups, which only read ark and
+            # url, with index-only scans instead of fetching the wide rows.
+            models.Index(fields=["ark"], include=["url"], name="ark_ark_url_covering"),
+            # Lets export_resolver_snapshot page through ARKs in byte order
+            # with index scans instead of sorting the whole table per page.
+            models.Index(Collate("ark", "C"), include=["url"], name="ark_ark_byte_order"),
+        ]
+
     COLUMN_METADATA = {
         'title': {
             'property': "http://purl.org/dc/elements/1.1/title",
@@ -134,21 +260,105 @@ class Ark(models.Model):
             raise ValidationError(f"expected {expected_ark} got {self.ark}")
     
     @classmethod
-    def create(cls, naan: Naan, shoulder: Shoulder):
-        noid = generate_noid(os.environ.get("ARKLET_NOID_LENGTH", 8))
+    def create(cls, naan: Naan, shoulder: Shoulder, noid: str = None):
+        """Build an unsaved ARK on the shoulder, drawing a NOID from it unless given one."""
+        if noid is None:
+            noid = shoulder.mint_noids(1)[0]
+        return cls.create_many(naan, shoulder, [noid])[0]
+
+    @classmethod
+    def create_many(cls, naan: Naan, shoulder: Shoulder, noids: list) -> list:
+        """Build an unsaved ARK on the shoulder for each NOID, with their check digits."""
         ark_prefix = f"{naan.naan}{shoulder.shoulder}"
-        base_ark_string = f"{ark_prefix}{noid}"
-        check_digit = noid_check_digit(base_ark_string)
-        assigned_name = f"{noid}{check_digit}"
-        ark_string = f"{ark_prefix}{assigned_name}"
-
-        return Ark(
-            ark=ark_string,
-            naan=naan,
-            shoulder=shoulder,
-            assigned_name=assigned_name
-        )
+        arks = []
+        for noid, check_digit in zip(noids, noid_check_digits(ark_prefix, noids)):
+            assigned_name = f"{noid}{check_digit}"
+            arks.append(Ark(
+                ark=f"{ark_prefix}{assigned_name}",
+                naan=naan,
+                shoulder=shoulder,
+                assigned_name=assigned_name
+            ))
+        return arks
     
+    @classmethod
+    def insert_new(cls, arks: list) -> set:
+        """Insert the ARKs, skipping those whose identifier is taken.
+
+        Returns the identifiers that were inserted. Unlike
+        bulk_create(ignore_conflicts=True) this asks the database which rows
+        landed, with INSERT ... ON CONFLICT DO NOTHING RETURNING (Postgres,
+        or SQLite 3.35+).
+        """
+        if not arks:
+            return set()
+        fields = cls._meta.concrete_fields
+        table = connection.ops.quote_name(cls._meta.db_table)
+        columns = ", ".join(connection.ops.quote_name(f.column) for f in fields)
+        row_sql = f"({', '.join(['%s'] * len(fields))})"
+        pk = connection.ops.quote_name(cls._meta.pk.column)
+        batch_size = connection.ops.bulk_batch_size(fields, arks) or len(arks)
+        inserted = set()
+        with connection.cursor() as cursor:
+            for i in range(0, len(arks), batch_size):
+                batch = arks[i:i + batch_size]
+                params = [
+                    # pre_save fills in auto_now fields such as modified
+                    f.get_db_prep_save(f.pre_save(ark, add=True), connection)
+                    for ark in batch
+                    for f in fields
+                ]
+                cursor.execute(
+                    f"INSERT INTO {table} ({columns}) VALUES {', '.join([row_sql] * len(batch))} "
+                    f"ON CONFLICT DO NOTHING RETURNING {pk}",
+                    params,
+                )
+                inserted.update(row[0] for row in cursor.fetchall())
+        for ark in arks:
+            if ark.ark in inserted:
+                ark._state.adding = False  # pylint: disable=protected-access
+        return inserted
+
+    @classmethod
+    def mint_batch(cls, rows: list, attempts: int) -> list:
+        """Mint an ARK for each (naan, shoulder, fields) row, retrying only rows that collide.
+
+        Returns the new ARKs in row order, with None for rows that still
+        collided after the given number of attempts. Run it in a transaction.
+        """
+        arks = [None] * len(rows)
+        pending = list(range(len(rows)))
+        collisions = 0
+        for _ in range(attempts):
+            # Draw each shoulder's NOIDs at once, so sequential shoulders
+            # reserve their whole range in one query
+            groups = defaultdict(list)
+            for i in pending:
+                groups[rows[i][:2]].append(i)
+            pending, new_arks = [], []
+            for (naan, shoulder), indexes in groups.items():
+                arks_for_shoulder = cls.create_many(naan, shoulder, shoulder.mint_noids(len(indexes)))
+                for i, ark in zip(indexes, arks_for_shoulder):
+                    ark.set_fields(rows[i][2])
+                pending += indexes
+                new_arks += arks_for_shoulder
+            inserted = cls.insert_new(new_arks)
+            retry = []
+            for i, ark in zip(pending, new_arks):
+                if ark.ark in inserted:
+                    # The same NOID drawn twice in one batch only lands once
+                    inserted.remove(ark.ark)
+                    arks[i] = ark
+                else:
+                    retry.append(i)
+            pending = retry
+            if not pending:
+                break
+            collisions += len(pending)
+        if collisions and not pending:
+            logger.warning("ARKs created after %d collision(s)", collisions)
+        return arks
+
     def set_fields(self, data: dict):
         permitted_fields = set(UpdateArkForm.base_fields)
         permitted_fields.remove('ark')
@@ -158,3 +368,90 @@ class Ark(models.Model):
 
     def __str__(self):
         return f"ark:/{self.ark}"
+
+
+class DeletedArk(models.Model):
+    """An ARK deleted through the ORM, so resolver snapshots stop answering for it. See ark/snapshot.py."""
+
+    ark = models.CharField(primary_key=True, max_length=200)
+    deleted = models.DateTimeField(auto_now=True, db_index=True)
+
+
+class IdempotencyKey(models.Model):
+    """The stored response of a mint request sent with an Idempotency-Key. See ark/idempotency.py."""
+
+    naan = models.ForeignKey(Naan, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    # sha256 of the method, path and body, to refuse reuse for another request
+    fingerprint = models.BinaryField(max_length=32)
+    status = models.PositiveSmallIntegerField()
+    body = models.TextField()
+    created = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ("naan", "key")
+
+
+class Job(models.Model):
+    """A bulk mint, update or import run in the background by the job worker. See ark/jobs.py."""
+
+    MINT, UPDATE, IMPORT = "mint", "update", "import"
+    OPERATIONS = [(MINT, "Mint"), (UPDATE, "Update"), (IMPORT, "Import")]
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+    STATUSES = [(QUEUED, "Queued"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    naan = models.ForeignKey(Naan, on_delete=models.CASCADE)
+    operation = models.CharField(max_length=10, choices=OPERATIONS)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED, db_index=True)
+    total = models.PositiveIntegerField(default=0)
+    # Also the checkpoint: records at positions below it are done
+    processed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    error = models.TextField(default="", blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    # The worker running the job renews this after every chunk, so a job
+    # whose lease ran out lost its worker and is picked up again
+    leased_until = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def submit(cls, naan: Naan, operation: str, records, chunk_size: int):
+        """Queue a job for the (line, record, error) triples of ark.streaming.records.
+
+        Lines that aren't records are stored with their error as the result.
+        Run it in a transaction, so a body that can't be read queues nothing.
+        """
+        job = cls.objects.create(naan=naan, operation=operation)
+        records = iter(records)
+        while chunk := list(islice(records, chunk_size)):
+            JobRecord.objects.bulk_create([
+                JobRecord(
+                    job=job,
+                    position=job.total + i,
+                    line=line,
+                    data=record,
+                    result=None if error is None else {"error": error},
+                )
+                for i, (line, record, error) in enumerate(chunk)
+            ])
+            job.total += len(chunk)
+        job.save(update_fields=["total"])
+        return job
+
+    def __str__(self):
+        return f"{self.operation} job {self.id}"
+
+
+class JobRecord(models.Model):
+    """One record of a Job, with its result once processed."""
+
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name="records")
+    # Order of the record in the job; line is its line in the request body
+    position = models.PositiveIntegerField()
+    line = models.PositiveIntegerField()
+    data = models.JSONField(null=True)
+    result = models.JSONField(null=True)
+
+    class Meta:
+        unique_together = ("job", "position")
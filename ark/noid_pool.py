@@ -0,0 +1,129 @@
+"""Pools of pre-generated NOIDs for random shoulders.
+
+Minting a random NOID means inserting it and retrying on a collision, and on
+a dense shoulder or a short ARKLET_NOID_LENGTH those retries pile up inside
+mint requests. With ARKLET_NOID_POOL_SIZE set, NOIDs are instead generated
+here ahead of time, checked against existing ARKs and each other, and stored
+as PooledNoid rows. Shoulder.mint_noids claims them with
+SELECT ... FOR UPDATE SKIP LOCKED, so concurrent minters each get different
+NOIDs without waiting on one another.
+
+Each minter worker refills the pools in a background thread; the
+refill_noid_pool command does the same on demand. On Postgres a refill
+holds an advisory lock on the shoulder, so with many workers only one tops
+a pool up at a time and the others skip it, instead of each adding the
+missing NOIDs. Mints that find the pool empty fall back to drawing random
+NOIDs themselves.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from ark.models import Ark, PooledNoid, Shoulder
+from ark.utils import generate_noids, noid_check_digits
+
+logger = logging.getLogger(__name__)
+
+# Candidate NOIDs checked against the ARK table per query
+BATCH_SIZE = 500
+# Give up topping a pool up when this many batches in a row add nothing,
+# i.e. the shoulder is about full at this NOID length
+MAX_EMPTY_BATCHES = 10
+
+# First key of the two-key advisory locks taken per shoulder ("NOID")
+LOCK_NAMESPACE = 0x4E4F4944
+
+_refiller = None
+
+
+@contextmanager
+def _refill_lock(shoulder: Shoulder):
+    """Yield whether this process may refill the shoulder's pool now.
+
+    The lock is transaction scoped, so it holds behind pgbouncer's
+    transaction pooling too, and the refill commits all at once.
+    """
+    with transaction.atomic():
+        if connection.vendor != "postgresql":
+            yield True
+            return
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s, %s)", [LOCK_NAMESPACE, shoulder.pk])
+            locked = cursor.fetchone()[0]
+        yield locked
+
+
+def refill(shoulder: Shoulder, size: int) -> int:
+    """Top the shoulder's pool up to size NOIDs. Returns how many were added.
+
+    Returns 0 without doing anything while another process refills it.
+    """
+    with _refill_lock(shoulder) as locked:
+        if not locked:
+            return 0
+        return _refill(shoulder, size)
+
+
+def _refill(shoulder: Shoulder, size: int) -> int:
+    length = settings.ARKLET_NOID_LENGTH
+    prefix = f"{shoulder.naan_id}{shoulder.shoulder}"
+    pool = PooledNoid.objects.filter(shoulder=shoulder)
+    start = have = pool.count()
+    empty = 0
+    while have < size and empty < MAX_EMPTY_BATCHES:
+        # Draw a full batch even when only a few are missing, so that a nearly
+        # full shoulder still turns up free NOIDs
+        candidates = list(set(generate_noids(BATCH_SIZE, length)))
+        digits = noid_check_digits(prefix, candidates)
+        arks = {f"{prefix}{noid}{digit}": noid for noid, digit in zip(candidates, digits)}
+        noids = set(candidates)
+        noids -= {arks[ark] for ark in Ark.objects.filter(ark__in=arks).values_list("ark", flat=True)}
+        noids -= set(pool.filter(noid__in=noids).values_list("noid", flat=True))
+        # The unique constraint drops NOIDs pooled concurrently
+        PooledNoid.objects.bulk_create(
+            [PooledNoid(shoulder=shoulder, noid=noid) for noid in list(noids)[:size - have]],
+            ignore_conflicts=True,
+        )
+        before, have = have, pool.count()
+        empty = empty + 1 if have == before else 0
+    if have < size:
+        logger.warning("Could only fill %d of %d pooled NOIDs for shoulder %s", have, size, shoulder)
+    return have - start
+
+
+def refill_all(size: int) -> dict:
+    """Top up the pool of every random shoulder. Returns NOIDs added per shoulder."""
+    return {
+        str(shoulder): refill(shoulder, size)
+        for shoulder in Shoulder.objects.filter(template=Shoulder.RANDOM).select_related("naan")
+    }
+
+
+def _refill_loop(size, interval):
+    while True:
+        try:
+            refill_all(size)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Couldn't refill the NOID pools")
+        finally:
+            connection.close()
+        time.sleep(interval)
+
+
+def start_refilling():
+    """Keep the NOID pools topped up in the background. Call once per process."""
+    global _refiller  # pylint: disable=global-statement
+    if not settings.ARKLET_NOID_POOL_SIZE or _refiller is not None:
+        return
+    _refiller = threading.Thread(
+        target=_refill_loop,
+        args=(settings.ARKLET_NOID_POOL_SIZE, settings.ARKLET_NOID_POOL_REFILL),
+        name="arklet-noid-pool",
+        daemon=True,
+    )
+    _refiller.start()
@@ -0,0 +1,128 @@
+"""Export ARK redirects as nginx map files.
+
+Most resolutions are plain redirects, which nginx can answer on its own
+from a map of "<naan>/<identifier>" to URL (see nginx/nginx.conf). Two
+files are written:
+
+* redirects-base.map holds every bound ARK at the time of the last full
+  export.
+* redirects-delta.map holds every ARK modified since shortly before that
+  export started. It overrides the base map. ARKs that have since become
+  unbound, or that can't be exported, are mapped to "-", which sends them
+  back to arklet.
+
+A full export streams the whole table in keyset chunks, so memory stays
+bounded however many ARKs there are. An incremental export only rewrites
+the delta. Each file is written next to its final path and renamed over
+it, so nginx never reloads a partial file. Deleted ARKs stay in the maps
+until the next full export.
+
+Only requests without a query string whose ARK is exactly a key in the
+maps are answered by nginx. ?info, ?json, suffix passthrough and unbound
+ARKs all reach resolve_ark as before.
+"""
+
+import json
+import os
+import re
+import tempfile
+from datetime import timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ark.models import Ark
+from ark.utils import keyset_chunks
+
+BASE = "redirects-base.map"
+DELTA = "redirects-delta.map"
+STATE = "redirects-state.json"
+FALL_THROUGH = "-"
+
+# nginx matches keys against the raw request URI, so only ARKs that can't
+# be percent-encoded, and that need no escaping in the map file, are exported.
+_SAFE_KEY = re.compile(r"[\w.~!&'()*+,:=@/-]+\Z", re.ASCII)
+# nginx would expand "$" in a value as a variable
+_SAFE_URL = re.compile(r"https?://[^\s\"\\$;{}]+\Z", re.ASCII)
+
+
+def exportable(ark_str: str, url: str) -> bool:
+    return bool(url) and bool(_SAFE_KEY.match(ark_str)) and bool(_SAFE_URL.match(url))
+
+
+def _write_atomic(path, lines):
+    """Write lines to path through a temporary file in the same directory."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".map")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates files only the owner can read
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _lines(rows, counts, delta):
+    for chunk in rows:
+        for ark_str, url in chunk:
+            if exportable(ark_str, url):
+                counts["exported"] += 1
+                yield f'"{ark_str}" "{url}";\n'
+            elif delta and _SAFE_KEY.match(ark_str):
+                counts["fall_through"] += 1
+                yield f'"{ark_str}" "{FALL_THROUGH}";\n'
+            else:
+                counts["skipped"] += 1
+
+
+def _read_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, STATE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_state(output_dir, state):
+    path = os.path.join(output_dir, STATE)
+    _write_atomic(path, [json.dumps(state, indent=2), "\n"])
+
+
+def export_full(output_dir, margin: timedelta, chunk_size=10000) -> dict:
+    """Write every bound ARK to the base map and empty the delta map."""
+    started = timezone.now()
+    counts = {"exported": 0, "fall_through": 0, "skipped": 0}
+    rows = keyset_chunks(
+        Ark.objects.exclude(url="").values_list("ark", "url"), "ark", chunk_size
+    )
+    _write_atomic(os.path.join(output_dir, BASE), _lines(rows, counts, delta=False))
+    _write_atomic(os.path.join(output_dir, DELTA), [])
+    _write_state(output_dir, {
+        "base_started": started.isoformat(),
+        "delta_since": (started - margin).isoformat(),
+        "base": counts,
+    })
+    return counts
+
+
+def export_delta(output_dir, chunk_size=10000) -> dict:
+    """Rewrite the delta map with every ARK modified since the last full export."""
+    state = _read_state(output_dir)
+    if state is None:
+        raise FileNotFoundError(f"No full export found in {output_dir}")
+    since = parse_datetime(state["delta_since"])
+    counts = {"exported": 0, "fall_through": 0, "skipped": 0}
+    rows = keyset_chunks(
+        Ark.objects.filter(modified__gte=since).values_list("ark", "url"), "ark", chunk_size
+    )
+    _write_atomic(os.path.join(output_dir, DELTA), _lines(rows, counts, delta=True))
+    state["delta"] = counts
+    state["delta_exported"] = timezone.now().isoformat()
+    _write_state(output_dir, state)
+    return counts
@@ -0,0 +1,111 @@
+"""Process-wide registry of NAANs and shoulders.
+
+These tables are tiny and almost never change, but minting looks up a
+shoulder on every request and resolving falls back to the NAAN URL on every
+miss. The registry keeps all of them in memory, keyed by NAAN and by
+(NAAN, shoulder), and reloads after ARKLET_REGISTRY_TTL seconds or as soon
+as a Naan or Shoulder is saved or deleted in any worker.
+
+Saves are announced once their transaction commits, so no worker reloads
+the registry before the change is visible. Other workers only hear of it
+through the invalidation bus (ARKLET_INVALIDATION_CHANNEL); without it, a
+lookup that misses reloads the registry, at most every
+MISS_RELOAD_INTERVAL seconds, before giving up, so a new NAAN or shoulder
+works everywhere right away.
+"""
+
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from ark import bus
+from ark.models import Naan, Shoulder
+from ark.routers import primary_reads
+
+# Seconds between the reloads that lookup misses cause
+MISS_RELOAD_INTERVAL = 1
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def _load():
+    # Kept for ARKLET_REGISTRY_TTL, so never from a lagging replica
+    with primary_reads():
+        naans = {naan.naan: naan for naan in Naan.objects.all()}
+        shoulders = list(Shoulder.objects.all())
+    by_key = {}
+    for shoulder in shoulders:
+        if shoulder.naan_id not in naans:
+            continue
+        # Share the Naan instances rather than loading them again
+        shoulder.naan = naans[shoulder.naan_id]
+        by_key[(shoulder.naan_id, shoulder.shoulder)] = shoulder
+    now = time.monotonic()
+    return now + settings.ARKLET_REGISTRY_TTL, naans, by_key, now
+
+
+def _stale(snapshot):
+    return snapshot is None or snapshot[0] < time.monotonic()
+
+
+def _current(missed=False):
+    """The loaded registry. With missed, reload it unless that was just done."""
+    global _snapshot  # pylint: disable=global-statement
+    snapshot = _snapshot
+    if _stale(snapshot) or missed:
+        with _lock:
+            snapshot = _snapshot
+            if _stale(snapshot) or (missed and snapshot[3] + MISS_RELOAD_INTERVAL < time.monotonic()):
+                snapshot = _snapshot = _load()
+    return snapshot
+
+
+def _get(index: int, key):
+    found = _current()[index].get(key)
+    if found is None:
+        found = _current(missed=True)[index].get(key)
+    return found
+
+
+def get_naan(naan):
+    """Return the Naan with this number, or None if it isn't hosted here."""
+    try:
+        return _get(1, int(naan))
+    except (TypeError, ValueError):
+        return None
+
+
+async def aget_naan(naan):
+    """Async variant of get_naan(), which only leaves the event loop to reload."""
+    try:
+        key = int(naan)
+    except (TypeError, ValueError):
+        return None
+    snapshot = _snapshot
+    if _stale(snapshot) or (key not in snapshot[1] and snapshot[3] + MISS_RELOAD_INTERVAL < time.monotonic()):
+        return await sync_to_async(_get)(1, key)
+    return snapshot[1].get(key)
+
+
+def get_shoulder(naan, shoulder: str):
+    """Return the Shoulder of this NAAN, or None if the NAAN has no such shoulder."""
+    try:
+        return _get(2, (int(naan), shoulder))
+    except (TypeError, ValueError):
+        return None
+
+
+def evict_local(_=None):
+    """Reload the registry on next use in this worker."""
+    global _snapshot  # pylint: disable=global-statement
+    _snapshot = None
+
+
+def changed(sender, instance, **kwargs):
+    # Not before the commit, or a concurrent request in this worker could
+    # reload the old rows and keep them for ARKLET_REGISTRY_TTL
+    transaction.on_commit(lambda: bus.announce("registry"))
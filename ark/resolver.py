@@ -0,0 +1,291 @@
+"""Caching for ARK resolution.
+
+resolve_ark is the hottest path in arklet and most traffic goes to a small
+set of popular ARKs, so each worker keeps the redirect URL of recently
+resolved ARKs in memory. Keys are normalized "<naan>/<identifier>" strings.
+
+When ARKLET_RESOLVER_SHARED_CACHE names a Django cache, a second layer is
+shared by every worker using that cache. Shared entries are versioned: each
+ARK has a generation counter that invalidate() bumps, and an entry is only
+used if it was written under the current generation, and the generation is
+only bumped once the update commits. A worker that read the database before
+the commit can therefore never publish a stale URL.
+"""
+
+import hashlib
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, transaction
+from django.db.models.functions import Length
+
+from ark import bloom, bus, registry, snapshot
+from ark.cache import TTLCache
+from ark.models import Ark
+from ark.routers import primary_reads
+from ark.utils import gen_prefixes
+
+logger = logging.getLogger(__name__)
+
+resolution_cache = TTLCache(
+    maxsize=settings.ARKLET_RESOLVER_CACHE_SIZE,
+    ttl=settings.ARKLET_RESOLVER_CACHE_TTL,
+)
+
+# Fallback redirects for ARKs that don't exist, so crawlers and broken links
+# repeating the same miss don't reach the database. Minting the ARK or one
+# of its prefixes evicts the entry.
+negative_cache = TTLCache(
+    maxsize=settings.ARKLET_RESOLVER_NEGATIVE_CACHE_SIZE,
+    ttl=settings.ARKLET_RESOLVER_NEGATIVE_CACHE_TTL,
+)
+
+shared_stats = {"hits": 0, "misses": 0}
+
+# naan_url is the NAAN's fallback URL. ark and url belong to the ARK itself
+# or to its longest existing prefix, and are None when neither exists.
+Match = namedtuple("Match", ["naan_url", "ark", "url"])
+
+
+def _shared_cache():
+    alias = settings.ARKLET_RESOLVER_SHARED_CACHE
+    return caches[alias] if alias else None
+
+
+def _shared_keys(ark_str: str):
+    # ARKs may contain characters memcached doesn't accept in keys
+    digest = hashlib.sha256(ark_str.encode()).hexdigest()
+    return f"ark:{digest}", f"ark-gen:{digest}"
+
+
+def lookup(ark_str: str):
+    """Return (url, generation) for ark_str.
+
+    url is None on a miss. Pass generation back to remember() once the URL
+    has been read from the database.
+    """
+    url = resolution_cache.get(ark_str)
+    if url:
+        return url, None
+
+    shared = _shared_cache()
+    if shared is None:
+        return None, None
+
+    return _shared_hit(ark_str, shared.get_many(_shared_keys(ark_str)))
+
+
+async def alookup(ark_str: str):
+    """Async variant of lookup()."""
+    url = resolution_cache.get(ark_str)
+    if url:
+        return url, None
+
+    shared = _shared_cache()
+    if shared is None:
+        return None, None
+
+    return _shared_hit(ark_str, await shared.aget_many(_shared_keys(ark_str)))
+
+
+def _shared_hit(ark_str: str, found: dict):
+    entry_key, gen_key = _shared_keys(ark_str)
+    generation = found.get(gen_key, 0)
+    entry = found.get(entry_key)
+    if entry is not None and entry[0] == generation:
+        shared_stats["hits"] += 1
+        resolution_cache.set(ark_str, entry[1])
+        return entry[1], generation
+    shared_stats["misses"] += 1
+    return None, generation
+
+
+def remember(ark_str: str, url: str, generation=None):
+    """Cache the redirect URL read from the database for ark_str."""
+    resolution_cache.set(ark_str, url)
+    shared = _shared_cache()
+    if shared is not None and generation is not None:
+        entry_key, _ = _shared_keys(ark_str)
+        shared.set(entry_key, (generation, url), settings.ARKLET_RESOLVER_SHARED_CACHE_TTL)
+
+
+async def aremember(ark_str: str, url: str, generation=None):
+    """Async variant of remember()."""
+    resolution_cache.set(ark_str, url)
+    shared = _shared_cache()
+    if shared is not None and generation is not None:
+        entry_key, _ = _shared_keys(ark_str)
+        await shared.aset(entry_key, (generation, url), settings.ARKLET_RESOLVER_SHARED_CACHE_TTL)
+
+
+def evict_local(ark_strs):
+    """Forget the given ARKs in this worker only. An empty list forgets everything.
+
+    Cached misses for the ARKs, or for ARKs they are a prefix of, are dropped
+    as well, and the resolver snapshot stops answering for them.
+    """
+    snapshot.mark_changed(ark_strs)
+    if not ark_strs:
+        resolution_cache.clear()
+        negative_cache.clear()
+        return
+    for ark_str in ark_strs:
+        resolution_cache.pop(ark_str)
+    if len(negative_cache):
+        changed = set(ark_strs)
+        prefixes = tuple(f"{ark_str}/" for ark_str in changed)
+        negative_cache.evict_keys(lambda key: key in changed or key.startswith(prefixes))
+
+
+def invalidate(*ark_strs):
+    """Forget the cached redirects for the given ARKs in every worker."""
+    if not ark_strs:
+        return
+    evict_local(ark_strs)
+    bus.publish("ark", *ark_strs)
+    # A resolver reading the row before the commit would otherwise cache the
+    # old URL again, under the already bumped generation
+    transaction.on_commit(lambda: _evict_committed(ark_strs))
+
+
+def _evict_committed(ark_strs):
+    evict_local(ark_strs)
+    shared = _shared_cache()
+    if shared is None:
+        return
+    keys = [_shared_keys(ark_str) for ark_str in ark_strs]
+    shared.delete_many([entry_key for entry_key, _ in keys])
+    for _, gen_key in keys:
+        try:
+            shared.incr(gen_key)
+        except ValueError:
+            if not shared.add(gen_key, 1, timeout=None):
+                shared.incr(gen_key)
+
+
+def cached_miss(ark_str: str):
+    """Return the fallback URL if ark_str recently resolved to nothing, else None."""
+    return negative_cache.get(ark_str)
+
+
+def remember_miss(ark_str: str, fallback_url: str):
+    negative_cache.set(ark_str, fallback_url)
+
+
+def forget_misses(_=None):
+    """Drop every cached miss, e.g. because a NAAN fallback URL changed."""
+    negative_cache.clear()
+
+
+def minted(*ark_strs):
+    """Tell every worker that new ARKs exist, so cached misses for them are dropped."""
+    if not ark_strs:
+        return
+    bloom.add(*ark_strs)
+    evict_local(ark_strs)
+    bus.publish("ark", *ark_strs)
+
+
+def cache_stats() -> dict:
+    stats = {
+        "local": resolution_cache.stats(),
+        "negative": negative_cache.stats(),
+    }
+    if settings.ARKLET_RESOLVER_SHARED_CACHE:
+        stats["shared"] = dict(shared_stats)
+    if settings.ARKLET_BLOOM_FILTER:
+        stats["bloom"] = bloom.stats()
+    if settings.ARKLET_RESOLVER_SNAPSHOT:
+        stats["snapshot"] = snapshot.stats()
+    return stats
+
+
+def best_match(naan: int, identifier: str):
+    """Find the ARK, or its longest existing prefix, in at most one query.
+
+    Returns None if the NAAN isn't hosted here. Only the columns needed to
+    build a redirect are read; the NAAN fallback URL comes from the registry.
+    With ARKLET_RESOLVER_SNAPSHOT, ARKs unchanged since the snapshot was
+    written need no query, and the snapshot answers on its own while the
+    database is unavailable.
+    """
+    match, trusted = _snapshot_match(naan, identifier)
+    if trusted:
+        return match
+    try:
+        return _db_best_match(naan, identifier)
+    except DatabaseError:
+        if match is None:
+            raise
+        logger.warning("Database unavailable, resolving %s/%s from the snapshot", naan, identifier)
+        return match
+
+
+async def abest_match(naan: int, identifier: str):
+    """Async variant of best_match()."""
+    match, trusted = _snapshot_match(naan, identifier)
+    if trusted:
+        return match
+    try:
+        return await _adb_best_match(naan, identifier)
+    except DatabaseError:
+        if match is None:
+            raise
+        logger.warning("Database unavailable, resolving %s/%s from the snapshot", naan, identifier)
+        return match
+
+
+def _snapshot_match(naan: int, identifier: str):
+    """Return the snapshot's Match, or None, and whether it can be used without a query."""
+    state = snapshot.current()
+    if state is None:
+        return None, False
+    snap, changed = state
+    found = snap.best_match(naan, identifier)
+    if found is None:
+        return None, False
+    # A miss may have been minted since the snapshot was written
+    trusted = found[1] is not None and not snapshot.changed_since(changed, naan, identifier)
+    return Match(*found), trusted
+
+
+def _db_best_match(naan: int, identifier: str):
+    # Matches end up in the caches, which a lagging replica would fill with
+    # URLs invalidate() already dropped, so read them from the primary
+    with primary_reads():
+        naan_obj = registry.get_naan(naan)
+        if naan_obj is None:
+            return None
+        if bloom.definitely_absent(naan, identifier):
+            return Match(naan_obj.url, None, None)
+        row = _best_match_query(naan, identifier).first()
+    return Match(naan_obj.url, *(row or (None, None)))
+
+
+async def _adb_best_match(naan: int, identifier: str):
+    with primary_reads():
+        naan_obj = await registry.aget_naan(naan)
+        if naan_obj is None:
+            return None
+        if bloom.definitely_absent(naan, identifier):
+            return Match(naan_obj.url, None, None)
+        row = await _best_match_query(naan, identifier).afirst()
+    return Match(naan_obj.url, *(row or (None, None)))
+
+
+def _best_match_query(naan: int, identifier: str):
+    ark_str = f"{naan}/{identifier}"
+    candidates = [ark_str] + [f"{naan}/{p}" for p in gen_prefixes(identifier)]
+    return (
+        Ark.objects.filter(ark__in=candidates)
+        .order_by(Length("ark").desc())
+        .values_list("ark", "url")
+    )
+
+
+def ark_changed(sender, instance, created=False, **kwargs):
+    if created:
+        bloom.add(instance.ark)
+    invalidate(instance.ark)
@@ -0,0 +1,92 @@
+"""Database routing for an optional Postgres read replica.
+
+When ARKLET_POSTGRES_REPLICA_HOST is set, settings add a "replica" database
+and install ReplicaRouter. Queries only go to the replica inside
+replica_reads(), which the resolver views, batch_query_arks and the
+read-only management commands use (except for primary_reads(), below); everything else, including minting and
+updates, stays on the primary.
+
+Writing through the ORM inside replica_reads() sends the rest of its reads
+to the primary too, so a request always sees its own writes. Reads from the
+replica may lag behind the primary.
+
+Reads whose results are cached go to the primary even inside
+replica_reads(), through primary_reads(). The resolver's caches are only
+kept coherent by invalidate() bumping a generation after each commit, and a
+lagging replica read just after that would cache the old URL (or a fresh
+mint as a miss) for the full cache TTL. So the replica serves ?info/?json
+pages and bulk queries, while redirects are answered from the caches and
+their misses from the primary.
+"""
+
+import asyncio
+import contextvars
+import functools
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# True while reads may go to the replica. A ContextVar rather than a
+# thread-local so that async views and the threads the async ORM runs
+# queries in see the same value.
+_replica_reads = contextvars.ContextVar("arklet_replica_reads", default=False)
+
+
+@contextmanager
+def replica_reads():
+    """Send ORM reads in this block to the replica, until something is written."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Send ORM reads in this block to the primary, even inside replica_reads()."""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def read_from_replica(view):
+    """Run a sync or async view inside replica_reads()."""
+    if asyncio.iscoroutinefunction(view):
+
+        @functools.wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            with replica_reads():
+                return await view(*args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return view(*args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    """Route reads inside replica_reads() to ARKLET_REPLICA_DATABASE."""
+
+    def db_for_read(self, model, **hints):
+        if settings.ARKLET_REPLICA_DATABASE and _replica_reads.get():
+            return settings.ARKLET_REPLICA_DATABASE
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        if _replica_reads.get():
+            _replica_reads.set(False)
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
@@ -0,0 +1,361 @@
+"""Memory-mapped snapshot of every ARK's redirect URL.
+
+Resolver nodes configured with ARKLET_RESOLVER_SNAPSHOT answer from a file
+written by the export_resolver_snapshot management command instead of
+querying Postgres, and keep answering from it while Postgres is slow or
+down. The file is mapped read-only, so every worker on a host shares the
+same pages of the OS page cache instead of holding its own copy.
+
+Layout, all integers little-endian:
+
+* a header (HEADER) with the time the export started and the offsets of
+  the tables below,
+* one NAAN entry (naan, url offset, url length) per NAAN, sorted by NAAN,
+* one ARK entry (offset, ark length, url length) per ARK, sorted by the
+  UTF-8 bytes of the ARK, so lookups are a binary search,
+* the heap, holding each ARK string directly followed by its URL, and the
+  NAAN URLs. Offsets are relative to the start of the heap.
+
+ARKs minted, changed or deleted after the snapshot was written must still
+come from the database. Each worker refreshes the set of ARKs modified or
+deleted (see DeletedArk) since then every ARKLET_RESOLVER_SNAPSHOT_REFRESH
+seconds, and adds the ARKs that its own writes and the invalidation bus
+report in between. Until that set is first loaded, every lookup is checked
+against the database.
+
+Deletions are only seen if they go through the ORM, which records them in
+DeletedArk; raw SQL deletes are not. export_resolver_snapshot forgets the
+records a few days after each export, so a host still serving a snapshot
+older than that keeps answering for deleted ARKs until it gets a new file.
+"""
+
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models.functions import Collate
+from django.utils import timezone
+
+from ark.models import Ark, DeletedArk, Naan
+from ark.utils import gen_prefixes, keyset_chunks
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"ARKSNAP\x00"
+VERSION = 1
+# magic, version, export start (epoch seconds), NAAN count, ARK count,
+# ARK table offset, heap offset. The NAAN table follows the header.
+HEADER = struct.Struct("<8sIdQQQQ")
+NAAN_ENTRY = struct.Struct("<QQI")
+ARK_ENTRY = struct.Struct("<QHH")
+
+# Collations that order strings by their UTF-8 bytes
+BYTE_ORDER_COLLATIONS = {"postgresql": "C", "sqlite": "BINARY"}
+
+
+class Snapshot:
+    """A read-only view of a snapshot file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        if len(self._mm) < HEADER.size:
+            raise ValueError(f"{path} is too short to be an ARK snapshot")
+        magic, version, created, n_naans, n_arks, ark_table, heap = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} ARK snapshot")
+        if ark_table + n_arks * ARK_ENTRY.size != heap or heap > len(self._mm):
+            raise ValueError(f"{path} is truncated")
+        self.created = datetime.fromtimestamp(created, tz=dt_timezone.utc)
+        self.size = n_arks
+        self._ark_table = ark_table
+        self._heap = heap
+        # NAANs are few, so decode their URLs once
+        self.naans = {}
+        for i in range(n_naans):
+            naan, offset, length = NAAN_ENTRY.unpack_from(self._mm, HEADER.size + i * NAAN_ENTRY.size)
+            self.naans[naan] = str(self._view[heap + offset:heap + offset + length], "utf-8")
+
+    def get(self, ark_str: str):
+        """Return the URL of ark_str, "" if it is unbound, or None if it isn't in the snapshot.
+
+        Keys are compared in place in the mapped file rather than sliced out
+        of it. Every key between the current bounds shares the target's
+        common prefix with both bounds, so each probe starts comparing
+        after it.
+        """
+        target = ark_str.encode()
+        n = len(target)
+        view = self._view
+        unpack_entry = ARK_ENTRY.unpack_from
+        table, heap = self._ark_table, self._heap
+        lo, hi = 0, self.size
+        lo_prefix = hi_prefix = 0
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, ark_len, url_len = unpack_entry(view, table + mid * ARK_ENTRY.size)
+            start = heap + offset
+            i = lo_prefix if lo_prefix < hi_prefix else hi_prefix
+            end = ark_len if ark_len < n else n
+            while i < end and view[start + i] == target[i]:
+                i += 1
+            if i < end:
+                below = view[start + i] < target[i]
+            elif ark_len == n:
+                return str(view[start + n:start + n + url_len], "utf-8")
+            else:
+                below = ark_len < n
+            if below:
+                lo, lo_prefix = mid + 1, i
+            else:
+                hi, hi_prefix = mid, i
+        return None
+
+    def best_match(self, naan: int, identifier: str):
+        """Return (naan_url, ark, url) like resolver.best_match, or None for unknown NAANs."""
+        naan_url = self.naans.get(naan)
+        if naan_url is None:
+            return None
+        for ark_str in candidates(naan, identifier):
+            url = self.get(ark_str)
+            if url is not None:
+                return naan_url, ark_str, url
+        return naan_url, None, None
+
+
+def candidates(naan: int, identifier: str):
+    """The ARK and its prefixes, longest first."""
+    yield f"{naan}/{identifier}"
+    for prefix in gen_prefixes(identifier):
+        yield f"{naan}/{prefix}"
+
+
+def write(path, chunk_size=10000) -> int:
+    """Write a snapshot of every NAAN and ARK to path, atomically. Returns the ARK count."""
+    started = timezone.now()
+    directory = os.path.dirname(os.path.abspath(path))
+    arks = Ark.objects.values_list("ark", "url")
+    collation = BYTE_ORDER_COLLATIONS.get(connection.vendor)
+    if collation is not None:
+        # Each chunk is an index scan on Postgres thanks to the
+        # ark_ark_byte_order index
+        arks = Ark.objects.annotate(key=Collate("ark", collation)).values_list("key", "url")
+
+    with tempfile.TemporaryFile(dir=directory) as table, tempfile.TemporaryFile(dir=directory) as heap:
+        heap_size = 0
+        naans = []
+        for naan, url in Naan.objects.order_by("naan").values_list("naan", "url"):
+            data = url.encode()
+            naans.append(NAAN_ENTRY.pack(naan, heap_size, len(data)))
+            heap.write(data)
+            heap_size += len(data)
+
+        count, last = 0, None
+        for chunk in keyset_chunks(arks, "key" if collation else "ark", chunk_size):
+            for ark_str, url in chunk:
+                key, data = ark_str.encode(), url.encode()
+                if last is not None and key <= last:
+                    raise ValueError(f"ARKs are not in byte order on {connection.vendor}")
+                table.write(ARK_ENTRY.pack(heap_size, len(key), len(data)))
+                heap.write(key)
+                heap.write(data)
+                heap_size += len(key) + len(data)
+                count, last = count + 1, key
+
+        ark_table = HEADER.size + NAAN_ENTRY.size * len(naans)
+        header = HEADER.pack(
+            MAGIC, VERSION, started.timestamp(), len(naans), count,
+            ark_table, ark_table + ARK_ENTRY.size * count,
+        )
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".snapshot")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.writelines(naans)
+                for part in (table, heap):
+                    part.seek(0)
+                    shutil.copyfileobj(part, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return count
+
+
+_lock = threading.Lock()
+# (Snapshot, file identity, ARKs changed since it was written or None if unknown)
+_state = None
+# ARKs this worker heard about since the changed set was last loaded
+_recent = set()
+_refresher = None
+# When opening the snapshot last failed (time.monotonic()), or None
+_failed_at = None
+
+
+def _identity(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def current():
+    """Return (snapshot, changed ARKs) or None if no snapshot is configured."""
+    path = settings.ARKLET_RESOLVER_SNAPSHOT
+    if not path:
+        return None
+    state = _state
+    if state is None:
+        state = _open(path)
+        if state is None:
+            return None
+    return state[0], state[2]
+
+
+def _open(path):
+    """Open the snapshot, or return None and let the resolver use the database.
+
+    A missing or broken file (before the first export, or after a bad
+    deploy) is logged once and tried again every
+    ARKLET_RESOLVER_SNAPSHOT_REFRESH seconds.
+    """
+    global _state, _failed_at  # pylint: disable=global-statement
+    failed_at = _failed_at
+    if failed_at is not None and time.monotonic() - failed_at < settings.ARKLET_RESOLVER_SNAPSHOT_REFRESH:
+        return None
+    with _lock:
+        if _state is None:
+            try:
+                _state = (Snapshot(path), _identity(path), None)
+            except (OSError, ValueError) as e:
+                if _failed_at is None:
+                    logger.warning("Couldn't open the resolver snapshot, resolving from the database: %s", e)
+                _failed_at = time.monotonic()
+                return None
+            if _failed_at is not None:
+                logger.info("Opened the resolver snapshot %s", path)
+                _failed_at = None
+        return _state
+
+
+def changed_since(changed, naan: int, identifier: str) -> bool:
+    """True if the ARK or one of its prefixes may differ from the snapshot."""
+    if changed is None:
+        return True
+    if not changed and not _recent:
+        return False
+    return any(c in changed or c in _recent for c in candidates(naan, identifier))
+
+
+def mark_changed(ark_strs):
+    """Record ARKs written after the snapshot. An empty list means any may have changed."""
+    global _state  # pylint: disable=global-statement
+    if not settings.ARKLET_RESOLVER_SNAPSHOT:
+        return
+    with _lock:
+        if not ark_strs:
+            if _state is not None:
+                _state = (_state[0], _state[1], None)
+            return
+        _recent.update(ark_strs)
+
+
+def refresh():
+    """Reopen the snapshot if the file was replaced and reload the changed ARKs."""
+    global _state, _recent  # pylint: disable=global-statement
+    path = settings.ARKLET_RESOLVER_SNAPSHOT
+    state = current()
+    if state is None:
+        return
+    snapshot = state[0]
+    identity = _identity(path)
+    if identity != _state[1]:
+        snapshot = Snapshot(path)
+    with _lock:
+        pending, _recent = _recent, set()
+    try:
+        changed = set()
+        modified = Ark.objects.filter(modified__gte=snapshot.created).values_list("ark", flat=True)
+        deleted = DeletedArk.objects.filter(deleted__gte=snapshot.created).values_list("ark", flat=True)
+        for queryset in (modified, deleted):
+            for chunk in keyset_chunks(queryset, "ark"):
+                changed.update(chunk)
+    except DatabaseError:
+        logger.warning("Couldn't load ARKs changed since the resolver snapshot", exc_info=True)
+        # Still trust what we knew about the same file
+        changed = _state[2] if identity == _state[1] else None
+        with _lock:
+            _recent |= pending
+    else:
+        changed |= pending
+    with _lock:
+        _state = (snapshot, identity, changed)
+
+
+def ark_deleted(sender, instance, **kwargs):
+    """Record a deleted ARK, for workers whose snapshot still has it."""
+    DeletedArk.objects.bulk_create(
+        [DeletedArk(ark=instance.ark)], update_conflicts=True, unique_fields=["ark"], update_fields=["deleted"]
+    )
+
+
+def forget_deleted(before) -> int:
+    """Drop the records of ARKs deleted before the given time. Returns how many were dropped."""
+    return DeletedArk.objects.filter(deleted__lt=before).delete()[0]
+
+
+def _refresh_loop(interval):
+    while True:
+        try:
+            refresh()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Couldn't refresh the resolver snapshot")
+        finally:
+            connection.close()
+        time.sleep(interval)
+
+
+def start_loading():
+    """Open the snapshot and keep it fresh in the background. Call once per process."""
+    global _refresher  # pylint: disable=global-statement
+    if not settings.ARKLET_RESOLVER_SNAPSHOT or _refresher is not None:
+        return
+    _refresher = threading.Thread(
+        target=_refresh_loop,
+        args=(settings.ARKLET_RESOLVER_SNAPSHOT_REFRESH,),
+        name="arklet-snapshot",
+        daemon=True,
+    )
+    _refresher.start()
+
+
+def stats() -> dict:
+    state = _state
+    if state is None:
+        return {"loaded": False}
+    snapshot, _, changed = state
+    return {
+        "loaded": True,
+        "arks": snapshot.size,
+        "created": snapshot.created.isoformat(),
+        "changed_since": None if changed is None else len(changed),
+    }
+
+
+def reset():
+    """Forget the open snapshot, e.g. after changing ARKLET_RESOLVER_SNAPSHOT."""
+    global _state, _recent, _failed_at  # pylint: disable=global-statement
+    with _lock:
+        _state = None
+        _recent = set()
+        _failed_at = None
@@ -0,0 +1,95 @@
+"""Reading and answering the newline-delimited JSON bulk endpoints.
+
+The stream_* views read their request body one line at a time instead of
+through request.body, optionally gunzipping it (Content-Encoding: gzip), and
+handle the records ARKLET_STREAM_CHUNK_SIZE at a time, each chunk in its own
+transaction. One result line per record goes to a spooled temporary file,
+gzipped if the client accepts it, and is streamed back once the upload is
+read. Spooling instead of answering while the upload is still arriving keeps
+clients that only read the response after sending the whole body (most HTTP
+libraries) from deadlocking, while memory stays bounded by the chunk size.
+"""
+
+import gzip
+import json
+import tempfile
+import zlib
+from itertools import islice
+
+from django.http import FileResponse
+
+CONTENT_TYPE = "application/x-ndjson"
+# Results are kept in memory up to this many bytes, then on disk
+SPOOL_SIZE = 1024 * 1024
+# Raised while reading a truncated or corrupt gzip body
+READ_ERRORS = (OSError, EOFError, zlib.error)
+
+
+def records(request):
+    """Yield (line number, record, error) for each non-blank line of the body."""
+    body = request
+    if request.headers.get("Content-Encoding", "").lower() == "gzip":
+        body = gzip.GzipFile(fileobj=request, mode="rb")
+    for number, line in enumerate(body, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            yield number, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "each line must be a JSON object"
+            continue
+        yield number, record, None
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class ResultWriter:
+    """Collect one JSON result line per record and return them as the response."""
+
+    def __init__(self, request):
+        self._file = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        self._gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+        self._out = gzip.GzipFile(fileobj=self._file, mode="wb") if self._gzip else self._file
+
+    def write(self, line, result: dict):
+        self._out.write(json.dumps({"line": line, **result}).encode() + b"\n")
+
+    def response(self):
+        if self._gzip:
+            # Writes the gzip trailer, leaving the spooled file open
+            self._out.close()
+        self._file.seek(0)
+        response = FileResponse(self._file, content_type=CONTENT_TYPE)
+        if self._gzip:
+            response["Content-Encoding"] = "gzip"
+        response["Vary"] = "Accept-Encoding"
+        return response
+
+
+def run(request, process, chunk_size):
+    """Answer a streaming bulk request.
+
+    process(chunk) is called with lists of (line number, record) pairs and
+    yields (line number, result) pairs. Lines that aren't JSON objects are
+    answered with an error without reaching it. Results are written in line
+    order.
+    """
+    writer = ResultWriter(request)
+    try:
+        for chunk in chunks(records(request), chunk_size):
+            results = [(number, {"error": error}) for number, _, error in chunk if error is not None]
+            results += process([(number, record) for number, record, error in chunk if error is None])
+            for number, result in sorted(results, key=lambda r: r[0]):
+                writer.write(number, result)
+    except READ_ERRORS as e:
+        # A truncated or corrupt gzip body. Earlier chunks are committed, so
+        # report them along with the error.
+        writer.write(None, {"error": f"couldn't read the rest of the request body: {e}"})
+    return writer.response()
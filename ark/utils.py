@@ -1,5 +1,7 @@
-from typing import Tuple
+from operator import mul
+from typing import List, Tuple
 
+import os
 import secrets
 
 BETANUMERIC = "0123456789bcdfghjkmnpqrstvwxz"
@@ -19,10 +21,57 @@ def noid_check_digit(noid: str) -> str:
     return BETANUMERIC[remainder]  # IndexError may be long ARK
 
 
+# Check digit score of each byte: its position in BETANUMERIC, or 0
+_SCORES = [max(BETANUMERIC.find(chr(b)), 0) for b in range(256)]
+
+
+def noid_check_digits(prefix: str, noids: List[str]) -> List[str]:
+    """Return noid_check_digit(prefix + noid) for each of the betanumeric noids.
+
+    The prefix is scored once, and each NOID with a table lookup per
+    character instead of a string search.
+    """
+    base = BETANUMERIC.find(noid_check_digit(prefix))
+    start = len(prefix) + 1
+    digits = []
+    for noid in noids:
+        scores = map(_SCORES.__getitem__, noid.encode())
+        total = base + sum(map(mul, scores, range(start, start + len(noid))))
+        digits.append(BETANUMERIC[total % 29])
+    return digits
+
+
 def generate_noid(length: int) -> str:
     return "".join(secrets.choice(BETANUMERIC) for _ in range(length))
 
 
+# 232 is the largest multiple of 29 that fits in a byte. Bytes below it map
+# onto BETANUMERIC eight times each; the rest are rejected, so every
+# character is equally likely.
+_NOID_ALPHABET = bytes.maketrans(bytes(range(256)), bytes(ord(BETANUMERIC[b % 29]) for b in range(256)))
+_REJECTED_BYTES = bytes(range(232, 256))
+
+
+def generate_noids(count: int, length: int) -> List[str]:
+    """Return count random NOIDs of length characters, drawn from one os.urandom buffer."""
+    needed = count * length
+    chars = b""
+    while len(chars) < needed:
+        # About one byte in eleven is rejected, so ask for a little extra
+        chars += os.urandom((needed - len(chars)) * 9 // 8 + 16).translate(_NOID_ALPHABET, _REJECTED_BYTES)
+    text = chars[:needed].decode("ascii")
+    return [text[i:i + length] for i in range(0, needed, length)]
+
+
+def betanumeric(value: int, length: int) -> str:
+    """Encode a non-negative counter value as a NOID of at least ``length`` characters."""
+    digits = []
+    while value:
+        value, digit = divmod(value, len(BETANUMERIC))
+        digits.append(BETANUMERIC[digit])
+    return "".join(reversed(digits)).rjust(length, BETANUMERIC[0])
+
+
 def parse_ark(ark: str) -> Tuple[str, int, str]:
     parts = ark.split("ark:")
     if len(parts) != 2:
@@ -51,3 +100,22 @@ def gen_prefixes(ark: str):
     parts = ark.split('/')
     for i in range(1, len(parts)):
         yield '/'.join(parts[:-i])
+
+
+def keyset_chunks(queryset, key: str, chunk_size: int = 10000):
+    """Yield lists of ``queryset`` rows ordered by the unique column ``key``.
+
+    Each chunk is its own query that starts after the last key seen, so memory
+    stays bounded even when server-side cursors are disabled (as they are for
+    pgbouncer). ``queryset`` must be a values_list() queryset whose rows are
+    either ``key`` alone (flat=True) or tuples starting with ``key``.
+    """
+    queryset = queryset.order_by(key)
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(**{f"{key}__gt": last})
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0] if isinstance(rows[-1], tuple) else rows[-1]
@@ -1,10 +1,11 @@
+import hashlib
 import json
 import logging
 import os
+from functools import partial
 
-from django.core.exceptions import ValidationError
-from django.db import IntegrityError
-from django.db.models.functions import Length
+from django.conf import settings
+from django.db import transaction
 from django.http import (
     Http404,
     HttpRequest,
@@ -15,34 +16,37 @@ from django.http import (
     HttpResponseServerError,
     JsonResponse,
 )
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.shortcuts import render
+from django.urls import reverse
 
+from ark import coalescer, idempotency, registry, streaming
+from ark.auth import authorize
 from ark.forms import MintArkForm, UpdateArkForm
-from ark.models import Ark, Naan, Key, Shoulder
-from ark.utils import parse_ark, gen_prefixes, parse_ark_lookup
+from ark.models import Ark, Job
+from ark.resolver import (
+    abest_match,
+    alookup,
+    aremember,
+    best_match,
+    cache_stats,
+    cached_miss,
+    invalidate,
+    lookup,
+    minted,
+    remember,
+    remember_miss,
+)
+from ark.routers import read_from_replica
+from ark.utils import parse_ark, parse_ark_lookup
 
 COLLISIONS = 10
 
 logger = logging.getLogger(__name__)
 
-def authorize(request, naan):
-    bearer_token = request.headers.get("Authorization")
-    if not bearer_token:
-        return None
-
-    key = bearer_token.split()[-1]
-
-    try:
-        keys = Key.objects.filter(naan=naan,active=True)
-        for k in keys:
-            if k.check_password(key):
-                return k.naan
-        return None
-    except ValidationError as e:  # probably an invalid key
-        return None
-    
-
 @csrf_exempt
 def mint_ark(request):
     if request.method != "POST":
@@ -66,29 +70,30 @@ def mint_ark(request):
         return HttpResponseForbidden()
 
     shoulder = mint_request.cleaned_data.pop("shoulder")
-    shoulder_obj = Shoulder.objects.filter(shoulder=shoulder).first()
+    shoulder_obj = registry.get_shoulder(authorized_naan.naan, shoulder)
     if shoulder_obj is None:
         return HttpResponseBadRequest(f"Shoulder {shoulder} does not exist")
 
-    ark, collisions = None, 0
-    for _ in range(10):
-        try:
-            ark = Ark.create(authorized_naan, shoulder_obj)
-            ark.set_fields(mint_request.cleaned_data)
-            ark.save()
-            break
-        except IntegrityError:
-            collisions += 1
-            continue
+    rows = [(shoulder_obj, mint_request.cleaned_data)]
+    key = idempotency.request_key(request)
+    if key is not None:
+        # Not coalesced: the ARK must be minted in the transaction that
+        # records the key, and coalesced batches commit on another thread
+        return idempotency.once(
+            request, authorized_naan, key, lambda: _mint_records(authorized_naan, rows, single=True)
+        )
 
-    if not ark:
-        msg = f"Gave up creating ark after {collisions} collision(s)"
-        logger.error(msg)
-        return HttpResponseServerError(msg)
-    if ark and collisions > 0:
-        logger.warning("Ark created after %d collision(s)", collisions)
+    if settings.ARKLET_MINT_COALESCE_WINDOW:
+        ark = coalescer.mint(authorized_naan, shoulder_obj, mint_request.cleaned_data, COLLISIONS)
+        if ark is None:
+            msg = f"Gave up creating ark after {COLLISIONS} collision(s)"
+            logger.error(msg)
+            return HttpResponseServerError(msg)
+        # Coalesced mints don't send post_save, so drop cached misses here
+        minted(ark.ark)
+        return JsonResponse({"ark": str(ark)})
 
-    return JsonResponse({"ark": str(ark)})
+    return _mint_records(authorized_naan, rows, single=True)
 
 
 @csrf_exempt
@@ -128,6 +133,7 @@ def update_ark(request):
     return JsonResponse(ark_to_json(ark_obj, metadata=False))
 
 
+@read_from_replica
 def resolve_ark(request, ark: str):
     info_inflection = 'info' in request.GET
     json_inflection = 'json' in request.GET
@@ -138,40 +144,140 @@ def resolve_ark(request, ark: str):
         return HttpResponseBadRequest(e)
 
     ark_str = f"{naan}/{identifier}"
-    ark_obj = Ark.objects.filter(ark=ark_str).first()
-    if ark_obj:
-        if info_inflection:
-            return view_ark(request, ark_obj)
-        if json_inflection:
+    response = _cached_miss_response(ark_str, info_inflection or json_inflection)
+    if response is not None:
+        return response
+
+    generation = None
+    if info_inflection or json_inflection:
+        ark_obj = Ark.objects.filter(ark=ark_str).first()
+        if ark_obj:
+            if info_inflection:
+                return view_ark(request, ark_obj)
             return json_ark(request, ark_obj)
-        if not ark_obj.url:
-            return view_ark(request, ark_obj)
-        return HttpResponseRedirect(ark_obj.url + '?' + request.META['QUERY_STRING'])
     else:
-        # Ark not found. Try to find an ark that is a prefix.
-        prefixes = [f"{naan}/{a}" for a in gen_prefixes(identifier)]
-        # Get the one with the longest prefix
-        ark_prefix = Ark.objects.filter(ark__in=prefixes).order_by(Length('ark')).first()
-        if ark_prefix:
-            suffix = ark_str.removeprefix(ark_prefix.ark)
-            return HttpResponseRedirect(ark_prefix.url + suffix)
-        else:
-            if info_inflection or json_inflection:
-                raise Http404
-            try:
-                naan_obj = Naan.objects.get(naan=naan)
-                return HttpResponseRedirect(
-                    f"{naan_obj.url}/ark:/{ark_str}"
-                )
-            except Naan.DoesNotExist:
-                resolver = "https://n2t.net"
-                # TODO: more robust resolver URL creation
-                return HttpResponseRedirect(f"{resolver}/ark:/{ark_str}")
+        url, generation = lookup(ark_str)
+        if url:
+            return _redirect(url + '?' + request.META['QUERY_STRING'])
+
+    match = best_match(naan, identifier)
+    if match is not None and match.ark == ark_str and match.url:
+        remember(ark_str, match.url, generation)
+    response = _match_response(request, ark_str, match, info_inflection or json_inflection)
+    if response is None:
+        return view_ark(request, Ark.objects.get(ark=ark_str))
+    return response
+
+
+@read_from_replica
+async def aresolve_ark(request, ark: str):
+    """Async variant of resolve_ark, routed to when arklet runs under ASGI.
+
+    Cached redirects are answered without leaving the event loop, and the
+    database is only reached through the async ORM, so a worker can wait on
+    many lookups at once.
+    """
+    info_inflection = 'info' in request.GET
+    json_inflection = 'json' in request.GET
+
+    try:
+        _, naan, identifier = parse_ark(ark)
+    except ValueError as e:
+        return HttpResponseBadRequest(e)
+
+    ark_str = f"{naan}/{identifier}"
+    response = _cached_miss_response(ark_str, info_inflection or json_inflection)
+    if response is not None:
+        return response
+
+    generation = None
+    if info_inflection or json_inflection:
+        ark_obj = await Ark.objects.filter(ark=ark_str).afirst()
+        if ark_obj:
+            if info_inflection:
+                return view_ark(request, ark_obj)
+            return json_ark(request, ark_obj)
+    else:
+        url, generation = await alookup(ark_str)
+        if url:
+            return _redirect(url + '?' + request.META['QUERY_STRING'])
+
+    match = await abest_match(naan, identifier)
+    if match is not None and match.ark == ark_str and match.url:
+        await aremember(ark_str, match.url, generation)
+    response = _match_response(request, ark_str, match, info_inflection or json_inflection)
+    if response is None:
+        return view_ark(request, await Ark.objects.aget(ark=ark_str))
+    return response
+
+
+def _redirect(url: str, miss=False):
+    """Redirect to url, letting caches keep it for ARKLET_REDIRECT_MAX_AGE seconds.
+
+    Fallbacks for unknown ARKs are kept no longer than cached misses.
+    """
+    response = HttpResponseRedirect(url)
+    max_age = settings.ARKLET_REDIRECT_MAX_AGE
+    if miss:
+        max_age = min(max_age, settings.ARKLET_RESOLVER_NEGATIVE_CACHE_TTL)
+    if max_age > 0:
+        patch_cache_control(response, max_age=max_age)
+    return response
+
+
+def _cached_miss_response(ark_str: str, inflected: bool):
+    fallback_url = cached_miss(ark_str)
+    if fallback_url is None:
+        return None
+    if inflected:
+        raise Http404
+    return _redirect(fallback_url, miss=True)
+
+
+def _match_response(request, ark_str: str, match, inflected: bool):
+    """Build the response for the result of best_match.
+
+    Returns None when the ARK exists but has no URL, so its page should be
+    rendered instead.
+    """
+    if match is not None and match.ark == ark_str:
+        if not match.url:
+            return None
+        return _redirect(match.url + '?' + request.META['QUERY_STRING'])
+    if match is not None and match.ark:
+        # Ark not found, but an ark that is a prefix of it is
+        suffix = ark_str[len(match.ark):]
+        return _redirect(match.url + suffix)
+    if match is not None:
+        fallback_url = f"{match.naan_url}/ark:/{ark_str}"
+    else:
+        resolver = "https://n2t.net"
+        # TODO: more robust resolver URL creation
+        fallback_url = f"{resolver}/ark:/{ark_str}"
+    remember_miss(ark_str, fallback_url)
+    if inflected:
+        raise Http404
+    return _redirect(fallback_url, miss=True)
+
+
+def _etag(representation: str):
+    """Strong ETag over the fields of the ARK shown in a representation."""
+
+    def etag(request, ark: Ark):
+        fields = json.dumps(ark_to_json(ark, metadata=False), sort_keys=True)
+        return hashlib.sha256(f"{representation}:{fields}".encode()).hexdigest()
+
+    return etag
+
+
+def _last_modified(request, ark: Ark):
+    return ark.modified
 
 
 """
 Return HTML human readable webpage information about the Ark object
 """
+@condition(etag_func=_etag("info"), last_modified_func=_last_modified)
 def view_ark(request: HttpRequest, ark: Ark):
 
     context = {
@@ -213,12 +319,14 @@ def ark_to_json(ark: Ark, metadata=True):
         obj[key]['value'] = data[key]
     return obj
 
+@condition(etag_func=_etag("json"), last_modified_func=_last_modified)
 def json_ark(request: HttpRequest, ark: Ark):
     obj = ark_to_json(ark)
     # Return the JSON response
     return JsonResponse(obj)
 
 @csrf_exempt
+@read_from_replica
 def batch_query_arks(request):
     try:
         data = json.loads(request.body.decode("utf-8"))
@@ -257,21 +365,39 @@ def batch_update_arks(request):
         return HttpResponseForbidden()
 
     
-    arks = [parse_ark_lookup(d.get('ark')) for d in data]
-    ark_objs = Ark.objects.filter(ark__in=arks)
-    
+    ark_objs = _update_records({parse_ark_lookup(d['ark']): d for d in data})
+    return JsonResponse({
+        'num_received': len(data),
+        'num_updated': len(ark_objs)
+    })
+
+
+def _update_records(records: dict) -> list:
+    """Apply each record to the ARK it is keyed by, in one transaction.
+
+    Returns the ARKs that exist and were updated.
+    """
+    ark_objs = list(Ark.objects.filter(ark__in=records))
     # track the fields we have seen so far for efficient updating
     seen_fields = set()
-    for ark_obj, new_record in zip(ark_objs, data):
+    for ark_obj in ark_objs:
+        # Match by identifier; the query doesn't return rows in request order
+        new_record = records[ark_obj.ark]
         ark_obj.set_fields(new_record)
         seen_fields.update(new_record.keys())
-    # don't update primary key
-    seen_fields.remove('ark')
-    n_updated = Ark.objects.bulk_update(ark_objs, fields=seen_fields)
-    return JsonResponse({
-        'num_received': len(data),
-        'num_updated': n_updated
-    })
+    # only fields set_fields applies, and never the primary key
+    seen_fields &= set(UpdateArkForm.base_fields) - {'ark'}
+    # bulk_update doesn't set auto_now fields
+    now = timezone.now()
+    for ark_obj in ark_objs:
+        ark_obj.modified = now
+    seen_fields.add('modified')
+    with transaction.atomic():
+        Ark.objects.bulk_update(ark_objs, fields=seen_fields)
+    # bulk_update doesn't send post_save, so drop cached redirects here
+    invalidate(*(ark_obj.ark for ark_obj in ark_objs))
+    return ark_objs
+
 
 @csrf_exempt
 def batch_mint_arks(request):
@@ -296,38 +422,259 @@ def batch_mint_arks(request):
         shoulders.add(d['shoulder'])
     shoulder_objs = dict()
     for s in shoulders:
-        shoulder_obj = Shoulder.objects.filter(shoulder=s).first()
+        shoulder_obj = registry.get_shoulder(authorized_naan.naan, s)
         if shoulder_obj is None:
             return HttpResponseBadRequest(f"shoulder {s} does not exist")
         shoulder_objs[s] = shoulder_obj
 
-    created = None
-    for _ in range(COLLISIONS):
-        # Attempt to mint the batch with max COLLISION retries times
-        try:
-            new_arks = []
-            for record in records:
-                shoulder = shoulder_objs[record['shoulder']]
-                new_ark = Ark.create(authorized_naan, shoulder)
-                new_ark.set_fields(record)
-                new_arks.append(new_ark)
-            created = Ark.objects.bulk_create(new_arks)
-        except IntegrityError:
-            continue
-        break
-    else:
-        msg = f"Gave up creating bulk arks after {COLLISIONS} collision(s)"
-        logger.error(msg)
-        return HttpResponseServerError(msg)
+    rows = [(shoulder_objs[r['shoulder']], r) for r in records]
+    key = idempotency.request_key(request)
+    if key is not None:
+        return idempotency.once(request, authorized_naan, key, lambda: _mint_records(authorized_naan, rows))
+    return _mint_records(authorized_naan, rows)
+
+
+def _mint_records(naan, rows, single=False):
+    """Mint an ARK for each (shoulder, fields) row in one transaction.
+
+    Responds like batch_mint_arks, or like mint_ark when single is set.
+    """
+    with transaction.atomic():
+        created = Ark.mint_batch([(naan, shoulder, fields) for shoulder, fields in rows], COLLISIONS)
+        if any(c is None for c in created):
+            transaction.set_rollback(True)
+            msg = f"Gave up creating {'ark' if single else 'bulk arks'} after {COLLISIONS} collision(s)"
+            logger.error(msg)
+            return HttpResponseServerError(msg)
+    # mint_batch doesn't send post_save, so drop cached misses here
+    minted(*(c.ark for c in created))
+    if single:
+        return JsonResponse({"ark": str(created[0])})
     return JsonResponse({
-        'num_received': len(records),
+        'num_received': len(rows),
         'arks_created': [ark_to_json(c, metadata=False) for c in created]
     })
 
+def _stream_naan(request):
+    """The NAAN a streaming update or mint is for, or an error response."""
+    try:
+        naan = int(request.GET.get('naan', ''))
+    except ValueError:
+        return None, HttpResponseBadRequest("The naan query parameter is required")
+    authorized_naan = authorize(request, naan)
+    if authorized_naan is None:
+        return None, HttpResponseForbidden()
+    return authorized_naan, None
+
+
+def _lookup_keys(chunk):
+    """Split (line, record) pairs into ARK lookup keys and per-line errors."""
+    keys, errors = [], []
+    for number, record in chunk:
+        try:
+            keys.append((number, parse_ark_lookup(record['ark'])))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            errors.append((number, {"error": "each record needs a valid 'ark'"}))
+    return keys, errors
+
+
+@csrf_exempt
+@read_from_replica
+def stream_query_arks(request):
+    """Look up the ARKs in a newline-delimited JSON body of {"ark": ...} records."""
+    if request.method != "POST":
+        return HttpResponseNotAllowed(permitted_methods=["POST"])
+
+    def process(chunk):
+        keys, results = _lookup_keys(chunk)
+        found = Ark.objects.in_bulk([key for _, key in keys])
+        for number, key in keys:
+            ark = found.get(key)
+            results.append((number, ark_to_json(ark, metadata=False) if ark else {"ark": key, "error": "not found"}))
+        return results
+
+    return streaming.run(request, process, settings.ARKLET_STREAM_CHUNK_SIZE)
+
+
+def update_chunk(naan, chunk) -> list:
+    """Apply (line, record) pairs to the ARKs they name, which must be on naan.
+
+    Returns (line, result) pairs. Shared by stream_update_arks and update jobs.
+    """
+    by_line = dict(chunk)
+    keys, results = _lookup_keys(chunk)
+    records, lines = {}, []
+    for number, key in keys:
+        if key.startswith(f"{naan.naan}/"):
+            # A later record for the same ARK wins
+            records[key] = by_line[number]
+            lines.append((number, key))
+        else:
+            results.append((number, {"ark": key, "error": "ARK is not on the authorized NAAN"}))
+    updated = {ark_obj.ark for ark_obj in _update_records(records)}
+    for number, key in lines:
+        results.append((number, {"ark": key, "updated": True} if key in updated else {"ark": key, "error": "not found"}))
+    return results
+
+
+def mint_chunk(naan, chunk) -> list:
+    """Mint an ARK on naan for each (line, record) pair.
+
+    Returns (line, result) pairs. Shared by stream_mint_arks and mint jobs.
+    """
+    results, rows, lines = [], [], []
+    for number, record in chunk:
+        shoulder = record.get('shoulder')
+        shoulder_obj = registry.get_shoulder(naan.naan, shoulder) if isinstance(shoulder, str) else None
+        if shoulder_obj is None:
+            results.append((number, {"error": f"shoulder {shoulder} does not exist"}))
+        else:
+            rows.append((naan, shoulder_obj, record))
+            lines.append(number)
+    with transaction.atomic():
+        created = Ark.mint_batch(rows, COLLISIONS)
+    # mint_batch doesn't send post_save, so drop cached misses here
+    minted(*(c.ark for c in created if c is not None))
+    for number, ark in zip(lines, created):
+        if ark is None:
+            results.append((number, {"error": f"Gave up creating ark after {COLLISIONS} collision(s)"}))
+        else:
+            results.append((number, ark_to_json(ark, metadata=False)))
+    return results
+
+
+def import_chunk(naan, chunk) -> list:
+    """Create the ARKs named by (line, record) pairs, as when moving from another minter.
+
+    Each record needs the full "ark" and the "shoulder" it was minted on,
+    which must exist on naan. ARKs that already exist are left alone and
+    reported. Returns (line, result) pairs; only used by import jobs.
+    """
+    keys, results = _lookup_keys(chunk)
+    by_line = dict(chunk)
+    arks, lines = [], []
+    for number, key in keys:
+        record = by_line[number]
+        shoulder = record.get('shoulder')
+        shoulder_obj = registry.get_shoulder(naan.naan, shoulder) if isinstance(shoulder, str) else None
+        prefix = f"{naan.naan}{shoulder}"
+        if shoulder_obj is None:
+            results.append((number, {"ark": key, "error": f"shoulder {shoulder} does not exist"}))
+        elif not key.startswith(prefix) or key == prefix:
+            results.append((number, {"ark": key, "error": f"ARK is not on {prefix}"}))
+        else:
+            ark = Ark(ark=key, naan=naan, shoulder=shoulder_obj, assigned_name=key[len(prefix):])
+            ark.set_fields(record)
+            arks.append(ark)
+            lines.append(number)
+    with transaction.atomic():
+        inserted = Ark.insert_new(arks)
+    minted(*inserted)
+    for number, ark in zip(lines, arks):
+        if ark.ark in inserted:
+            # The same ARK twice in one chunk only lands once
+            inserted.remove(ark.ark)
+            results.append((number, ark_to_json(ark, metadata=False)))
+        else:
+            results.append((number, {"ark": ark.ark, "error": "already exists"}))
+    return results
+
+
+@csrf_exempt
+def stream_update_arks(request):
+    """Update the ARKs in a newline-delimited JSON body, all on the NAAN in ?naan=."""
+    if request.method != "POST":
+        return HttpResponseNotAllowed(permitted_methods=["POST"])
+    authorized_naan, error = _stream_naan(request)
+    if error:
+        return error
+    return streaming.run(request, partial(update_chunk, authorized_naan), settings.ARKLET_STREAM_CHUNK_SIZE)
+
+
+@csrf_exempt
+def stream_mint_arks(request):
+    """Mint an ARK for each record of a newline-delimited JSON body, on the NAAN in ?naan=."""
+    if request.method != "POST":
+        return HttpResponseNotAllowed(permitted_methods=["POST"])
+    authorized_naan, error = _stream_naan(request)
+    if error:
+        return error
+    return streaming.run(request, partial(mint_chunk, authorized_naan), settings.ARKLET_STREAM_CHUNK_SIZE)
+
+
+def job_to_json(job: Job) -> dict:
+    return {
+        "id": str(job.id),
+        "naan": job.naan_id,
+        "operation": job.operation,
+        "status": job.status,
+        "total": job.total,
+        "processed": job.processed,
+        "failed": job.failed,
+        "error": job.error,
+        "created": job.created.isoformat(),
+        "finished": job.finished.isoformat() if job.finished else None,
+    }
+
+
+@csrf_exempt
+def submit_job(request):
+    """Queue a bulk ?operation= (mint, update or import) on the NAAN in ?naan=.
+
+    The body is newline-delimited JSON as for the stream_* views. The
+    records are stored and run by the job worker (ark/jobs.py); poll
+    job_status with the returned id.
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(permitted_methods=["POST"])
+    operation = request.GET.get('operation')
+    if operation not in dict(Job.OPERATIONS):
+        return HttpResponseBadRequest(f"operation must be one of {', '.join(dict(Job.OPERATIONS))}")
+    authorized_naan, error = _stream_naan(request)
+    if error:
+        return error
+    try:
+        with transaction.atomic():
+            job = Job.submit(authorized_naan, operation, streaming.records(request), settings.ARKLET_JOB_CHUNK_SIZE)
+    except streaming.READ_ERRORS as e:
+        return HttpResponseBadRequest(f"Couldn't read the request body: {e}")
+    response = JsonResponse(job_to_json(job), status=202)
+    response["Location"] = reverse("job_status", args=[job.id])
+    return response
+
+
+def _authorized_job(request, job_id):
+    """The job and None, or None and a 403 if it isn't on the caller's NAAN."""
+    job = Job.objects.filter(id=job_id).first()
+    if job is None:
+        raise Http404
+    if authorize(request, job.naan_id) is None:
+        return None, HttpResponseForbidden()
+    return job, None
+
+
+def job_status(request, job_id):
+    job, error = _authorized_job(request, job_id)
+    return error or JsonResponse(job_to_json(job))
+
+
+def job_results(request, job_id):
+    """The results of the job's processed records, as newline-delimited JSON."""
+    job, error = _authorized_job(request, job_id)
+    if error:
+        return error
+    writer = streaming.ResultWriter(request)
+    done = job.records.filter(position__lt=job.processed).order_by("position")
+    for line, result in done.values_list("line", "result").iterator(chunk_size=settings.ARKLET_JOB_CHUNK_SIZE):
+        writer.write(line, result)
+    return writer.response()
+
+
 def status(request):
     service = 'resolver' if os.environ.get("RESOLVER") else 'minter'
 
     return JsonResponse({
         'service': service,
         'status': 'ok!',
+        'resolver_cache': cache_stats(),
     })
\ No newline at end of file
@@ -13,4 +13,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "arklet.settings")
 
+# Under ASGI, resolve ARKs with the async view
+os.environ.setdefault("ARKLET_ASYNC_RESOLVER", "true")
+
 application = get_asgi_application()
+
+# Imported after the application so that Django is set up, and once per
+# worker process so that each one listens for cache invalidations.
+from ark import bloom, bus, noid_pool, snapshot  # noqa: E402
+
+bus.start_listener()
+bloom.start_loading()
+snapshot.start_loading()
+noid_pool.start_refilling()
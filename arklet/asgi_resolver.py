@@ -0,0 +1,31 @@
+"""
+ASGI config for the resolver-only arklet application.
+
+Serves ARK resolution with the minimal app and middleware stack from
+arklet.settings_resolver. Run it with e.g.
+``uvicorn arklet.asgi_resolver:application``.
+"""
+
+import os
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "arklet.settings_resolver")
+
+# Under ASGI, resolve ARKs with the async view
+os.environ.setdefault("ARKLET_ASYNC_RESOLVER", "true")
+
+application = get_asgi_application()
+
+# Imported after the application so that Django is set up, and once per
+# worker process so that each one listens for cache invalidations.
+from ark import bloom, bus, snapshot  # noqa: E402
+from arklet.sentry import lazy_sentry_asgi  # noqa: E402
+
+bus.start_listener()
+bloom.start_loading()
+snapshot.start_loading()
+
+if settings.SENTRY_LAZY:
+    application = lazy_sentry_asgi(application, settings.SENTRY_DSN, settings.SENTRY_SAMPLE_RATE)
@@ -0,0 +1,49 @@
+"""Sentry error reporting for arklet.
+
+sentry_sdk is an optional dependency and importing it with the Django
+integration is a noticeable part of worker start time, so it is only
+imported when a DSN is configured.
+"""
+
+_initialized = False
+
+
+def init_sentry(dsn: str, traces_sample_rate: float):
+    global _initialized  # pylint: disable=global-statement
+    if _initialized or not dsn:
+        return
+    _initialized = True
+
+    import sentry_sdk
+    from sentry_sdk.integrations.django import DjangoIntegration
+
+    sentry_sdk.init(
+        dsn=dsn,
+        integrations=[DjangoIntegration()],
+        traces_sample_rate=traces_sample_rate,
+        send_default_pii=True,
+    )
+
+
+def lazy_sentry_wsgi(application, dsn: str, traces_sample_rate: float):
+    """Wrap a WSGI application so Sentry is set up on its first request."""
+    if not dsn:
+        return application
+
+    def wrapper(environ, start_response):
+        init_sentry(dsn, traces_sample_rate)
+        return application(environ, start_response)
+
+    return wrapper
+
+
+def lazy_sentry_asgi(application, dsn: str, traces_sample_rate: float):
+    """Wrap an ASGI application so Sentry is set up on its first request."""
+    if not dsn:
+        return application
+
+    async def wrapper(scope, receive, send):
+        init_sentry(dsn, traces_sample_rate)
+        return await application(scope, receive, send)
+
+    return wrapper
@@ -26,12 +26,43 @@ env = environ.Env(
     ARKLET_POSTGRES_PORT=(str, "5432"),
     ARKLET_POSTGRES_USER=(str, "arklet"),
     ARKLET_POSTGRES_PASSWORD=(str, "arklet"),
+    ARKLET_POSTGRES_REPLICA_HOST=(str, ""),
+    ARKLET_POSTGRES_REPLICA_PORT=(str, ""),
+    ARKLET_POSTGRES_REPLICA_NAME=(str, ""),
+    ARKLET_POSTGRES_REPLICA_USER=(str, ""),
+    ARKLET_POSTGRES_REPLICA_PASSWORD=(str, ""),
     ARKLET_SENTRY_DSN=(str, ""),
     ARKLET_SENTRY_TRANSACTIONS_PER_TRACE=(int, 1),
+    ARKLET_SENTRY_LAZY=(bool, False),
     ARKLET_STATIC_ROOT=(str, "static"),
     ARKLET_MEDIA_ROOT=(str, "media"),
     RESOLVER=(bool, False),
-    ARKLET_NOID_LENGTH=(int, 8)
+    ARKLET_NOID_LENGTH=(int, 8),
+    ARKLET_AUTH_CACHE_SIZE=(int, 1024),
+    ARKLET_AUTH_CACHE_TTL=(int, 300),
+    ARKLET_API_KEY_PEPPER=(str, ""),
+    ARKLET_RESOLVER_CACHE_SIZE=(int, 10000),
+    ARKLET_RESOLVER_CACHE_TTL=(int, 60),
+    ARKLET_RESOLVER_NEGATIVE_CACHE_TTL=(int, 30),
+    ARKLET_RESOLVER_SHARED_CACHE_URL=(str, ""),
+    ARKLET_RESOLVER_SHARED_CACHE_TTL=(int, 3600),
+    ARKLET_INVALIDATION_CHANNEL=(str, ""),
+    ARKLET_BLOOM_FILTER=(bool, False),
+    ARKLET_BLOOM_FILTER_FPR=(float, 0.001),
+    ARKLET_BLOOM_FILTER_HEADROOM=(float, 1.5),
+    ARKLET_REGISTRY_TTL=(int, 300),
+    ARKLET_ASYNC_RESOLVER=(bool, False),
+    ARKLET_REDIRECT_MAX_AGE=(int, 0),
+    ARKLET_RESOLVER_SNAPSHOT=(str, ""),
+    ARKLET_RESOLVER_SNAPSHOT_REFRESH=(int, 30),
+    ARKLET_NOID_POOL_SIZE=(int, 0),
+    ARKLET_NOID_POOL_REFILL=(int, 10),
+    ARKLET_MINT_COALESCE_WINDOW=(float, 0),
+    ARKLET_MINT_COALESCE_BATCH=(int, 100),
+    ARKLET_IDEMPOTENCY_RETENTION=(int, 86400),
+    ARKLET_STREAM_CHUNK_SIZE=(int, 1000),
+    ARKLET_JOB_CHUNK_SIZE=(int, 1000),
+    ARKLET_JOB_LEASE=(int, 300),
 )
 
 # .env files are optional. django-environ will log an INFO message if no file is found
@@ -122,6 +153,23 @@ DATABASES = {
     }
 }
 
+# Optional read replica for resolution, batch queries and read-only management
+# commands. Unset REPLICA_* values default to the primary's. See ark/routers.py.
+ARKLET_REPLICA_DATABASE = ""
+if env("ARKLET_POSTGRES_REPLICA_HOST"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": env("ARKLET_POSTGRES_REPLICA_HOST"),
+        "PORT": env("ARKLET_POSTGRES_REPLICA_PORT") or DATABASES["default"]["PORT"],
+        "NAME": env("ARKLET_POSTGRES_REPLICA_NAME") or DATABASES["default"]["NAME"],
+        "USER": env("ARKLET_POSTGRES_REPLICA_USER") or DATABASES["default"]["USER"],
+        "PASSWORD": env("ARKLET_POSTGRES_REPLICA_PASSWORD") or DATABASES["default"]["PASSWORD"],
+        # Tests read their own writes through the primary's test database
+        "TEST": {"MIRROR": "default"},
+    }
+    ARKLET_REPLICA_DATABASE = "replica"
+    DATABASE_ROUTERS = ["ark.routers.ReplicaRouter"]
+
 
 AUTH_USER_MODEL = "ark.User"
 
@@ -150,8 +198,120 @@ PASSWORD_HASHERS = [
     "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
     "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
     "django.contrib.auth.hashers.ScryptPasswordHasher",
+    # Only used for API keys, see ark.models.Key
+    "ark.hashers.APIKeyHasher",
 ]
 
+# Secret mixed into API key hashes. Defaults to SECRET_KEY when unset.
+# Changing it invalidates every API key hashed with ark.hashers.APIKeyHasher.
+ARKLET_API_KEY_PEPPER = env("ARKLET_API_KEY_PEPPER")
+
+# Verified API tokens are remembered in-process so repeat callers skip the
+# password hasher. Set ARKLET_AUTH_CACHE_SIZE=0 to disable.
+ARKLET_AUTH_CACHE_SIZE = env("ARKLET_AUTH_CACHE_SIZE")
+ARKLET_AUTH_CACHE_TTL = env("ARKLET_AUTH_CACHE_TTL")
+
+# Length of minted NOIDs, before the check digit. Sequential shoulders grow
+# longer once their counter no longer fits.
+ARKLET_NOID_LENGTH = env("ARKLET_NOID_LENGTH")
+
+# Random shoulders mint from a pool of NOIDs that were checked against
+# existing ARKs ahead of time, so concurrent mints don't collide and retry.
+# Each minter worker tops every pool up to SIZE every REFILL seconds; the
+# refill_noid_pool command does the same. 0 mints without a pool.
+ARKLET_NOID_POOL_SIZE = env("ARKLET_NOID_POOL_SIZE")
+ARKLET_NOID_POOL_REFILL = env("ARKLET_NOID_POOL_REFILL")
+
+# Concurrent POST /mint requests in a worker wait up to WINDOW milliseconds
+# for each other and are inserted in one transaction, at most BATCH at a
+# time. Needs threaded workers, e.g. gunicorn --threads. See ark/coalescer.py.
+# 0 inserts each mint on its own.
+ARKLET_MINT_COALESCE_WINDOW = env("ARKLET_MINT_COALESCE_WINDOW")
+ARKLET_MINT_COALESCE_BATCH = env("ARKLET_MINT_COALESCE_BATCH")
+
+# Mint requests sent with an Idempotency-Key header are answered from the
+# stored response when retried within this many seconds. Run the
+# purge_idempotency_keys command to delete older keys.
+ARKLET_IDEMPOTENCY_RETENTION = env("ARKLET_IDEMPOTENCY_RETENTION")
+
+# The newline-delimited JSON bulk endpoints (stream/query, stream/update,
+# stream/mint) handle this many records per query and transaction, which
+# bounds their memory use. See ark/streaming.py.
+ARKLET_STREAM_CHUNK_SIZE = env("ARKLET_STREAM_CHUNK_SIZE")
+
+# Background jobs (POST /jobs, run by `manage.py run_jobs`) are stored and
+# processed this many records per transaction; progress is checkpointed
+# after each chunk. See ark/jobs.py.
+ARKLET_JOB_CHUNK_SIZE = env("ARKLET_JOB_CHUNK_SIZE")
+# Seconds a worker may go without finishing a chunk before its job is
+# considered abandoned and resumed by another worker. Keep it well above the
+# time a chunk takes.
+ARKLET_JOB_LEASE = env("ARKLET_JOB_LEASE")
+
+# Each worker remembers the redirect URL of recently resolved ARKs. Writes in
+# the same worker invalidate entries immediately; other workers see them once
+# the TTL (seconds) expires. Set ARKLET_RESOLVER_CACHE_SIZE=0 to disable.
+ARKLET_RESOLVER_CACHE_SIZE = env("ARKLET_RESOLVER_CACHE_SIZE")
+ARKLET_RESOLVER_CACHE_TTL = env("ARKLET_RESOLVER_CACHE_TTL")
+
+# Unknown ARKs are answered from memory for a short TTL (seconds). Minting
+# the ARK or one of its prefixes evicts the cached miss, but in other workers
+# only through ARKLET_INVALIDATION_CHANNEL, so the cache is off by default
+# without it; otherwise a new ARK would keep resolving to the NAAN fallback
+# in other workers for up to the TTL.
+ARKLET_RESOLVER_NEGATIVE_CACHE_SIZE = env.int(
+    "ARKLET_RESOLVER_NEGATIVE_CACHE_SIZE",
+    default=10000 if env("ARKLET_INVALIDATION_CHANNEL") else 0,
+)
+ARKLET_RESOLVER_NEGATIVE_CACHE_TTL = env("ARKLET_RESOLVER_NEGATIVE_CACHE_TTL")
+
+# Optional resolution cache shared by all workers, e.g. "pymemcache://host:11211",
+# "rediscache://host:6379/1" or "filecache:///var/tmp/arklet".
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+}
+ARKLET_RESOLVER_SHARED_CACHE = ""
+if env("ARKLET_RESOLVER_SHARED_CACHE_URL"):
+    CACHES["resolver"] = env.cache_url("ARKLET_RESOLVER_SHARED_CACHE_URL")
+    ARKLET_RESOLVER_SHARED_CACHE = "resolver"
+ARKLET_RESOLVER_SHARED_CACHE_TTL = env("ARKLET_RESOLVER_SHARED_CACHE_TTL")
+
+# Postgres NOTIFY channel used to evict in-process caches in every worker
+# after a write. Leave empty to disable. See ark/bus.py.
+ARKLET_INVALIDATION_CHANNEL = env("ARKLET_INVALIDATION_CHANNEL")
+
+# Per-NAAN Bloom filters let the resolver skip ARK lookups for identifiers
+# that were never minted. Requires ARKLET_INVALIDATION_CHANNEL. Filters are
+# sized for HEADROOM times the current number of ARKs at the given false
+# positive rate; at 0.001 that costs about 1.8 bytes per ARK of capacity.
+ARKLET_BLOOM_FILTER = env("ARKLET_BLOOM_FILTER")
+ARKLET_BLOOM_FILTER_FPR = env("ARKLET_BLOOM_FILTER_FPR")
+ARKLET_BLOOM_FILTER_HEADROOM = env("ARKLET_BLOOM_FILTER_HEADROOM")
+
+# Path of a snapshot written by the export_resolver_snapshot command. The
+# resolver answers unchanged ARKs from it, and everything it can while the
+# database is down. Each worker reopens a replaced file and reloads the ARKs
+# changed since it was written every REFRESH seconds. See ark/snapshot.py.
+ARKLET_RESOLVER_SNAPSHOT = env("ARKLET_RESOLVER_SNAPSHOT")
+ARKLET_RESOLVER_SNAPSHOT_REFRESH = env("ARKLET_RESOLVER_SNAPSHOT_REFRESH")
+
+# NAANs and shoulders are kept in memory and reloaded after this many seconds,
+# when one is saved (in other workers only with ARKLET_INVALIDATION_CHANNEL),
+# or at most once a second when a lookup misses. See ark/registry.py.
+ARKLET_REGISTRY_TTL = env("ARKLET_REGISTRY_TTL")
+
+# Route ARK resolution to the async view, which reads the database through
+# the async ORM. The ASGI entry points turn this on; WSGI workers keep the
+# sync view.
+ARKLET_ASYNC_RESOLVER = env("ARKLET_ASYNC_RESOLVER")
+
+# Cache-Control max-age (seconds) sent with resolver redirects, so nginx and
+# CDNs can answer repeat requests. Fallback redirects for unknown ARKs are
+# kept no longer than ARKLET_RESOLVER_NEGATIVE_CACHE_TTL. 0 sends no header.
+ARKLET_REDIRECT_MAX_AGE = env("ARKLET_REDIRECT_MAX_AGE")
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -180,13 +340,10 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 SENTRY_DSN = env("ARKLET_SENTRY_DSN")
 SENTRY_SAMPLE_RATE = 1 / int(env("ARKLET_SENTRY_TRANSACTIONS_PER_TRACE"))
-if SENTRY_DSN:
-    import sentry_sdk
-    from sentry_sdk.integrations.django import DjangoIntegration
-
-    sentry_sdk.init(
-        dsn=SENTRY_DSN,
-        integrations=[DjangoIntegration()],
-        traces_sample_rate=SENTRY_SAMPLE_RATE,
-        send_default_pii=True,
-    )
+# Lazy Sentry is set up by the resolver entry points on the first request
+# instead of while the worker starts. See arklet/sentry.py.
+SENTRY_LAZY = env("ARKLET_SENTRY_LAZY")
+if SENTRY_DSN and not SENTRY_LAZY:
+    from arklet.sentry import init_sentry
+
+    init_sentry(SENTRY_DSN, SENTRY_SAMPLE_RATE)
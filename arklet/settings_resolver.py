@@ -0,0 +1,42 @@
+"""
+Django settings for the resolver-only arklet application.
+
+The resolver serves nothing but ARK resolution and the status page, so it
+skips the admin, sessions, auth, messages, CSRF and clickjacking machinery
+that the minter needs. Everything else, including the database and cache
+settings, comes from arklet.settings.
+"""
+
+import os
+
+os.environ.setdefault("ARKLET_SENTRY_LAZY", "true")
+
+from arklet.settings import *  # noqa: E402,F401,F403
+
+# django.contrib.auth and contenttypes are still needed by the ark.User model
+INSTALLED_APPS = [
+    "django.contrib.auth",
+    "django.contrib.contenttypes",
+    "ark.apps.ArkConfig",
+]
+
+MIDDLEWARE = [
+    "django.middleware.security.SecurityMiddleware",
+    "django.middleware.common.CommonMiddleware",
+]
+
+ROOT_URLCONF = "arklet.urls_resolver"
+
+TEMPLATES = [
+    {
+        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "APP_DIRS": True,
+        "OPTIONS": {
+            "context_processors": [
+                "django.template.context_processors.request",
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = "arklet.wsgi_resolver.application"
@@ -15,9 +15,10 @@ Including another URLconf
 """
 import os
 from django.contrib import admin
-from django.urls import path, re_path
+from django.urls import path
 
 from ark import views
+from arklet import urls_resolver
 
 minterpatterns = [
     path("mint", views.mint_ark, name="mint_ark"),
@@ -25,13 +26,16 @@ minterpatterns = [
     path("bulk_query", views.batch_query_arks, name="bulk_query"),
     path("bulk_update", views.batch_update_arks, name="bulk_update"),
     path("bulk_mint", views.batch_mint_arks, name="bulk_mint"),
+    path("stream/query", views.stream_query_arks, name="stream_query"),
+    path("stream/update", views.stream_update_arks, name="stream_update"),
+    path("stream/mint", views.stream_mint_arks, name="stream_mint"),
+    path("jobs", views.submit_job, name="submit_job"),
+    path("jobs/<uuid:job_id>", views.job_status, name="job_status"),
+    path("jobs/<uuid:job_id>/results", views.job_results, name="job_results"),
     path("admin/", admin.site.urls),
 ]
 
-resolverpatterns = [
-    re_path(r"^(resolve/)?(?P<ark>ark:/?.*$)", views.resolve_ark, name="resolve_ark"),
-    path("", views.status, name="status"),
-]
+resolverpatterns = urls_resolver.urlpatterns
 
 combinedpatterns = minterpatterns + resolverpatterns
 
@@ -0,0 +1,16 @@
+"""arklet resolver URL Configuration
+
+Only ARK resolution and the status page, without the admin. Used on its
+own by arklet.settings_resolver and included by arklet.urls.
+"""
+from django.conf import settings
+from django.urls import path, re_path
+
+from ark import views
+
+resolve_view = views.aresolve_ark if settings.ARKLET_ASYNC_RESOLVER else views.resolve_ark
+
+urlpatterns = [
+    re_path(r"^(resolve/)?(?P<ark>ark:/?.*$)", resolve_view, name="resolve_ark"),
+    path("", views.status, name="status"),
+]
@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "arklet.settings")
 
 application = get_wsgi_application()
+
+# Imported after the application so that Django is set up, and once per
+# worker process so that each one listens for cache invalidations.
+from ark import bloom, bus, noid_pool, snapshot  # noqa: E402
+
+bus.start_listener()
+bloom.start_loading()
+snapshot.start_loading()
+noid_pool.start_refilling()
@@ -0,0 +1,28 @@
+"""
+WSGI config for the resolver-only arklet application.
+
+Serves ARK resolution with the minimal app and middleware stack from
+arklet.settings_resolver. Run it with e.g.
+``gunicorn arklet.wsgi_resolver:application``.
+"""
+
+import os
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "arklet.settings_resolver")
+
+application = get_wsgi_application()
+
+# Imported after the application so that Django is set up, and once per
+# worker process so that each one listens for cache invalidations.
+from ark import bloom, bus, snapshot  # noqa: E402
+from arklet.sentry import lazy_sentry_wsgi  # noqa: E402
+
+bus.start_listener()
+bloom.start_loading()
+snapshot.start_loading()
+
+if settings.SENTRY_LAZY:
+    application = lazy_sentry_wsgi(application, settings.SENTRY_DSN, settings.SENTRY_SAMPLE_RATE)
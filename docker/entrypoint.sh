@@ -15,5 +15,9 @@ if [ "$ENV" = "dev" ]; then
     ./manage.py runserver 0.0.0.0:$ARKLET_PORT
 else
     ./manage.py collectstatic --noinput
-    gunicorn arklet.wsgi:application --bind 0.0.0.0:$ARKLET_PORT 
+    if [ -n "$RESOLVER" ]; then
+        gunicorn arklet.wsgi_resolver:application --bind 0.0.0.0:$ARKLET_PORT
+    else
+        gunicorn arklet.wsgi:application --bind 0.0.0.0:$ARKLET_PORT
+    fi
 fi
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""Compare resolution throughput of sync WSGI workers with an ASGI server.
+
+Start the two servers on the same machine, with the same number of worker
+processes and against the same database, e.g.
+
+    gunicorn -w 4 -b 127.0.0.1:8001 arklet.wsgi_resolver:application
+    uvicorn --workers 4 --port 8002 arklet.asgi_resolver:application
+
+and point this script at both. It keeps --concurrency requests in flight
+against each server for --duration seconds, using ARKs read from a file with
+one ARK per line (see fetch_random_arks.sh), and reports requests per second
+and latency percentiles. Redirects are not followed.
+
+    python perftest/concurrency_benchmark.py arks.txt \\
+        --server sync=http://127.0.0.1:8001 --server async=http://127.0.0.1:8002 \\
+        --concurrency 200 --duration 30
+"""
+import argparse
+import http.client
+import itertools
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def worker(base, paths, deadline, latencies, errors):
+    parts = urlsplit(base)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    for path in paths:
+        if time.perf_counter() > deadline:
+            break
+        start = time.perf_counter()
+        try:
+            conn.request("GET", f"{parts.path.rstrip('/')}/ark:/{path}")
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors.append(1)
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def run(base, arks, concurrency, duration):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    threads = []
+    for i in range(concurrency):
+        # Each connection walks the ARKs from a different offset
+        paths = itertools.islice(itertools.cycle(arks), i % len(arks), None)
+        thread = threading.Thread(
+            target=worker, args=(base, paths, deadline, latencies, errors), daemon=True
+        )
+        threads.append(thread)
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    if not latencies:
+        return {"requests": 0, "errors": len(errors)}
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p99_ms": 1000 * latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("arks", help="file with one ARK (naan/identifier) per line")
+    parser.add_argument(
+        "--server",
+        action="append",
+        required=True,
+        metavar="NAME=URL",
+        help="server to benchmark, may be repeated",
+    )
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+
+    with open(args.arks, encoding="utf-8") as f:
+        lines = (line.strip() for line in f)
+        # Skip blank lines and the CSV header written by fetch_random_arks.sh
+        arks = [line[len("ark:/"):] if line.startswith("ark:/") else line for line in lines if line and line != "ark"]
+    for server in args.server:
+        name, url = server.split("=", 1)
+        result = run(url, arks, args.concurrency, args.duration)
+        print(name, " ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}"
+                             for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Show how the redirect lookup is planned with and without the covering index.
+
+Copies the ark_ark table definition into a scratch table, fills it with
+--rows synthetic ARKs whose metadata, title and relation columns are as
+wide as --width characters, and prints EXPLAIN (ANALYZE, BUFFERS) for the
+query resolver.best_match runs, first with only the primary key and then
+with the ark_ark_url_covering index (ark INCLUDE url). Postgres only.
+
+Run from the repository root with the usual arklet environment variables set:
+
+    python perftest/covering_index_benchmark.py --rows 10000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "arklet.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from ark.models import Ark  # noqa: E402
+
+TABLE = "ark_ark_benchmark"
+NAAN = 99999
+WIDE = {"metadata", "title", "relation"}
+
+
+def column_values(width):
+    """SQL expressions for each column of a synthetic ARK numbered i."""
+    values = {}
+    for field in Ark._meta.concrete_fields:
+        if field.name == "ark":
+            values[field.column] = f"'{NAAN}/t2' || lpad(i::text, 10, '0')"
+        elif field.name == "assigned_name":
+            values[field.column] = "lpad(i::text, 10, '0')"
+        elif field.name == "url":
+            values[field.column] = "'https://example.com/items/' || i"
+        elif field.name in ("naan", "shoulder"):
+            values[field.column] = str(NAAN) if field.name == "naan" else "1"
+        elif field.name == "modified":
+            values[field.column] = "now()"
+        elif field.name in WIDE:
+            values[field.column] = f"repeat(md5(i::text), {max(width // 32, 1)})"
+        else:
+            values[field.column] = "''"
+    return values
+
+
+def explain(cursor, rows):
+    i = random.randrange(rows)
+    ark_str = f"{NAAN}/t2{i:010}"
+    candidates = [f"{ark_str}/chapter/1", f"{ark_str}/chapter", ark_str]
+    cursor.execute(
+        f"EXPLAIN (ANALYZE, BUFFERS) SELECT ark, url FROM {TABLE} "
+        "WHERE ark IN (%s, %s, %s) ORDER BY length(ark) DESC LIMIT 1",
+        candidates,
+    )
+    return "\n".join(row[0] for row in cursor.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN the redirect lookup with and without the covering index.")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--width", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="don't drop the scratch table")
+    args = parser.parse_args()
+    if connection.vendor != "postgresql":
+        sys.exit("This benchmark needs Postgres")
+
+    values = column_values(args.width)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        # Copies the primary key but not the other indexes
+        cursor.execute(f"CREATE TABLE {TABLE} (LIKE ark_ark INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (ark)")
+        start = time.perf_counter()
+        cursor.execute(
+            f"INSERT INTO {TABLE} ({', '.join(values)}) "
+            f"SELECT {', '.join(values.values())} FROM generate_series(1, %s) AS i",
+            [args.rows],
+        )
+        cursor.execute(f"VACUUM ANALYZE {TABLE}")
+        print(f"Loaded {args.rows:,} rows in {time.perf_counter() - start:.0f}s\n")
+        try:
+            explain(cursor, args.rows)  # warm up
+            print("Primary key only:\n" + explain(cursor, args.rows) + "\n")
+            cursor.execute(f"CREATE INDEX {TABLE}_covering ON {TABLE} (ark) INCLUDE (url)")
+            # Index-only scans need an up to date visibility map
+            cursor.execute(f"VACUUM ANALYZE {TABLE}")
+            explain(cursor, args.rows)
+            print("Covering index:\n" + explain(cursor, args.rows))
+        finally:
+            if not args.keep:
+                cursor.execute(f"DROP TABLE {TABLE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Compare API key verifications per second for each password hasher.
+
+Run from the repository root with the usual arklet environment variables set:
+
+    python perftest/hasher_benchmark.py --seconds 2
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "arklet.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.hashers import check_password, make_password  # noqa: E402
+
+HASHERS = ["argon2", "pbkdf2_sha256", "apikey_hmac_sha256"]
+
+
+def verifications_per_second(hasher, seconds):
+    api_key = str(uuid.uuid4())
+    encoded = make_password(api_key, hasher=hasher)
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        check_password(api_key, encoded, preferred=hasher)
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark API key hashers.")
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+    for hasher in HASHERS:
+        rate = verifications_per_second(hasher, args.seconds)
+        print(f"{hasher:>20}: {rate:12,.0f} verifications/s")
@@ -0,0 +1,104 @@
+"""Compare single-ARK mint throughput with and without the mint coalescer.
+
+Runs --threads threads that each mint ARKs one at a time for --duration
+seconds, first saving every ARK in its own transaction as mint_ark does by
+default, then through ark.coalescer with the given --window (milliseconds)
+and --batch size, and reports mints per second, latency percentiles and the
+mean coalesced batch size. The ARKs are really minted on the given shoulder,
+so point it at a scratch database.
+
+Run from the repository root with the usual arklet environment variables set:
+
+    python perftest/mint_coalescing_benchmark.py 99999 /t2 --threads 32 --window 2
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "arklet.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+
+from ark.coalescer import MintCoalescer  # noqa: E402
+from ark.models import Ark, Shoulder  # noqa: E402
+
+
+def save_one(naan, shoulder, fields):
+    ark = Ark.create(naan, shoulder)
+    ark.set_fields(fields)
+    ark.save(force_insert=True)
+    return ark
+
+
+def worker(mint, deadline, latencies):
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            mint()
+            latencies.append(time.perf_counter() - start)
+    finally:
+        connection.close()
+
+
+def run(mint, threads, duration):
+    latencies = []
+    deadline = time.perf_counter() + duration
+    workers = [
+        threading.Thread(target=worker, args=(mint, deadline, latencies), daemon=True)
+        for _ in range(threads)
+    ]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "mints": len(latencies),
+        "mints_per_s": len(latencies) / elapsed,
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p99_ms": 1000 * latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+def report(name, result):
+    print(name, " ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}"
+                         for k, v in result.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("naan", type=int)
+    parser.add_argument("shoulder")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--window", type=float, default=2, help="coalescing window in milliseconds")
+    parser.add_argument("--batch", type=int, default=100, help="largest coalesced batch")
+    args = parser.parse_args()
+
+    shoulder = Shoulder.objects.select_related("naan").get(naan=args.naan, shoulder=args.shoulder)
+    naan = shoulder.naan
+    fields = {"url": "https://example.com/benchmark", "title": "Coalescing benchmark"}
+
+    report("separate", run(lambda: save_one(naan, shoulder, fields), args.threads, args.duration))
+
+    settings.ARKLET_MINT_COALESCE_WINDOW = args.window
+    settings.ARKLET_MINT_COALESCE_BATCH = args.batch
+    coalescer = MintCoalescer()
+    result = run(lambda: coalescer.mint(naan, shoulder, fields, 10), args.threads, args.duration)
+    result["mean_batch"] = coalescer.stats()["mean_batch"]
+    report("coalesced", result)
+
+
+if __name__ == "__main__":
+    main()
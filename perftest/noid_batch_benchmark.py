@@ -0,0 +1,57 @@
+"""Compare NOID and check digit generation per ARK with the batch functions.
+
+Times --count NOIDs of --length characters with their check digits, made one
+at a time with generate_noid/noid_check_digit and at once with
+generate_noids/noid_check_digits, best of --runs.
+
+Run from the repository root with the usual arklet environment variables set:
+
+    python perftest/noid_batch_benchmark.py --count 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "arklet.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from ark.utils import (  # noqa: E402
+    generate_noid,
+    generate_noids,
+    noid_check_digit,
+    noid_check_digits,
+)
+
+
+def best_of(runs, func):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batched NOID generation.")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--length", type=int, default=8)
+    parser.add_argument("--prefix", default="99999/t2")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    def per_ark():
+        for _ in range(args.count):
+            noid_check_digit(args.prefix + generate_noid(args.length))
+
+    def batched():
+        noid_check_digits(args.prefix, generate_noids(args.count, args.length))
+
+    single, batch = best_of(args.runs, per_ark), best_of(args.runs, batched)
+    print(f"per ARK: {single * 1000:8.1f}ms")
+    print(f"batched: {batch * 1000:8.1f}ms ({single / batch:.1f}x)")
@@ -0,0 +1,78 @@
+"""Compare the combined arklet application with the resolver-only one.
+
+For each WSGI entry point this starts a fresh interpreter, times how long the
+application takes to load, and then measures requests per second by calling
+it in-process (no network or server overhead) for the status page and for
+an ARK under an unknown NAAN, which resolves without touching ARK rows.
+
+Run from the repository root with the usual arklet environment variables set:
+
+    python perftest/resolver_app_benchmark.py --requests 5000
+"""
+import argparse
+import importlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from wsgiref.util import setup_testing_defaults
+
+ENTRY_POINTS = {
+    "combined": ("arklet.wsgi", "arklet.settings"),
+    "resolver": ("arklet.wsgi_resolver", "arklet.settings_resolver"),
+}
+PATHS = ["/", "/ark:/99999/t2benchmark"]
+
+
+def run_child(entry, n_requests):
+    start = time.perf_counter()
+    application = importlib.import_module(entry).application
+    startup = time.perf_counter() - start
+
+    from django.conf import settings  # pylint: disable=import-outside-toplevel
+
+    results = {"startup_s": startup}
+    for path in PATHS:
+        environ = {"PATH_INFO": path, "HTTP_HOST": settings.ALLOWED_HOSTS[0]}
+        setup_testing_defaults(environ)
+        # Warm up lazily loaded state such as the NAAN registry
+        application(dict(environ, **{"wsgi.input": io.BytesIO()}), lambda *a: None)
+        start = time.perf_counter()
+        for _ in range(n_requests):
+            body = application(dict(environ, **{"wsgi.input": io.BytesIO()}), lambda *a: None)
+            b"".join(body)
+        results[path] = n_requests / (time.perf_counter() - start)
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the resolver application profiles.")
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--settings', nargs=2, metavar=("COMBINED", "RESOLVER"),
+                        help="override the settings module of each profile")
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.requests)
+        return
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for i, (name, (entry, settings_module)) in enumerate(ENTRY_POINTS.items()):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=args.settings[i] if args.settings else settings_module)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", entry, "--requests", str(args.requests)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        results = json.loads(out.splitlines()[-1])
+        print(f"{name:>9}: start {results.pop('startup_s') * 1000:7.1f} ms", end="")
+        for path, rate in results.items():
+            print(f" | {path} {rate:9,.0f} req/s", end="")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Tests for ark/auth.py, the API key checks behind the management endpoints."""
+
+import uuid
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth.hashers import make_password
+from django.test import RequestFactory
+
+from ark.auth import authorize, token_cache
+from ark.hashers import APIKeyHasher
+from ark.models import Key
+
+
+@pytest.fixture
+def request_with_key(auth):
+    """A request carrying the valid access key of the initial naan."""
+    return RequestFactory().post("/mint", HTTP_AUTHORIZATION=auth)
+
+
+class TestTokenCache:
+    """authorize remembers verified tokens until their Key is revoked."""
+
+    @pytest.mark.django_db
+    def test_repeat_caller_skips_hasher(self, naan, request_with_key) -> None:
+        """A second call with the same token doesn't run check_password."""
+        assert authorize(request_with_key, naan.naan) == naan
+        with patch.object(Key, "check_password") as mock_check:
+            assert authorize(request_with_key, naan.naan) == naan
+        mock_check.assert_not_called()
+        assert token_cache.hits == 1
+
+    @pytest.mark.django_db
+    def test_cache_is_scoped_to_naan(self, naan, request_with_key) -> None:
+        """A token verified for one NAAN isn't accepted for another."""
+        assert authorize(request_with_key, naan.naan) == naan
+        assert authorize(request_with_key, naan.naan + 1) is None
+
+    @pytest.mark.django_db
+    def test_raw_token_is_not_stored(self, naan, auth, request_with_key) -> None:
+        """The cache is keyed by a digest, not by the token itself."""
+        authorize(request_with_key, naan.naan)
+        token = auth.split()[-1]
+        assert all(token not in key for key in token_cache._data)
+
+    @pytest.mark.django_db
+    def test_deactivated_key_stops_working(self, naan, request_with_key) -> None:
+        """Deactivating a Key revokes its cached tokens right away."""
+        assert authorize(request_with_key, naan.naan) == naan
+        key = Key.objects.get(naan=naan)
+        key.active = False
+        key.save()
+        assert authorize(request_with_key, naan.naan) is None
+
+    @pytest.mark.django_db
+    def test_deleted_key_stops_working(self, naan, request_with_key) -> None:
+        """Deleting a Key, including via queryset, revokes its cached tokens."""
+        assert authorize(request_with_key, naan.naan) == naan
+        Key.objects.filter(naan=naan).delete()
+        assert authorize(request_with_key, naan.naan) is None
+
+
+class TestKeyIdTokens:
+    """API tokens of the form "<key_id>.<secret>" address a single Key."""
+
+    @pytest.mark.django_db
+    def test_token_carries_key_id(self, naan, auth) -> None:
+        """New tokens start with the public key_id of their Key."""
+        key_id, _, _ = auth.split()[-1].partition(".")
+        assert Key.objects.get(naan=naan).key_id == key_id
+
+    @pytest.mark.django_db
+    def test_one_hash_check_per_token(self, naan, request_with_key) -> None:
+        """Other keys of the NAAN are never hashed against the token."""
+        for _ in range(5):
+            Key.create_for_naan(naan.naan)
+        with patch.object(Key, "check_password", return_value=True) as mock_check:
+            assert authorize(request_with_key, naan.naan) == naan
+        assert mock_check.call_count == 1
+
+    @pytest.mark.django_db
+    def test_wrong_secret_is_rejected(self, naan, auth) -> None:
+        """The key_id alone doesn't authorize a request."""
+        key_id, _, _ = auth.split()[-1].partition(".")
+        request = RequestFactory().post("/mint", HTTP_AUTHORIZATION=f"Bearer {key_id}.{uuid.uuid4()}")
+        assert authorize(request, naan.naan) is None
+
+    @pytest.mark.django_db
+    def test_legacy_uuid_key_still_works(self, naan) -> None:
+        """Keys issued as bare UUIDs, with no key_id, are still accepted."""
+        api_key = uuid.uuid4()
+        legacy_key = Key(naan=naan, active=True)
+        legacy_key.set_password(str(api_key))
+        legacy_key.save()
+        request = RequestFactory().post("/mint", HTTP_AUTHORIZATION=f"Bearer {api_key}")
+        assert authorize(request, naan.naan) == naan
+
+
+class TestAPIKeyHasher:
+    """API keys are hashed with ark.hashers.APIKeyHasher."""
+
+    @pytest.mark.django_db
+    def test_new_keys_use_api_key_hasher(self, naan, auth) -> None:
+        """Freshly issued keys skip Argon2."""
+        assert Key.objects.get(naan=naan).key.startswith(f"{APIKeyHasher.algorithm}$")
+
+    @pytest.mark.django_db
+    def test_argon2_key_is_rehashed_on_use(self, naan) -> None:
+        """A key stored with Argon2 is upgraded on its first successful use."""
+        api_key = uuid.uuid4()
+        legacy_key = Key(naan=naan, active=True, key=make_password(str(api_key), hasher="argon2"))
+        legacy_key.save()
+        request = RequestFactory().post("/mint", HTTP_AUTHORIZATION=f"Bearer {api_key}")
+        assert authorize(request, naan.naan) == naan
+        upgraded = Key.objects.get(naan=naan)
+        assert upgraded.key.startswith(f"{APIKeyHasher.algorithm}$")
+        assert upgraded.check_password(str(api_key))
+
+    @pytest.mark.django_db
+    def test_revoked_key_is_not_rehashed(self, naan) -> None:
+        """A revoke committed while the key was being checked isn't undone."""
+        api_key = uuid.uuid4()
+        encoded = make_password(str(api_key), hasher="argon2")
+        legacy_key = Key.objects.create(naan=naan, active=True, key=encoded)
+        Key.objects.filter(pk=encoded).update(active=False)
+        assert legacy_key.check_password(str(api_key))
+        assert list(Key.objects.values_list("key", "active")) == [(encoded, False)]
+
+    @pytest.mark.django_db
+    def test_rehash_evicts_tokens_cached_for_old_key(
+        self, naan, django_capture_on_commit_callbacks
+    ) -> None:
+        """Tokens cached against the old primary key are dropped."""
+        api_key = uuid.uuid4()
+        encoded = make_password(str(api_key), hasher="argon2")
+        Key.objects.create(naan=naan, active=True, key=encoded)
+        token_cache.set("other-token", (encoded, naan))
+        request = RequestFactory().post("/mint", HTTP_AUTHORIZATION=f"Bearer {api_key}")
+        with django_capture_on_commit_callbacks(execute=True):
+            assert authorize(request, naan.naan) == naan
+        assert token_cache.get("other-token") is None
+
+    @pytest.mark.django_db
+    def test_failed_check_does_not_rehash(self, naan) -> None:
+        """A wrong token leaves the stored Argon2 hash alone."""
+        encoded = make_password(str(uuid.uuid4()), hasher="argon2")
+        Key.objects.create(naan=naan, active=True, key=encoded)
+        request = RequestFactory().post("/mint", HTTP_AUTHORIZATION=f"Bearer {uuid.uuid4()}")
+        assert authorize(request, naan.naan) is None
+        assert Key.objects.get(naan=naan).key == encoded
@@ -0,0 +1,84 @@
+"""Tests for ark/bloom.py, the existence index in front of resolver lookups."""
+
+import pytest
+from django.core.management import call_command
+
+from ark import bloom
+from ark.bloom import BloomFilter
+from ark.models import Ark
+
+
+@pytest.fixture
+def naan_filter(naan, bound_ark):
+    """A Bloom filter loaded for the initial NAAN."""
+    yield bloom.build(naan.naan)
+    bloom._filters.clear()
+
+
+def test_no_false_negatives() -> None:
+    """Every added item is reported present."""
+    bf = BloomFilter(capacity=10_000, error_rate=0.01)
+    items = [f"1/t2{i}" for i in range(10_000)]
+    for item in items:
+        bf.add(item)
+    assert all(item in bf for item in items)
+
+
+def test_false_positive_rate_near_target() -> None:
+    """At capacity the observed false positive rate is close to the target."""
+    bf = BloomFilter(capacity=10_000, error_rate=0.01)
+    for i in range(10_000):
+        bf.add(f"1/t2{i}")
+    false_positives = sum(f"2/t2{i}" in bf for i in range(20_000))
+    assert false_positives / 20_000 < 0.02
+    assert bf.stats()["estimated_fpr"] == pytest.approx(0.01, rel=0.2)
+
+
+@pytest.mark.django_db
+def test_absent_ark_skips_ark_lookup(
+    client, naan, naan_filter, warm_registry, django_assert_num_queries
+) -> None:
+    """An ARK the filter rules out is resolved without a query."""
+    with django_assert_num_queries(0):
+        res = client.get(f"/ark:/{naan.naan}/t2never")
+    assert res["Location"] == f"{naan.url}/ark:/{naan.naan}/t2never"
+    assert bloom.stats()["skipped_lookups"] >= 1
+
+
+@pytest.mark.django_db
+def test_prefix_of_existing_ark_is_not_skipped(client, naan_filter, bound_ark) -> None:
+    """Suffix passthrough still works with the filter loaded."""
+    res = client.get(f"/ark:/{bound_ark.ark}/page/2")
+    assert res["Location"] == f"{bound_ark.url}/page/2"
+
+
+@pytest.mark.django_db
+def test_minted_ark_is_added(client, naan, shoulder, naan_filter) -> None:
+    """ARKs created after the filter was built are found."""
+    Ark.objects.create(
+        ark=f"{naan.naan}/t2fresh",
+        naan=naan,
+        shoulder=shoulder,
+        assigned_name="fresh",
+        url="https://example.com/fresh",
+    )
+    res = client.get(f"/ark:/{naan.naan}/t2fresh")
+    assert res["Location"].startswith("https://example.com/fresh")
+
+
+@pytest.mark.django_db
+def test_mintarks_adds_arks(client, naan, shoulder, naan_filter) -> None:
+    """ARKs minted by the mintarks command are resolved, not sent to the fallback."""
+    call_command("mintarks", "3", str(naan.naan), shoulder.shoulder)
+    for ark in Ark.objects.filter(url=""):
+        assert client.get(f"/ark:/{ark.ark}").status_code == 200
+
+
+@pytest.mark.django_db
+def test_rebuild_command_reports_size(capsys, naan, bound_ark) -> None:
+    """rebuild_bloom_filters reports the memory footprint and error rate."""
+    call_command("rebuild_bloom_filters")
+    out = capsys.readouterr().out
+    assert f"NAAN {naan.naan}: 1 ARKs" in out
+    assert "false positive rate" in out
+    bloom._filters.clear()
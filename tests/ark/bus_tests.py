@@ -0,0 +1,97 @@
+"""Tests for ark/bus.py, cache invalidation across worker processes."""
+
+import json
+from unittest.mock import patch
+
+import pytest
+
+from ark import bus
+from ark.auth import token_cache
+from ark.models import Ark
+from ark.resolver import resolution_cache
+
+
+@pytest.fixture
+def channel(settings):
+    """Enable the invalidation bus and capture what it would NOTIFY."""
+    settings.ARKLET_INVALIDATION_CHANNEL = "arklet_test"
+    with patch("ark.bus._send") as mock_send:
+        yield mock_send
+
+
+@pytest.fixture
+def many_arks(naan, shoulder):
+    """100 bound ARKs for bulk updates."""
+    return Ark.objects.bulk_create(
+        Ark(
+            ark=f"{naan.naan}{shoulder.shoulder}{i}",
+            naan=naan,
+            shoulder=shoulder,
+            assigned_name=str(i),
+            url="https://example.com",
+        )
+        for i in range(100)
+    )
+
+
+@pytest.mark.django_db
+def test_bulk_update_sends_one_notification(
+    client, auth, channel, many_arks, django_capture_on_commit_callbacks
+) -> None:
+    """A 100-row bulk update publishes all of its ARKs in a single NOTIFY."""
+    data = [{"ark": f"ark:/{a.ark}", "url": "https://example.com/new"} for a in many_arks]
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post(
+            "/bulk_update",
+            data={"data": data},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=auth,
+        )
+    assert channel.call_count == 1
+    payload = json.loads(channel.call_args.args[0])
+    assert sorted(payload["ark"]) == sorted(a.ark for a in many_arks)
+
+
+@pytest.mark.django_db
+def test_nothing_is_sent_before_commit(channel, django_capture_on_commit_callbacks) -> None:
+    """Changes are only announced once the transaction commits."""
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        bus.publish("ark", "1/t2a")
+        bus.publish("ark", "1/t2b")
+    channel.assert_not_called()
+    for callback in callbacks:
+        callback()
+    assert channel.call_count == 1
+
+
+def test_large_batches_are_split() -> None:
+    """Each payload stays under the pg_notify size limit."""
+    pending = {"ark": {f"12345/t2{i:020d}" for i in range(1000)}}
+    payloads = list(bus._payloads(pending))
+    assert len(payloads) > 1
+    assert all(len(p) < 8000 for p in payloads)
+    assert sum(len(json.loads(p)["ark"]) for p in payloads) == 1000
+
+
+def test_dispatch_evicts_local_entries() -> None:
+    """A notification from another worker evicts the named ARKs."""
+    resolution_cache.set("1/t2a", "https://example.com/a")
+    resolution_cache.set("1/t2b", "https://example.com/b")
+    bus.dispatch(json.dumps({"ark": ["1/t2a"]}))
+    assert resolution_cache.get("1/t2a") is None
+    assert resolution_cache.get("1/t2b") == "https://example.com/b"
+
+
+def test_key_change_drops_every_token() -> None:
+    """Key notifications carry no hashes and clear the token cache."""
+    token_cache.set("digest", ("pk", None))
+    bus.dispatch(json.dumps({"key": []}))
+    assert len(token_cache) == 0
+
+
+def test_disabled_without_channel(settings) -> None:
+    """Nothing is published unless ARKLET_INVALIDATION_CHANNEL is set."""
+    settings.ARKLET_INVALIDATION_CHANNEL = ""
+    with patch("ark.bus._send") as mock_send:
+        bus.publish("ark", "1/t2a")
+    mock_send.assert_not_called()
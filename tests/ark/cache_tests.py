@@ -0,0 +1,45 @@
+"""Tests for ark/cache.py, the in-process caches behind the hot paths."""
+
+from ark.cache import TTLCache
+
+
+class FakeTimer:
+    """A controllable clock for expiring entries."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl() -> None:
+    """An entry is a miss once its ttl has passed."""
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=5, timer=timer)
+    cache.set("a", 1)
+    timer.now = 4
+    assert cache.get("a") == 1
+    timer.now = 6
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted() -> None:
+    """The cache never grows past maxsize."""
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+
+def test_zero_maxsize_disables_cache() -> None:
+    """maxsize=0 stores nothing."""
+    cache = TTLCache(maxsize=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
@@ -0,0 +1,68 @@
+"""Tests for ark/coalescer.py, group commit of concurrent mints."""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from unittest.mock import patch
+
+import pytest
+from django.db import DatabaseError, connection
+
+from ark.coalescer import MintCoalescer
+from ark.models import Ark
+
+mint_batch = Ark.mint_batch
+
+
+@pytest.fixture
+def coalescing(settings):
+    """A window long enough that the batch only closes once it is full."""
+    settings.ARKLET_MINT_COALESCE_WINDOW = 5000
+    settings.ARKLET_MINT_COALESCE_BATCH = 4
+    return MintCoalescer()
+
+
+def mint_concurrently(coalescer, naan, shoulder, titles):
+    def mint(title):
+        try:
+            return coalescer.mint(naan, shoulder, {"title": title}, 10)
+        except DatabaseError as e:
+            return e
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(len(titles)) as pool:
+        return list(pool.map(mint, titles))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_mints_share_a_batch(coalescing, naan, shoulder) -> None:
+    arks = mint_concurrently(coalescing, naan, shoulder, ["a", "b", "c", "d"])
+    assert [ark.title for ark in arks] == ["a", "b", "c", "d"]
+    assert coalescing.stats() == {"batches": 1, "mints": 4, "mean_batch": 4}
+    assert Ark.objects.filter(ark__in=[ark.ark for ark in arks]).count() == 4
+
+
+@pytest.mark.django_db(transaction=True)
+def test_failed_row_only_fails_its_caller(coalescing, naan, shoulder) -> None:
+    """When the batch insert fails, each row is minted alone."""
+
+    def failing_mint_batch(rows, attempts):
+        if any(fields["title"] == "bad" for _, _, fields in rows):
+            raise DatabaseError("value too long")
+        return mint_batch(rows, attempts)
+
+    with patch.object(Ark, "mint_batch", side_effect=failing_mint_batch):
+        results = mint_concurrently(coalescing, naan, shoulder, ["a", "bad", "c", "d"])
+    assert isinstance(results[1], DatabaseError)
+    assert [r.title for i, r in enumerate(results) if i != 1] == ["a", "c", "d"]
+    assert Ark.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_mint_ark_coalesces(client, settings, mint_ark_args) -> None:
+    """A lone request is flushed once the window passes."""
+    settings.ARKLET_MINT_COALESCE_WINDOW = 1
+    mint_ark_args.data["title"] = "coalesced"
+    res = client.post(**asdict(mint_ark_args))
+    assert res.status_code == 200
+    assert Ark.objects.get(ark=res.json()["ark"][len("ark:/"):]).title == "coalesced"
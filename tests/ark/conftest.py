@@ -0,0 +1,106 @@
+"""Fixtures shared by the arklet tests."""
+
+from dataclasses import dataclass
+
+import pytest
+
+from ark.models import Ark, Key, Naan, Shoulder
+
+
+@pytest.fixture
+def naan(db):
+    """Create the initial NAAN used for most tests."""
+    return Naan.objects.create(
+        naan=1, name="Archive", description="A NAAN", url="https://example.com"
+    )
+
+
+@pytest.fixture
+def shoulder(db, naan):
+    """Create an initial shoulder used for most tests."""
+    return Shoulder.objects.create(
+        shoulder="/t2", naan=naan, name="Test", description="A Shoulder"
+    )
+
+
+@pytest.fixture
+def auth(db, naan):
+    """Create an access key for the initial naan."""
+    _, api_key = Key.create_for_naan(naan.naan)
+    return f"Bearer {api_key}"
+
+
+@pytest.fixture
+def ark(db, naan, shoulder):
+    """Create an ARK for tests."""
+    return Ark.objects.create(
+        ark=f"{naan.naan}{shoulder.shoulder}12346",
+        naan=naan,
+        shoulder=shoulder,
+        assigned_name="12346",
+    )
+
+
+@pytest.fixture
+def bound_ark(ark):
+    """An ARK bound to a URL, so that resolving it redirects."""
+    ark.url = "https://example.com/first"
+    ark.save()
+    return ark
+
+
+@pytest.fixture
+def warm_registry(naan, shoulder):
+    """Load the NAAN and shoulder registry so tests can count resolver queries."""
+    # pylint: disable=import-outside-toplevel
+    from ark import registry
+
+    registry.get_naan(naan.naan)
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Verified tokens, cached resolutions and the registry must not leak between tests."""
+    # pylint: disable=import-outside-toplevel
+    from ark import registry, snapshot
+    from ark.auth import token_cache
+    from ark.resolver import negative_cache, resolution_cache
+
+    for cache in (token_cache, resolution_cache, negative_cache):
+        cache.clear()
+        cache.reset_stats()
+    registry.evict_local()
+    snapshot.reset()
+
+
+@pytest.fixture(autouse=True)
+def primary_only(settings):
+    """Read from the primary even if a replica is configured, see routers_tests.py."""
+    settings.ARKLET_REPLICA_DATABASE = ""
+
+
+@dataclass
+class MintArkArgs:
+    """Django test client named arguments to test mint_ark.
+
+    Example use: client.post(**asdict(mint_ark_args))
+    """
+
+    path: str
+    data: dict
+    content_type: str
+    HTTP_AUTHORIZATION: str  # pylint: disable=invalid-name
+
+
+@pytest.fixture
+def mint_ark_args(naan, shoulder, auth) -> MintArkArgs:
+    """Create the happy path arguments for mint_ark in Django test client."""
+    return MintArkArgs(
+        path="/mint",
+        data={
+            "naan": naan.naan,
+            "shoulder": shoulder.shoulder,
+        },
+        content_type="application/json",
+        HTTP_AUTHORIZATION=auth,
+    )
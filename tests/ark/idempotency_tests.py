@@ -0,0 +1,93 @@
+"""Tests for ark/idempotency.py, Idempotency-Key support for minting."""
+
+from dataclasses import asdict
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ark.models import Ark, IdempotencyKey
+
+
+@pytest.fixture
+def keyed_mint(mint_ark_args):
+    args = asdict(mint_ark_args)
+    args["HTTP_IDEMPOTENCY_KEY"] = "mint-1"
+    return args
+
+
+@pytest.mark.django_db
+def test_retry_replays_response(client, keyed_mint) -> None:
+    first = client.post(**keyed_mint)
+    retry = client.post(**keyed_mint)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry["Idempotent-Replayed"] == "true"
+    assert Ark.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_first_request_adds_one_statement(client, mint_ark_args, keyed_mint) -> None:
+    """Recording the key needs no lookup, only the INSERT in the mint's transaction."""
+    client.post(**asdict(mint_ark_args))  # warm the key and registry caches
+    with CaptureQueriesContext(connection) as plain:
+        client.post(**asdict(mint_ark_args))
+    with CaptureQueriesContext(connection) as keyed:
+        client.post(**keyed_mint)
+
+    def statements(context):
+        return [q["sql"] for q in context.captured_queries if "SAVEPOINT" not in q["sql"]]
+
+    assert len(statements(keyed)) == len(statements(plain)) + 1
+    assert "ON CONFLICT" in statements(keyed)[-1]
+
+
+@pytest.mark.django_db
+def test_bulk_mint_retry(client, auth, naan, shoulder) -> None:
+    args = {
+        "path": "/bulk_mint",
+        "data": {"naan": naan.naan, "data": [{"shoulder": shoulder.shoulder}] * 3},
+        "content_type": "application/json",
+        "HTTP_AUTHORIZATION": auth,
+        "HTTP_IDEMPOTENCY_KEY": "bulk-1",
+    }
+    first = client.post(**args)
+    assert client.post(**args).json() == first.json()
+    assert Ark.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_reuse_for_other_request_is_refused(client, keyed_mint) -> None:
+    client.post(**keyed_mint)
+    keyed_mint["data"]["title"] = "something else"
+    assert client.post(**keyed_mint).status_code == 422
+    assert Ark.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_failures_are_not_stored(client, keyed_mint) -> None:
+    keyed_mint["data"]["shoulder"] = "/missing"
+    assert client.post(**keyed_mint).status_code == 400
+    assert not IdempotencyKey.objects.exists()
+
+
+@pytest.mark.django_db
+def test_expired_key_mints_again(client, settings, keyed_mint) -> None:
+    client.post(**keyed_mint)
+    IdempotencyKey.objects.update(created=timezone.now() - timedelta(days=2))
+    retry = client.post(**keyed_mint)
+    assert "Idempotent-Replayed" not in retry
+    assert Ark.objects.count() == 2
+
+    IdempotencyKey.objects.update(created=timezone.now() - timedelta(days=2))
+    call_command("purge_idempotency_keys")
+    assert not IdempotencyKey.objects.exists()
+
+
+@pytest.mark.django_db
+def test_key_too_long(client, keyed_mint) -> None:
+    keyed_mint["HTTP_IDEMPOTENCY_KEY"] = "k" * 256
+    assert client.post(**keyed_mint).status_code == 400
@@ -0,0 +1,139 @@
+"""Tests for the background job queue in ark/jobs.py."""
+
+import json
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from ark import jobs
+from ark.models import Ark, Job
+
+
+def ndjson(*records) -> bytes:
+    return b"".join(json.dumps(r).encode() + b"\n" for r in records)
+
+
+def submit(client, auth, operation, body, naan=1):
+    return client.post(
+        f"/jobs?naan={naan}&operation={operation}",
+        data=body,
+        content_type="application/x-ndjson",
+        HTTP_AUTHORIZATION=auth,
+    )
+
+
+def results(client, auth, job_id) -> list:
+    response = client.get(f"/jobs/{job_id}/results", HTTP_AUTHORIZATION=auth)
+    return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+
+def run_all(chunk_size=1000):
+    while (job := jobs.claim()) is not None:
+        jobs.run(job, chunk_size)
+
+
+@pytest.mark.django_db
+def test_mint_job(client, auth, shoulder) -> None:
+    records = [{"shoulder": shoulder.shoulder, "title": f"ARK {i}"} for i in range(5)]
+    response = submit(client, auth, "mint", ndjson(*records) + b"not json\n")
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    assert response["Location"] == f"/jobs/{job_id}"
+    assert response.json()["status"] == "queued"
+    assert response.json()["total"] == 6
+    assert not Ark.objects.exists()
+
+    run_all(chunk_size=2)
+
+    status = client.get(f"/jobs/{job_id}", HTTP_AUTHORIZATION=auth).json()
+    assert (status["status"], status["processed"], status["failed"]) == ("done", 6, 1)
+    lines = results(client, auth, job_id)
+    assert [r["line"] for r in lines] == list(range(1, 7))
+    assert lines[-1]["error"].startswith("invalid JSON")
+    assert Ark.objects.count() == 5
+    for result in lines[:-1]:
+        assert Ark.objects.get(ark=result["ark"]).title == result["title"]
+
+
+@pytest.mark.django_db
+def test_update_job(client, auth, ark) -> None:
+    body = ndjson({"ark": f"ark:/{ark.ark}", "title": "From a job"}, {"ark": "ark:/1/t2missing"})
+    job_id = submit(client, auth, "update", body).json()["id"]
+    run_all()
+    assert [r.get("error") for r in results(client, auth, job_id)] == [None, "not found"]
+    ark.refresh_from_db()
+    assert ark.title == "From a job"
+
+
+@pytest.mark.django_db
+def test_import_job(client, auth, ark) -> None:
+    body = ndjson(
+        {"ark": "ark:/1/t2imported", "shoulder": "/t2", "url": "https://example.com/imported"},
+        {"ark": f"ark:/{ark.ark}", "shoulder": "/t2"},
+        {"ark": "ark:/1/x9other", "shoulder": "/t2"},
+        {"ark": "ark:/1/t2imported", "shoulder": "/t2"},
+    )
+    job_id = submit(client, auth, "import", body).json()["id"]
+    run_all()
+    lines = results(client, auth, job_id)
+    assert lines[0]["ark"] == "1/t2imported"
+    assert [r.get("error") for r in lines[1:]] == ["already exists", "ARK is not on 1/t2", "already exists"]
+    imported = Ark.objects.get(ark="1/t2imported")
+    assert (imported.assigned_name, imported.url) == ("imported", "https://example.com/imported")
+
+
+@pytest.mark.django_db
+def test_resumes_from_checkpoint(client, auth, shoulder) -> None:
+    """A worker that dies mid-job leaves it to be resumed once its lease runs out."""
+    body = ndjson(*[{"shoulder": shoulder.shoulder}] * 5)
+    job_id = submit(client, auth, "mint", body).json()["id"]
+    job = jobs.claim()
+    assert jobs.run_chunk(job, 2)
+    assert jobs.claim() is None  # still leased
+
+    Job.objects.filter(id=job_id).update(leased_until=timezone.now() - timedelta(seconds=1))
+    resumed = jobs.claim()
+    assert resumed.processed == 2
+    jobs.run(resumed, 2)
+    assert Ark.objects.count() == 5
+    assert Job.objects.get(id=job_id).status == Job.DONE
+
+
+@pytest.mark.django_db
+def test_lost_lease_rolls_back_chunk(client, auth, shoulder) -> None:
+    job_id = submit(client, auth, "mint", ndjson({"shoulder": shoulder.shoulder})).json()["id"]
+    job = jobs.claim()
+    # Another worker resumed the job and got further
+    Job.objects.filter(id=job_id).update(processed=1)
+    with pytest.raises(jobs.LeaseLost):
+        jobs.run_chunk(job, 10)
+    assert not Ark.objects.exists()
+
+
+@pytest.mark.django_db
+def test_failed_job(client, auth, shoulder) -> None:
+    job_id = submit(client, auth, "mint", ndjson({"shoulder": shoulder.shoulder})).json()["id"]
+    with mock.patch.dict(jobs.PROCESSORS, {Job.MINT: mock.Mock(side_effect=ValueError("boom"))}):
+        run_all()
+    job = Job.objects.get(id=job_id)
+    assert (job.status, job.error, job.processed) == (Job.FAILED, "boom", 0)
+
+
+@pytest.mark.django_db
+def test_jobs_are_private_to_their_naan(client, auth, shoulder) -> None:
+    assert submit(client, auth, "mint", b"", naan=2).status_code == 403
+    assert submit(client, auth, "delete", b"").status_code == 400
+    job_id = submit(client, auth, "mint", b"").json()["id"]
+    assert client.get(f"/jobs/{job_id}").status_code == 403
+    assert client.get("/jobs/00000000-0000-0000-0000-000000000000", HTTP_AUTHORIZATION=auth).status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run_jobs_command(client, auth, shoulder) -> None:
+    job_id = submit(client, auth, "mint", ndjson(*[{"shoulder": shoulder.shoulder}] * 3)).json()["id"]
+    call_command("run_jobs", "--once")
+    assert Job.objects.get(id=job_id).status == Job.DONE
+    assert Ark.objects.count() == 3
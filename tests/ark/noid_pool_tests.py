@@ -0,0 +1,120 @@
+"""Tests for ark/noid_pool.py, the pools of pre-generated NOIDs."""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import asdict
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from ark import noid_pool
+from ark.models import Ark, PooledNoid
+from ark.utils import BETANUMERIC, parse_ark
+
+
+@pytest.fixture
+def pooled(settings, shoulder):
+    """A short NOID length with a pool big enough for the tests' mints."""
+    settings.ARKLET_NOID_LENGTH = 2
+    settings.ARKLET_NOID_POOL_SIZE = 500
+    noid_pool.refill(shoulder, 500)
+    return shoulder
+
+
+def collisions(caplog):
+    return [r for r in caplog.records if "collision" in r.getMessage()]
+
+
+@pytest.mark.django_db
+def test_refill_skips_existing_arks(settings, naan, shoulder, caplog) -> None:
+    """Pooled NOIDs never belong to an existing ARK, even when few are left."""
+    settings.ARKLET_NOID_LENGTH = 1
+    Ark.create(naan, shoulder, "x").save()
+    assert noid_pool.refill(shoulder, 100) == len(BETANUMERIC) - 1
+    assert "x" not in PooledNoid.objects.values_list("noid", flat=True)
+    assert any("Could only fill" in r.getMessage() for r in caplog.records)
+    # A full pool isn't topped up again
+    assert noid_pool.refill(shoulder, 10) == 0
+
+
+@pytest.mark.django_db
+def test_claims_are_disjoint(pooled) -> None:
+    first = PooledNoid.claim(pooled, 300)
+    second = PooledNoid.claim(pooled, 300)
+    assert len(first) == 300 and len(second) == 200
+    assert not set(first) & set(second)
+    assert PooledNoid.claim(pooled, 1) == []
+
+
+@pytest.mark.django_db
+def test_mints_from_pool_without_retries(client, caplog, mint_ark_args, pooled) -> None:
+    """With 500 of the 841 two character NOIDs pooled, 400 mints never collide."""
+    arks = [client.post(**asdict(mint_ark_args)).json()["ark"] for _ in range(400)]
+    assert len(set(arks)) == 400
+    assert not collisions(caplog)
+    assert PooledNoid.objects.count() == 100
+
+
+@pytest.mark.django_db
+def test_bulk_mint_from_pool(client, auth, naan, pooled) -> None:
+    res = client.post(
+        "/bulk_mint",
+        data={"naan": naan.naan, "data": [{"shoulder": pooled.shoulder}] * 100},
+        content_type="application/json",
+        HTTP_AUTHORIZATION=auth,
+    )
+    assert len(res.json()["arks_created"]) == 100
+    assert PooledNoid.objects.count() == 400
+
+
+@pytest.mark.django_db
+def test_refill_command(settings, shoulder) -> None:
+    call_command("refill_noid_pool", "--size", "50")
+    assert PooledNoid.objects.filter(shoulder=shoulder).count() == 50
+
+
+@pytest.mark.django_db
+def test_refill_skips_locked_shoulder(monkeypatch, shoulder) -> None:
+    """A worker leaves the pool alone while another one refills it."""
+    monkeypatch.setattr(noid_pool, "_refill_lock", lambda _: nullcontext(False))
+    assert noid_pool.refill(shoulder, 50) == 0
+    assert not PooledNoid.objects.exists()
+
+
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="advisory locks need Postgres")
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_refills_fill_pool_once(settings, shoulder) -> None:
+    """Workers refilling the same pool at once don't overfill it."""
+    settings.ARKLET_NOID_LENGTH = 4
+
+    def refill(_):
+        try:
+            return noid_pool.refill(shoulder, 1000)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(refill, range(8)))
+    assert PooledNoid.objects.filter(shoulder=shoulder).count() == 1000
+
+
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="SKIP LOCKED needs Postgres")
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_minters(client, caplog, settings, mint_ark_args, shoulder) -> None:
+    """Many threads minting at once on three character NOIDs never collide."""
+    settings.ARKLET_NOID_LENGTH = 3
+    settings.ARKLET_NOID_POOL_SIZE = 2000
+    noid_pool.refill(shoulder, 2000)
+
+    def mint(_):
+        try:
+            return [client.post(**asdict(mint_ark_args)).json()["ark"] for _ in range(100)]
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(16) as pool:
+        arks = [ark for batch in pool.map(mint, range(16)) for ark in batch]
+    assert len(set(arks)) == len(arks) == 1600
+    assert all(len(parse_ark(ark)[2]) == len("t2") + 4 for ark in arks)
+    assert not collisions(caplog)
@@ -0,0 +1,52 @@
+"""Tests for NOID generation and check digits in ark/utils.py."""
+
+import random
+from collections import Counter
+
+import pytest
+from django.core.management import call_command
+
+from ark.models import Ark
+from ark.utils import (
+    BETANUMERIC,
+    _NOID_ALPHABET,
+    _REJECTED_BYTES,
+    generate_noids,
+    noid_check_digit,
+    noid_check_digits,
+)
+
+
+def test_check_digit_matches_noid_spec() -> None:
+    """The worked example from the Noid documentation."""
+    assert noid_check_digit("13030/xf93gt2") == "q"
+    assert noid_check_digits("13030/", ["xf93gt2"]) == ["q"]
+
+
+def test_batch_check_digits_match() -> None:
+    rng = random.Random(0)
+    for prefix in ["13030/", "1/t2", "99999/x9/", "12345/é5"]:
+        noids = ["".join(rng.choices(BETANUMERIC, k=rng.randint(1, 25))) for _ in range(500)]
+        assert noid_check_digits(prefix, noids) == [noid_check_digit(prefix + n) for n in noids]
+
+
+def test_generate_noids() -> None:
+    noids = generate_noids(1000, 8)
+    assert len(noids) == 1000
+    assert all(len(noid) == 8 and set(noid) <= set(BETANUMERIC) for noid in noids)
+    assert generate_noids(0, 8) == []
+
+
+def test_byte_mapping_is_unbiased() -> None:
+    """Every accepted byte value maps to a character, each character equally often."""
+    accepted = bytes(range(256)).translate(_NOID_ALPHABET, _REJECTED_BYTES)
+    assert len(accepted) % len(BETANUMERIC) == 0
+    assert set(Counter(accepted.decode()).values()) == {len(accepted) // len(BETANUMERIC)}
+
+
+@pytest.mark.django_db
+def test_mintarks(naan, shoulder) -> None:
+    call_command("mintarks", "25", str(naan.naan), shoulder.shoulder)
+    for ark in Ark.objects.all():
+        assert ark.ark == f"{naan.naan}{shoulder.shoulder}{ark.assigned_name}"
+        assert ark.assigned_name[-1] == noid_check_digit(ark.ark[:-1])
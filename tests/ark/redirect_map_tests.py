@@ -0,0 +1,86 @@
+"""Tests for ark/redirect_map.py, the nginx redirect map export."""
+
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from ark import redirect_map
+from ark.models import Ark
+
+
+def read_map(path):
+    return path.read_text().splitlines()
+
+
+@pytest.mark.django_db
+def test_full_export_writes_bound_arks(tmp_path, ark, bound_ark) -> None:
+    """Only bound ARKs are exported and the delta starts empty."""
+    call_command("export_redirect_map", str(tmp_path))
+    assert read_map(tmp_path / redirect_map.BASE) == [
+        f'"{bound_ark.ark}" "{bound_ark.url}";'
+    ]
+    assert read_map(tmp_path / redirect_map.DELTA) == []
+    assert [p.name for p in tmp_path.iterdir() if p.name.startswith(".tmp")] == []
+
+
+@pytest.mark.django_db
+def test_full_export_streams_in_chunks(tmp_path, naan, shoulder) -> None:
+    Ark.objects.bulk_create(
+        Ark(
+            ark=f"{naan.naan}{shoulder.shoulder}{i:04}",
+            naan=naan,
+            shoulder=shoulder,
+            assigned_name=f"{i:04}",
+            url=f"https://example.com/{i}",
+        )
+        for i in range(25)
+    )
+    counts = redirect_map.export_full(tmp_path, timedelta(0), chunk_size=10)
+    assert counts["exported"] == 25
+    assert len(read_map(tmp_path / redirect_map.BASE)) == 25
+
+
+@pytest.mark.django_db
+def test_unsafe_entries_are_left_to_arklet(tmp_path, bound_ark) -> None:
+    """URLs nginx would mangle aren't exported, and fall through in the delta."""
+    bound_ark.url = "https://example.com/$price"
+    bound_ark.save()
+    counts = redirect_map.export_full(tmp_path, timedelta(seconds=300))
+    assert counts == {"exported": 0, "fall_through": 0, "skipped": 1}
+    assert read_map(tmp_path / redirect_map.BASE) == []
+
+    redirect_map.export_delta(tmp_path)
+    assert read_map(tmp_path / redirect_map.DELTA) == [f'"{bound_ark.ark}" "-";']
+
+
+@pytest.mark.django_db
+def test_incremental_export_covers_changes(tmp_path, naan, shoulder, bound_ark) -> None:
+    """The delta holds ARKs changed since the full export, including unbound ones."""
+    redirect_map.export_full(tmp_path, timedelta(0))
+    # Nothing modified after the full export started
+    Ark.objects.filter(pk=bound_ark.pk).update(modified=timezone.now() - timedelta(hours=1))
+    call_command("export_redirect_map", str(tmp_path), "--incremental")
+    assert read_map(tmp_path / redirect_map.DELTA) == []
+
+    bound_ark.url = ""
+    bound_ark.save()
+    new = Ark.objects.create(
+        ark=f"{naan.naan}{shoulder.shoulder}new",
+        naan=naan,
+        shoulder=shoulder,
+        assigned_name="new",
+        url="https://example.com/new",
+    )
+    call_command("export_redirect_map", str(tmp_path), "--incremental")
+    assert read_map(tmp_path / redirect_map.DELTA) == [
+        f'"{bound_ark.ark}" "-";',
+        f'"{new.ark}" "{new.url}";',
+    ]
+
+
+def test_incremental_export_needs_full_export(tmp_path) -> None:
+    with pytest.raises(CommandError):
+        call_command("export_redirect_map", str(tmp_path), "--incremental")
@@ -0,0 +1,78 @@
+"""Tests for ark/registry.py, the in-memory NAANs and shoulders."""
+
+from dataclasses import asdict
+
+import pytest
+
+from ark import registry
+from ark.models import Ark, Naan, Shoulder
+
+
+@pytest.fixture
+def other_naan(db):
+    """A second NAAN that has a shoulder with the same name as the initial one."""
+    naan = Naan.objects.create(
+        naan=2, name="Other", description="Another NAAN", url="https://example.org"
+    )
+    Shoulder.objects.create(shoulder="/t2", naan=naan, name="Other", description="")
+    return naan
+
+
+@pytest.mark.django_db
+def test_shoulder_is_scoped_to_naan(client, mint_ark_args, other_naan) -> None:
+    """mint_ark uses the shoulder of the authorized NAAN, not another one's."""
+    res = client.post(**asdict(mint_ark_args))
+    assert res.status_code == 200
+    ark = Ark.objects.get(ark=res.json()["ark"][len("ark:/"):])
+    assert ark.shoulder.naan_id == mint_ark_args.data["naan"]
+
+
+@pytest.mark.django_db
+def test_other_naans_shoulder_is_rejected(client, mint_ark_args, other_naan) -> None:
+    """A shoulder that only exists under another NAAN can't be used."""
+    Shoulder.objects.create(shoulder="/x9", naan=other_naan, name="Other", description="")
+    mint_ark_args.data["shoulder"] = "/x9"
+    res = client.post(**asdict(mint_ark_args))
+    assert res.status_code == 400
+
+
+@pytest.mark.django_db
+def test_new_shoulder_is_picked_up(
+    client, naan, mint_ark_args, django_capture_on_commit_callbacks
+) -> None:
+    """Committing a Shoulder refreshes the registry right away."""
+    assert registry.get_shoulder(naan.naan, "/n1") is None
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        Shoulder.objects.create(shoulder="/n1", naan=naan, name="New", description="")
+        # Not before the commit
+        assert registry.get_shoulder(naan.naan, "/t2") is not None
+        assert registry._snapshot is not None  # pylint: disable=protected-access
+    assert callbacks
+    assert registry._snapshot is None  # pylint: disable=protected-access
+    mint_ark_args.data["shoulder"] = "/n1"
+    res = client.post(**asdict(mint_ark_args))
+    assert res.status_code == 200
+
+
+@pytest.mark.django_db
+def test_miss_reloads_registry(client, naan, mint_ark_args, monkeypatch) -> None:
+    """A shoulder created in another worker is found without the invalidation bus."""
+    assert registry.get_shoulder(naan.naan, "/n1") is None
+    # Saved elsewhere: this worker never hears about it
+    Shoulder.objects.create(shoulder="/n1", naan=naan, name="New", description="")
+    mint_ark_args.data["shoulder"] = "/n1"
+    monkeypatch.setattr(registry, "MISS_RELOAD_INTERVAL", 3600)
+    assert client.post(**asdict(mint_ark_args)).status_code == 400
+    monkeypatch.setattr(registry, "MISS_RELOAD_INTERVAL", 0)
+    assert client.post(**asdict(mint_ark_args)).status_code == 200
+
+
+@pytest.mark.django_db
+def test_naan_url_change_drops_cached_misses(client, naan, django_capture_on_commit_callbacks) -> None:
+    """Cached fallback redirects follow a change to the NAAN URL."""
+    client.get(f"/ark:/{naan.naan}/t2missing")
+    naan.url = "https://example.net"
+    with django_capture_on_commit_callbacks(execute=True):
+        naan.save()
+    res = client.get(f"/ark:/{naan.naan}/t2missing")
+    assert res["Location"] == f"https://example.net/ark:/{naan.naan}/t2missing"
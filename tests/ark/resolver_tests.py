@@ -0,0 +1,231 @@
+"""Tests for ark/resolver.py, the resolution caches in front of the database."""
+
+import json
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.db import transaction
+from django.http import Http404
+
+from ark import resolver, views
+from ark.models import Ark
+from ark.resolver import resolution_cache
+from ark.utils import noid_check_digit
+
+
+@pytest.fixture
+def shared_cache(settings):
+    """Enable a shared resolution cache backed by local memory."""
+    settings.CACHES = {
+        **settings.CACHES,
+        "resolver": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "resolver-tests",
+        },
+    }
+    settings.ARKLET_RESOLVER_SHARED_CACHE = "resolver"
+    caches["resolver"].clear()
+    resolver.shared_stats.update(hits=0, misses=0)
+    return caches["resolver"]
+
+
+class TestSharedCache:
+    """Workers share resolved redirects through a Django cache."""
+
+    @pytest.mark.django_db
+    def test_other_worker_hits_shared_cache(
+        self, client, shared_cache, bound_ark, django_assert_num_queries
+    ) -> None:
+        """A worker with a cold local cache is answered from the shared cache."""
+        client.get(f"/ark:/{bound_ark.ark}")
+        # Given another worker whose local cache is empty
+        resolution_cache.clear()
+        with django_assert_num_queries(0):
+            res = client.get(f"/ark:/{bound_ark.ark}")
+        assert res["Location"].startswith(bound_ark.url)
+        assert resolver.cache_stats()["shared"]["hits"] == 1
+
+    @pytest.mark.django_db
+    def test_update_invalidates_shared_entry(
+        self, client, auth, shared_cache, bound_ark, django_capture_on_commit_callbacks
+    ) -> None:
+        """update_ark bumps the shared generation so other workers miss."""
+        client.get(f"/ark:/{bound_ark.ark}")
+        with django_capture_on_commit_callbacks(execute=True):
+            client.put(
+                "/update",
+                data={"ark": f"ark:/{bound_ark.ark}", "url": "https://example.com/second"},
+                content_type="application/json",
+                HTTP_AUTHORIZATION=auth,
+            )
+        resolution_cache.clear()
+        res = client.get(f"/ark:/{bound_ark.ark}")
+        assert res["Location"].startswith("https://example.com/second")
+
+    @pytest.mark.django_db
+    def test_lookup_during_update_transaction(
+        self, shared_cache, bound_ark, django_capture_on_commit_callbacks
+    ) -> None:
+        """A URL read while an update is uncommitted isn't served after the commit."""
+        old_url = bound_ark.url
+        with django_capture_on_commit_callbacks(execute=True):
+            with transaction.atomic():
+                bound_ark.url = "https://example.com/second"
+                bound_ark.save()
+                # Given a worker that still reads the old row from the database
+                _, generation = resolver.lookup(bound_ark.ark)
+                resolver.remember(bound_ark.ark, old_url, generation)
+        # Then once the update commits other workers don't see the old URL
+        resolution_cache.clear()
+        assert resolver.lookup(bound_ark.ark)[0] is None
+
+    @pytest.mark.django_db
+    def test_stale_write_is_ignored(self, shared_cache, django_capture_on_commit_callbacks) -> None:
+        """A URL read before an invalidation is never served afterwards."""
+        # Given a worker that missed and went to the database
+        _, generation = resolver.lookup("1/t2x")
+        # When the ARK is updated before that worker caches what it read
+        with django_capture_on_commit_callbacks(execute=True):
+            resolver.invalidate("1/t2x")
+        resolver.remember("1/t2x", "https://example.com/stale", generation)
+        # Then other workers don't see the stale URL
+        resolution_cache.clear()
+        assert resolver.lookup("1/t2x")[0] is None
+
+    def test_disabled_by_default(self) -> None:
+        """Without ARKLET_RESOLVER_SHARED_CACHE only the local cache is used."""
+        assert resolver.lookup("1/t2x") == (None, None)
+        assert "shared" not in resolver.cache_stats()
+
+
+class TestNegativeCache:
+    """Repeated misses are answered from memory until the ARK is minted."""
+
+    @pytest.fixture(autouse=True)
+    def enabled(self, monkeypatch):
+        """Off by default without an invalidation channel, see settings.py."""
+        monkeypatch.setattr(resolver.negative_cache, "maxsize", 10000)
+
+    @pytest.mark.django_db
+    def test_repeat_miss_skips_database(
+        self, client, naan, django_assert_num_queries
+    ) -> None:
+        """The second resolution of an unknown ARK doesn't query."""
+        client.get(f"/ark:/{naan.naan}/t2missing")
+        with django_assert_num_queries(0):
+            res = client.get(f"/ark:/{naan.naan}/t2missing")
+        assert res["Location"] == f"{naan.url}/ark:/{naan.naan}/t2missing"
+        assert resolver.cache_stats()["negative"]["hits"] == 1
+
+    @pytest.mark.django_db
+    def test_cached_miss_is_404_for_info(self, client, naan) -> None:
+        """A cached miss still answers ?info with a 404."""
+        client.get(f"/ark:/{naan.naan}/t2missing")
+        assert client.get(f"/ark:/{naan.naan}/t2missing?info").status_code == 404
+
+    @pytest.mark.django_db
+    def test_minting_prefix_evicts_miss(self, client, naan, shoulder) -> None:
+        """Creating an ARK that is a prefix of a cached miss evicts it."""
+        client.get(f"/ark:/{naan.naan}/t2new/page/1")
+        Ark.objects.create(
+            ark=f"{naan.naan}/t2new",
+            naan=naan,
+            shoulder=shoulder,
+            assigned_name="new",
+            url="https://example.com/new",
+        )
+        res = client.get(f"/ark:/{naan.naan}/t2new/page/1")
+        assert res["Location"] == "https://example.com/new/page/1"
+
+    @pytest.mark.django_db
+    @patch("ark.models.generate_noids", return_value=["abcd"])
+    def test_bulk_mint_evicts_miss(self, _, client, auth, naan, shoulder) -> None:
+        """batch_mint_arks evicts cached misses for the ARKs it creates."""
+        ark_str = f"{naan.naan}{shoulder.shoulder}abcd"
+        ark_str += noid_check_digit(ark_str)
+        client.get(f"/ark:/{ark_str}")
+        client.post(
+            "/bulk_mint",
+            data={"naan": naan.naan, "data": [{"shoulder": shoulder.shoulder, "url": "https://example.com/m"}]},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=auth,
+        )
+        res = client.get(f"/ark:/{ark_str}")
+        assert res["Location"].startswith("https://example.com/m")
+
+
+@pytest.fixture
+def resolver_profile(settings):
+    """Serve requests with the middleware and URLs of arklet.settings_resolver."""
+    # pylint: disable=import-outside-toplevel
+    from arklet import settings_resolver
+
+    settings.MIDDLEWARE = settings_resolver.MIDDLEWARE
+    settings.TEMPLATES = settings_resolver.TEMPLATES
+    settings.ROOT_URLCONF = settings_resolver.ROOT_URLCONF
+
+
+class TestResolverProfile:
+    """The resolver-only application serves resolution without the admin stack."""
+
+    @pytest.mark.django_db
+    def test_redirects(self, client, resolver_profile, bound_ark) -> None:
+        """ARKs resolve with the minimal middleware chain."""
+        res = client.get(f"/ark:/{bound_ark.ark}")
+        assert res["Location"].startswith(bound_ark.url)
+
+    @pytest.mark.django_db
+    def test_renders_info(self, client, resolver_profile, bound_ark) -> None:
+        """?info renders without the auth and messages context processors."""
+        res = client.get(f"/ark:/{bound_ark.ark}?info")
+        assert res.status_code == 200
+        assert bound_ark.ark in res.content.decode()
+
+    def test_has_no_minter_endpoints(self, client, resolver_profile) -> None:
+        """The minter endpoints and the admin aren't routed."""
+        assert client.post("/mint").status_code == 404
+        assert client.get("/admin/").status_code == 404
+
+
+def resolve_async(rf, path):
+    request = rf.get(path)
+    return async_to_sync(views.aresolve_ark)(request, path.split("?")[0].lstrip("/"))
+
+
+class TestAsyncResolve:
+    """aresolve_ark answers like resolve_ark when served under ASGI."""
+
+    @pytest.mark.django_db
+    def test_redirects_and_caches(
+        self, rf, bound_ark, warm_registry, django_assert_num_queries
+    ) -> None:
+        """The redirect is read once, then served from the local cache."""
+        res = resolve_async(rf, f"/ark:/{bound_ark.ark}?a=1")
+        assert res["Location"] == f"{bound_ark.url}?a=1"
+        with django_assert_num_queries(0):
+            res = resolve_async(rf, f"/ark:/{bound_ark.ark}")
+        assert res["Location"].startswith(bound_ark.url)
+
+    @pytest.mark.django_db
+    def test_renders_info_and_json(self, rf, bound_ark) -> None:
+        res = resolve_async(rf, f"/ark:/{bound_ark.ark}?info")
+        assert res.status_code == 200
+        assert bound_ark.ark in res.content.decode()
+        res = resolve_async(rf, f"/ark:/{bound_ark.ark}?json")
+        assert json.loads(res.content)["url"]["value"] == bound_ark.url
+
+    @pytest.mark.django_db
+    def test_renders_unbound_ark(self, rf, ark) -> None:
+        res = resolve_async(rf, f"/ark:/{ark.ark}")
+        assert res.status_code == 200
+
+    @pytest.mark.django_db
+    def test_prefix_and_fallback(self, rf, bound_ark, naan) -> None:
+        res = resolve_async(rf, f"/ark:/{bound_ark.ark}/page/2")
+        assert res["Location"] == f"{bound_ark.url}/page/2"
+        res = resolve_async(rf, f"/ark:/{naan.naan}/unknown")
+        assert res["Location"] == f"{naan.url}/ark:/{naan.naan}/unknown"
+        with pytest.raises(Http404):
+            resolve_async(rf, f"/ark:/{naan.naan}/unknown?json")
@@ -0,0 +1,99 @@
+"""Tests for ark/routers.py, the read replica router."""
+
+from dataclasses import asdict
+from unittest.mock import patch
+
+import pytest
+from django.conf import settings as django_settings
+from django.core.management import call_command
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from ark import routers
+from ark.models import Ark
+from ark.routers import ReplicaRouter, replica_reads
+
+
+@pytest.fixture
+def replica(settings):
+    """Route replica reads to an alias that shares the default test database."""
+    settings.DATABASE_ROUTERS = ["ark.routers.ReplicaRouter"]
+    settings.ARKLET_REPLICA_DATABASE = "default"
+    reads = []
+
+    def db_for_read(self, model, **hints):
+        reads.append(routers._replica_reads.get())  # pylint: disable=protected-access
+        return "default"
+
+    with patch.object(ReplicaRouter, "db_for_read", db_for_read):
+        yield reads
+
+
+def test_routing(settings) -> None:
+    settings.ARKLET_REPLICA_DATABASE = "replica"
+    router = ReplicaRouter()
+    assert router.db_for_read(Ark) == "default"
+    with replica_reads():
+        assert router.db_for_read(Ark) == "replica"
+        assert router.db_for_write(Ark) == "default"
+        # Reads after a write see it on the primary
+        assert router.db_for_read(Ark) == "default"
+    with replica_reads():
+        assert router.db_for_read(Ark) == "replica"
+    assert router.allow_migrate("replica", "ark") is False
+
+
+def test_no_replica_configured() -> None:
+    with replica_reads():
+        assert ReplicaRouter().db_for_read(Ark) == "default"
+
+
+@pytest.mark.django_db
+def test_resolution_reads_from_replica(client, replica, bound_ark) -> None:
+    client.get(f"/ark:/{bound_ark.ark}?info")
+    assert replica and all(replica)
+
+
+@pytest.mark.django_db
+def test_cached_lookups_read_from_primary(client, replica, bound_ark) -> None:
+    """Redirects and misses are cached, so a lagging replica mustn't answer them."""
+    client.get(f"/ark:/{bound_ark.ark}")
+    client.get(f"/ark:/{bound_ark.ark}/missing")
+    assert replica and not any(replica)
+
+
+@pytest.mark.django_db
+def test_bulk_query_reads_from_replica(client, replica, bound_ark) -> None:
+    client.post("/bulk_query", data=[{"ark": f"ark:/{bound_ark.ark}"}], content_type="application/json")
+    assert replica and all(replica)
+
+
+@pytest.mark.django_db
+def test_count_arks_reads_from_replica(replica, naan, ark) -> None:
+    call_command("count_arks", naan.naan)
+    assert replica and all(replica)
+
+
+@pytest.mark.django_db
+def test_minting_stays_on_primary(client, replica, mint_ark_args) -> None:
+    client.post(**asdict(mint_ark_args))
+    assert replica and not any(replica)
+
+
+@pytest.mark.skipif(
+    "replica" not in django_settings.DATABASES,
+    reason="set ARKLET_POSTGRES_REPLICA_HOST to run against a replica",
+)
+@pytest.mark.django_db(transaction=True, databases=["default", "replica"])
+def test_replica_end_to_end(client, settings, bound_ark, mint_ark_args) -> None:
+    """With a real replica configured, resolution queries run on its connection."""
+    settings.ARKLET_REPLICA_DATABASE = "replica"
+    with CaptureQueriesContext(connections["replica"]) as on_replica:
+        with CaptureQueriesContext(connections["default"]) as on_primary:
+            assert client.get(f"/ark:/{bound_ark.ark}?json").status_code == 200
+    assert on_replica.captured_queries
+    assert not on_primary.captured_queries
+
+    with CaptureQueriesContext(connections["replica"]) as on_replica:
+        assert client.post(**asdict(mint_ark_args)).status_code == 200
+    assert not on_replica.captured_queries
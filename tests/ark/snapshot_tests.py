@@ -0,0 +1,166 @@
+"""Tests for ark/snapshot.py, the memory-mapped resolver snapshot."""
+
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.db import OperationalError
+
+from ark import snapshot
+from ark.models import Ark, DeletedArk
+
+
+def make_ark(naan, shoulder, name, url=""):
+    return Ark.objects.create(
+        ark=f"{naan.naan}{shoulder.shoulder}{name}",
+        naan=naan,
+        shoulder=shoulder,
+        assigned_name=name,
+        url=url,
+    )
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, settings, naan, shoulder, bound_ark):
+    """A snapshot of bound_ark, a prefix ARK and an unbound one, in use by the resolver."""
+    make_ark(naan, shoulder, f"{bound_ark.assigned_name}/ch", "https://example.com/ch")
+    make_ark(naan, shoulder, "unbound")
+    make_ark(naan, shoulder, "é", "https://example.com/é")
+    path = tmp_path / "arks.snapshot"
+    call_command("export_resolver_snapshot", str(path), "--chunk-size", "2")
+    settings.ARKLET_RESOLVER_SNAPSHOT = str(path)
+    return path
+
+
+@pytest.mark.django_db
+def test_lookups(snapshot_path, naan, shoulder, bound_ark) -> None:
+    """Exact ARKs, longest prefixes and NAAN fallbacks come from the file."""
+    snap = snapshot.Snapshot(snapshot_path)
+    assert snap.size == 4
+    assert snap.get(bound_ark.ark) == bound_ark.url
+    assert snap.get(f"{naan.naan}{shoulder.shoulder}unbound") == ""
+    assert snap.get(f"{naan.naan}{shoulder.shoulder}é") == "https://example.com/é"
+    assert snap.get(f"{naan.naan}{shoulder.shoulder}missing") is None
+    assert snap.get("0/") is None
+    assert snap.get("99999999/z") is None
+
+    identifier = bound_ark.ark.split("/", 1)[1]
+    assert snap.best_match(naan.naan, f"{identifier}/ch/page/1") == (
+        naan.url, f"{bound_ark.ark}/ch", "https://example.com/ch"
+    )
+    assert snap.best_match(naan.naan, f"{identifier}/other") == (
+        naan.url, bound_ark.ark, bound_ark.url
+    )
+    assert snap.best_match(naan.naan, "nothing") == (naan.url, None, None)
+    assert snap.best_match(12345, "nothing") is None
+
+
+@pytest.mark.django_db
+def test_binary_search(tmp_path, naan, shoulder) -> None:
+    """Every ARK is found among ARKs that are prefixes of one another."""
+    names = ["a", "ab", "abc", "abd", "abd0", "ac", "b", "bé", "bz", "z"]
+    arks = {make_ark(naan, shoulder, name, f"https://example.com/{name}").ark: name for name in names}
+    path = tmp_path / "arks.snapshot"
+    snapshot.write(path)
+    snap = snapshot.Snapshot(path)
+    for ark, name in arks.items():
+        assert snap.get(ark) == f"https://example.com/{name}"
+        assert snap.get(f"{ark}0") is None or f"{ark}0" in arks
+    for missing in ["aa", "abb", "abe", "abd00", "bb", "c", "zz", ""]:
+        assert snap.get(f"{naan.naan}{shoulder.shoulder}{missing}") is None
+
+
+@pytest.mark.django_db
+def test_resolves_without_queries(
+    client, snapshot_path, bound_ark, django_assert_num_queries
+) -> None:
+    """Once the changed set is loaded, unchanged ARKs need no query."""
+    snapshot.refresh()
+    with django_assert_num_queries(0):
+        res = client.get(f"/ark:/{bound_ark.ark}/other")
+    assert res["Location"] == f"{bound_ark.url}/other"
+
+
+@pytest.mark.django_db
+def test_changes_after_snapshot_go_to_database(
+    client, snapshot_path, naan, shoulder, bound_ark
+) -> None:
+    """ARKs updated or minted after the snapshot are read from the database."""
+    snapshot.refresh()
+    bound_ark.url = "https://example.com/second"
+    bound_ark.save()
+    assert client.get(f"/ark:/{bound_ark.ark}")["Location"].startswith(
+        "https://example.com/second"
+    )
+    new = make_ark(naan, shoulder, f"{bound_ark.assigned_name}/new", "https://example.com/new")
+    assert client.get(f"/ark:/{new.ark}/x")["Location"] == "https://example.com/new/x"
+
+    # The next refresh finds both through their modified timestamps
+    snapshot.reset()
+    snapshot.refresh()
+    assert snapshot.stats()["changed_since"] == 2
+
+
+@pytest.mark.django_db
+def test_deletions_after_snapshot_go_to_database(client, snapshot_path, naan, bound_ark) -> None:
+    """A worker that never heard of a deletion still stops answering from the file."""
+    ark_str = bound_ark.ark
+    bound_ark.delete()
+    # Given a worker started after the deletion, without the bus
+    snapshot.reset()
+    snapshot.refresh()
+    assert snapshot.stats()["changed_since"] == 1
+    assert client.get(f"/ark:/{ark_str}")["Location"] == f"{naan.url}/ark:/{ark_str}"
+
+
+@pytest.mark.django_db
+def test_export_forgets_old_deletions(tmp_path, bound_ark) -> None:
+    """Deletions are kept for hosts on older snapshots, then forgotten."""
+    bound_ark.delete()
+    path = str(tmp_path / "arks.snapshot")
+    call_command("export_resolver_snapshot", path)
+    assert DeletedArk.objects.count() == 1
+    call_command("export_resolver_snapshot", path, "--keep-deleted", "0")
+    assert not DeletedArk.objects.exists()
+
+
+@pytest.mark.django_db
+def test_database_outage_falls_back_to_snapshot(client, snapshot_path, bound_ark) -> None:
+    """Until the changed set is loaded lookups hit the database, unless it is down."""
+    with patch("ark.resolver._db_best_match", side_effect=OperationalError):
+        res = client.get(f"/ark:/{bound_ark.ark}")
+    assert res["Location"].startswith(bound_ark.url)
+
+
+@pytest.mark.django_db
+def test_replaced_file_is_reopened(snapshot_path, naan, shoulder) -> None:
+    snapshot.refresh()
+    make_ark(naan, shoulder, "later", "https://example.com/later")
+    snapshot.write(snapshot_path)
+    snapshot.refresh()
+    snap, changed = snapshot.current()
+    assert snap.get(f"{naan.naan}{shoulder.shoulder}later") == "https://example.com/later"
+    # ARKs this worker saw written go to the database until the next refresh
+    assert changed == {f"{naan.naan}{shoulder.shoulder}later"}
+    snapshot.refresh()
+    assert snapshot.current()[1] == set()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("contents", [None, b"", b"ARKSNAP\x00 not really"])
+def test_unusable_file_falls_back_to_database(
+    client, tmp_path, settings, caplog, bound_ark, contents
+) -> None:
+    """A missing or corrupt snapshot is logged once and the database is used."""
+    path = tmp_path / "arks.snapshot"
+    if contents is not None:
+        path.write_bytes(contents)
+    settings.ARKLET_RESOLVER_SNAPSHOT = str(path)
+    for _ in range(2):
+        assert client.get(f"/ark:/{bound_ark.ark}")["Location"].startswith(bound_ark.url)
+    assert len([r for r in caplog.records if "resolver snapshot" in r.getMessage()]) == 1
+
+    # The file is tried again once the refresh interval has passed
+    snapshot.write(path)
+    settings.ARKLET_RESOLVER_SNAPSHOT_REFRESH = 0
+    assert snapshot.current()[0].get(bound_ark.ark) == bound_ark.url
@@ -0,0 +1,120 @@
+"""Tests for the newline-delimited JSON bulk endpoints in ark/streaming.py."""
+
+import gzip
+import json
+
+import pytest
+
+from ark.models import Ark
+
+
+def ndjson(*records) -> bytes:
+    return b"".join(json.dumps(r).encode() + b"\n" for r in records)
+
+
+def results(response) -> list:
+    body = b"".join(response.streaming_content)
+    if response.get("Content-Encoding") == "gzip":
+        body = gzip.decompress(body)
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def post(client, path, body, **extra):
+    return client.post(path, data=body, content_type="application/x-ndjson", **extra)
+
+
+@pytest.mark.django_db
+def test_query(client, ark) -> None:
+    body = ndjson({"ark": f"ark:/{ark.ark}"}, {"ark": "ark:/1/t2missing"}, {"nope": 1})
+    response = post(client, "/stream/query", body)
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/x-ndjson"
+    lines = results(response)
+    assert [r["line"] for r in lines] == [1, 2, 3]
+    assert lines[0]["ark"] == ark.ark
+    assert lines[1]["error"] == "not found"
+    assert "error" in lines[2]
+
+
+@pytest.mark.django_db
+def test_invalid_lines_are_reported(client, ark) -> None:
+    body = b'{"ark": "ark:/1/t212346"}\n\nnot json\n[1, 2]\n'
+    lines = results(post(client, "/stream/query", body))
+    assert [r["line"] for r in lines] == [1, 3, 4]
+    assert "ark" in lines[0] and "error" not in lines[0]
+    assert lines[1]["error"].startswith("invalid JSON")
+    assert lines[2]["error"] == "each line must be a JSON object"
+
+
+@pytest.mark.django_db
+def test_gzip_request_and_response(client, ark) -> None:
+    body = gzip.compress(ndjson({"ark": f"ark:/{ark.ark}"}))
+    response = post(client, "/stream/query", body, HTTP_CONTENT_ENCODING="gzip", HTTP_ACCEPT_ENCODING="gzip, br")
+    assert response["Content-Encoding"] == "gzip"
+    assert results(response)[0]["ark"] == ark.ark
+
+
+@pytest.mark.django_db
+def test_truncated_gzip_body(client, ark) -> None:
+    body = gzip.compress(ndjson(*[{"ark": f"ark:/{ark.ark}"}] * 100))[:-20]
+    lines = results(post(client, "/stream/query", body, HTTP_CONTENT_ENCODING="gzip"))
+    assert lines[-1]["line"] is None
+    assert "error" in lines[-1]
+
+
+@pytest.mark.django_db
+def test_update(client, auth, ark) -> None:
+    body = ndjson(
+        {"ark": f"ark:/{ark.ark}", "title": "Streamed", "unknown": "ignored"},
+        {"ark": "ark:/1/t2missing", "title": "nothing"},
+        {"ark": "ark:/2/t2other", "title": "elsewhere"},
+    )
+    lines = results(post(client, "/stream/update?naan=1", body, HTTP_AUTHORIZATION=auth))
+    assert lines[0] == {"line": 1, "ark": ark.ark, "updated": True}
+    assert lines[1]["error"] == "not found"
+    assert lines[2]["error"] == "ARK is not on the authorized NAAN"
+    ark.refresh_from_db()
+    assert ark.title == "Streamed"
+
+
+@pytest.mark.django_db
+def test_update_requires_authorization(client, auth, ark) -> None:
+    body = ndjson({"ark": f"ark:/{ark.ark}", "title": "Streamed"})
+    assert post(client, "/stream/update", body, HTTP_AUTHORIZATION=auth).status_code == 400
+    assert post(client, "/stream/update?naan=1", body).status_code == 403
+    assert post(client, "/stream/update?naan=2", body, HTTP_AUTHORIZATION=auth).status_code == 403
+
+
+@pytest.mark.django_db
+def test_mint_in_chunks(client, settings, auth, shoulder) -> None:
+    settings.ARKLET_STREAM_CHUNK_SIZE = 2
+    records = [{"shoulder": shoulder.shoulder, "title": f"ARK {i}"} for i in range(5)]
+    records.insert(2, {"shoulder": "/missing"})
+    lines = results(post(client, "/stream/mint?naan=1", ndjson(*records), HTTP_AUTHORIZATION=auth))
+    assert [r["line"] for r in lines] == list(range(1, 7))
+    assert lines[2]["error"] == "shoulder /missing does not exist"
+    minted = [r for r in lines if "ark" in r]
+    assert len(minted) == 5
+    assert Ark.objects.count() == 5
+    for result in minted:
+        assert Ark.objects.get(ark=result["ark"]).title == result["title"]
+
+
+@pytest.mark.django_db
+def test_batch_update_matches_records_by_ark(client, auth, naan, shoulder) -> None:
+    """The updated rows come back in database order, not request order."""
+    arks = [
+        Ark.objects.create(ark=f"1/t2{name}", naan=naan, shoulder=shoulder, assigned_name=name)
+        for name in ["b", "a", "c"]
+    ]
+    data = [{"ark": f"ark:/{a.ark}", "title": a.assigned_name} for a in reversed(arks)]
+    response = client.post(
+        "/bulk_update",
+        data={"naan": 1, "data": data},
+        content_type="application/json",
+        HTTP_AUTHORIZATION=auth,
+    )
+    assert response.status_code == 200
+    for a in arks:
+        a.refresh_from_db()
+        assert a.title == a.assigned_name
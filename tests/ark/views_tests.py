@@ -1,75 +1,22 @@
 """Tests for ark/views.py, comprising the main endpoints for arklet."""
 
 import uuid
-from dataclasses import asdict, dataclass
-from itertools import chain, count
+from dataclasses import asdict
+from itertools import chain, count, repeat
 from unittest.mock import patch
 
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from ark.models import Ark, Key, Naan, Shoulder
-from ark.utils import parse_ark
+from ark.models import Ark, Shoulder
+from ark.utils import betanumeric, parse_ark
 
 
-@dataclass
-class MintArkArgs:
-    """Django test client named arguments to test mint_ark.
-
-    Example use: client.post(**asdict(mint_ark_args))
-    """
-
-    path: str
-    data: dict
-    content_type: str
-    HTTP_AUTHORIZATION: str  # pylint: disable=invalid-name
-
-
-@pytest.fixture
-def naan(db):
-    """Create the initial NAAN used for most tests."""
-    return Naan.objects.create(
-        naan=1, name="Archive", description="A NAAN", url="https://example.com"
-    )
-
-
-@pytest.fixture
-def shoulder(db, naan):
-    """Create an initial shoulder used for most tests."""
-    return Shoulder.objects.create(
-        shoulder="/t2", naan=naan, name="Test", description="A Shoulder"
-    )
-
-
-@pytest.fixture
-def auth(db, naan):
-    """Create an access key for the initial naan."""
-    key = Key.objects.create(naan=naan, active=True)
-    return f"Bearer {key.key}"
-
-
-@pytest.fixture
-def ark(db, naan, shoulder):
-    """Create an ARK for tests."""
-    return Ark.objects.create(
-        ark=f"{naan.naan}{shoulder.shoulder}12346",
-        naan=naan,
-        shoulder=shoulder,
-        assigned_name="12346",
-    )
-
-
-@pytest.fixture
-def mint_ark_args(naan, shoulder, auth) -> MintArkArgs:
-    """Create the happy path arguments for mint_ark in Django test client."""
-    return MintArkArgs(
-        path="/mint",
-        data={
-            "naan": naan.naan,
-            "shoulder": shoulder.shoulder,
-        },
-        content_type="application/json",
-        HTTP_AUTHORIZATION=auth,
-    )
+def noid_sequence(noids):
+    """A generate_noids side effect that hands out the given NOIDs in order."""
+    noids = iter(noids)
+    return lambda count, length: [next(noids) for _ in range(count)]
 
 
 class TestMintArk:
@@ -151,35 +98,29 @@ class TestMintArk:
         # Then we get a 403 Forbidden
         assert res.status_code == 403
 
-    @pytest.mark.django_db(transaction=True)
-    @patch("ark.views.generate_noid")
+    @patch("ark.models.generate_noids")
     def test_fails_after_too_many_collisions(
         self, mock_noid_gen, caplog, client, mint_ark_args, ark
     ) -> None:
         """mint_ark returns an error after too many collisions.
 
-        We need to set `pytest.mark.django_db(transaction=True)` because this test
-        deliberately causes IntegrityErrors. When transaction=False all tests occur
-        within a transaction. That prevents the test from using transaction features
-        within the test. `transaction=True` is equivalent to Django
-        TransactionTestCase. `transaction=False` is equivalent to Django TestCase.
-
-        We patch ark.views.generate_noid (even though generate_noid is originally
-        defined in ark.utils) because it is imported directly into ark.views.
+        We patch ark.models.generate_noids (even though it is originally
+        defined in ark.utils) because it is imported directly into ark.models.
         """
         # pylint: disable=too-many-arguments
         # When mint_ark keeps creating NOIDs that collide with an existing ARK
         existing_noid = ark.assigned_name[:-1]
-        mock_noid_gen.return_value = existing_noid
+        mock_noid_gen.side_effect = noid_sequence(repeat(existing_noid))
         res = client.post(**asdict(mint_ark_args))
         # Then we log the error
         msg = "Gave up creating ark after"
         assert any(record for record in caplog.records if record.msg.startswith(msg))
         # Then we get a 500 Internal Server Error
         assert res.status_code == 500
+        # And the existing ARK is untouched
+        assert Ark.objects.count() == 1
 
-    @pytest.mark.django_db(transaction=True)
-    @patch("ark.views.generate_noid")
+    @patch("ark.models.generate_noids")
     def test_succeeds_on_single_collision(
         self, mock_noid_gen, caplog, client, mint_ark_args, ark
     ) -> None:
@@ -191,16 +132,265 @@ class TestMintArk:
         """
         # pylint: disable=too-many-arguments
 
-        # mock generate_noid to return a conflicting NOID on first call
+        # mock generate_noids to return a conflicting NOID on first call
         # and non-conflicting NOIDs on subsequent calls
         existing_noid = ark.assigned_name[:-1]
         non_colliding_noid_gen = (str(i) for i in count(100_000_000))
-        return_values = chain([existing_noid], non_colliding_noid_gen)
-        mock_noid_gen.side_effect = lambda noid_length: next(return_values)
+        mock_noid_gen.side_effect = noid_sequence(chain([existing_noid], non_colliding_noid_gen))
 
         # When mint_ark generates a single collision
         res = client.post(**asdict(mint_ark_args))
         # Then arklet logs a warning about the collision, but otherwise succeeds
-        msg = "Ark created after %d collision(s)"
+        msg = "ARKs created after %d collision(s)"
         assert any(record for record in caplog.records if record.msg == msg)
         self._validate_success(mint_ark_args, res)
+
+
+class TestBulkMint:
+    """Test the arklet batch_mint_arks endpoint."""
+
+    @staticmethod
+    def _post(client, auth, naan, shoulder, n):
+        return client.post(
+            "/bulk_mint",
+            data={
+                "naan": naan.naan,
+                "data": [{"shoulder": shoulder.shoulder, "title": str(i)} for i in range(n)],
+            },
+            content_type="application/json",
+            HTTP_AUTHORIZATION=auth,
+        )
+
+    @pytest.mark.django_db
+    @patch("ark.models.generate_noids")
+    def test_remints_only_colliding_rows(
+        self, mock_noid_gen, client, auth, naan, shoulder, bound_ark
+    ) -> None:
+        """Rows that collide with an existing ARK or each other are minted again alone."""
+        # pylint: disable=too-many-arguments
+        taken = bound_ark.assigned_name[:-1]
+        mock_noid_gen.side_effect = noid_sequence([taken, "b", "c", "c", "d", "e"])
+        res = self._post(client, auth, naan, shoulder, 4)
+        assert res.status_code == 200
+        created = res.json()["arks_created"]
+        assert [a["title"] for a in created] == ["0", "1", "2", "3"]
+        names = [a["ark"].split("/t2")[1][:-1] for a in created]
+        assert names == ["d", "b", "c", "e"]
+        # The second round only draws NOIDs for the two rows that collided
+        assert [c.args[0] for c in mock_noid_gen.call_args_list] == [4, 2]
+        assert Ark.objects.get(ark=bound_ark.ark).url == bound_ark.url
+
+    @pytest.mark.django_db(transaction=True)
+    @patch("ark.models.generate_noids")
+    def test_gives_up_atomically(self, mock_noid_gen, client, auth, naan, shoulder, ark) -> None:
+        """When a row keeps colliding none of the batch is kept."""
+        # pylint: disable=too-many-arguments
+        noids = chain(["fresh"], repeat(ark.assigned_name[:-1]))
+        mock_noid_gen.side_effect = noid_sequence(noids)
+        res = self._post(client, auth, naan, shoulder, 2)
+        assert res.status_code == 500
+        assert Ark.objects.count() == 1
+
+
+class TestSequentialMinting:
+    """Test minting on shoulders with the sequential template."""
+
+    @pytest.fixture
+    def sequential(self, shoulder):
+        shoulder.template = Shoulder.SEQUENTIAL
+        shoulder.save()
+        return shoulder
+
+    def test_betanumeric(self) -> None:
+        assert betanumeric(0, 8) == "00000000"
+        assert betanumeric(29, 3) == "010"
+        assert betanumeric(29**4, 3) == "10000"
+
+    @pytest.mark.django_db
+    def test_mints_in_order(self, client, mint_ark_args, sequential) -> None:
+        """Each mint takes the next value of the shoulder's counter."""
+        names = [
+            parse_ark(client.post(**asdict(mint_ark_args)).json()["ark"])[2]
+            for _ in range(3)
+        ]
+        noids = [name[len("t2"):-1] for name in names]
+        assert noids == ["00000001", "00000002", "00000003"]
+
+    @pytest.mark.django_db
+    def test_bulk_mint_reserves_a_range(self, client, auth, naan, sequential) -> None:
+        """batch_mint_arks reserves a shoulder's NOIDs together."""
+        client.post(
+            "/bulk_mint",
+            data={"naan": naan.naan, "data": [{"shoulder": sequential.shoulder}] * 5},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=auth,
+        )
+        assert sequential.reserve(2) == [6, 7]
+        assert Ark.objects.filter(shoulder=sequential).count() == 5
+
+    @pytest.mark.django_db(transaction=True)
+    @patch("ark.models.generate_noids")
+    def test_collision_keeps_existing_ark(
+        self, mock_noid_gen, client, mint_ark_args, bound_ark
+    ) -> None:
+        """A NOID that collides is retried instead of overwriting the ARK that has it."""
+        mock_noid_gen.side_effect = noid_sequence([bound_ark.assigned_name[:-1], "abcd"])
+        res = client.post(**asdict(mint_ark_args))
+        assert res.status_code == 200
+        assert Ark.objects.get(ark=bound_ark.ark).url == bound_ark.url
+
+
+class TestResolveArk:
+    """Test the arklet resolve_ark endpoint."""
+
+    @pytest.mark.django_db
+    def test_redirects_to_url(self, client, bound_ark) -> None:
+        """resolve_ark redirects a bound ARK to its URL."""
+        res = client.get(f"/ark:/{bound_ark.ark}")
+        assert res.status_code == 302
+        assert res["Location"].startswith(bound_ark.url)
+
+    @pytest.mark.django_db
+    def test_repeat_resolution_is_cached(
+        self, client, bound_ark, django_assert_num_queries
+    ) -> None:
+        """The second resolution of an ARK is answered without a query."""
+        client.get(f"/ark:/{bound_ark.ark}")
+        with django_assert_num_queries(0):
+            res = client.get(f"/ark:/{bound_ark.ark}")
+        assert res["Location"].startswith(bound_ark.url)
+        assert client.get("/").json()["resolver_cache"]["local"]["hits"] == 1
+
+    @pytest.mark.django_db
+    def test_update_shows_up_on_next_resolve(self, client, auth, bound_ark) -> None:
+        """update_ark invalidates the cached redirect."""
+        client.get(f"/ark:/{bound_ark.ark}")
+        client.put(
+            "/update",
+            data={"ark": f"ark:/{bound_ark.ark}", "url": "https://example.com/second"},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=auth,
+        )
+        res = client.get(f"/ark:/{bound_ark.ark}")
+        assert res["Location"].startswith("https://example.com/second")
+
+    @pytest.mark.django_db
+    def test_bulk_update_shows_up_on_next_resolve(
+        self, client, auth, bound_ark
+    ) -> None:
+        """batch_update_arks invalidates the cached redirect."""
+        client.get(f"/ark:/{bound_ark.ark}")
+        client.post(
+            "/bulk_update",
+            data={"data": [{"ark": f"ark:/{bound_ark.ark}", "url": "https://example.com/second"}]},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=auth,
+        )
+        res = client.get(f"/ark:/{bound_ark.ark}")
+        assert res["Location"].startswith("https://example.com/second")
+
+    @pytest.mark.django_db
+    def test_cold_resolution_is_one_query(
+        self, client, bound_ark, warm_registry, django_assert_num_queries
+    ) -> None:
+        """An uncached exact match costs exactly one query."""
+        with django_assert_num_queries(1):
+            res = client.get(f"/ark:/{bound_ark.ark}")
+        assert res["Location"].startswith(bound_ark.url)
+
+    @pytest.mark.django_db
+    def test_redirect_reads_only_ark_and_url(self, client, bound_ark, warm_registry) -> None:
+        """Redirects don't fetch the wide text columns, so an index-only scan can answer."""
+        with CaptureQueriesContext(connection) as queries:
+            client.get(f"/ark:/{bound_ark.ark}")
+        (query,) = queries.captured_queries
+        assert '"url"' in query["sql"]
+        assert '"metadata"' not in query["sql"]
+        assert '"title"' not in query["sql"]
+
+    @pytest.mark.django_db
+    def test_longest_prefix_wins(
+        self, client, naan, shoulder, bound_ark, warm_registry, django_assert_num_queries
+    ) -> None:
+        """A suffix is passed through to the longest existing prefix in one query."""
+        Ark.objects.create(
+            ark=f"{bound_ark.ark}/chapter",
+            naan=naan,
+            shoulder=shoulder,
+            assigned_name=f"{bound_ark.assigned_name}/chapter",
+            url="https://example.com/chapter",
+        )
+        with django_assert_num_queries(1):
+            res = client.get(f"/ark:/{bound_ark.ark}/chapter/page/2")
+        assert res["Location"] == "https://example.com/chapter/page/2"
+
+    @pytest.mark.django_db
+    def test_unknown_ark_falls_back_to_naan(
+        self, client, naan, warm_registry, django_assert_num_queries
+    ) -> None:
+        """An unknown ARK under a hosted NAAN redirects to the NAAN URL in one query."""
+        with django_assert_num_queries(1):
+            res = client.get(f"/ark:/{naan.naan}/t2missing")
+        assert res["Location"] == f"{naan.url}/ark:/{naan.naan}/t2missing"
+
+    @pytest.mark.django_db
+    def test_unknown_naan_goes_to_n2t(
+        self, client, warm_registry, django_assert_num_queries
+    ) -> None:
+        """An ARK under a NAAN we don't host is sent to n2t.net without a query."""
+        with django_assert_num_queries(0):
+            res = client.get("/ark:/99999/t2missing")
+        assert res["Location"] == "https://n2t.net/ark:/99999/t2missing"
+
+    @pytest.mark.django_db
+    def test_info_on_unknown_ark_is_404(self, client, naan) -> None:
+        """?info and ?json don't fall back to another resolver."""
+        assert client.get(f"/ark:/{naan.naan}/t2missing?info").status_code == 404
+
+
+class TestResolverHttpCaching:
+    """Cache-Control on redirects, and conditional requests for ?info and ?json."""
+
+    @pytest.mark.django_db
+    def test_no_cache_control_by_default(self, client, bound_ark) -> None:
+        res = client.get(f"/ark:/{bound_ark.ark}")
+        assert "Cache-Control" not in res
+
+    @pytest.mark.django_db
+    def test_redirect_max_age(self, client, settings, bound_ark, naan) -> None:
+        """Redirects carry the configured max-age, fallbacks the negative cache TTL."""
+        settings.ARKLET_REDIRECT_MAX_AGE = 600
+        settings.ARKLET_RESOLVER_NEGATIVE_CACHE_TTL = 30
+        res = client.get(f"/ark:/{bound_ark.ark}")
+        assert res["Cache-Control"] == "max-age=600"
+        res = client.get(f"/ark:/{bound_ark.ark}/page/2")
+        assert res["Cache-Control"] == "max-age=600"
+        res = client.get(f"/ark:/{naan.naan}/t2missing")
+        assert res["Cache-Control"] == "max-age=30"
+
+    @pytest.mark.parametrize("inflection", ["info", "json"])
+    @pytest.mark.django_db
+    def test_if_none_match_is_304(self, client, bound_ark, inflection) -> None:
+        """A matching ETag is answered with 304 without rendering."""
+        res = client.get(f"/ark:/{bound_ark.ark}?{inflection}")
+        assert res.status_code == 200
+        assert res["ETag"].startswith('"')
+        assert res["Last-Modified"]
+        with patch("ark.views.render") as render, patch("ark.views.JsonResponse") as json_response:
+            res = client.get(
+                f"/ark:/{bound_ark.ark}?{inflection}", HTTP_IF_NONE_MATCH=res["ETag"]
+            )
+        assert res.status_code == 304
+        render.assert_not_called()
+        json_response.assert_not_called()
+
+    @pytest.mark.django_db
+    def test_etag_changes_with_representation_and_content(self, client, bound_ark) -> None:
+        info = client.get(f"/ark:/{bound_ark.ark}?info")["ETag"]
+        json_etag = client.get(f"/ark:/{bound_ark.ark}?json")["ETag"]
+        assert info != json_etag
+        bound_ark.title = "Changed"
+        bound_ark.save()
+        res = client.get(f"/ark:/{bound_ark.ark}?info", HTTP_IF_NONE_MATCH=info)
+        assert res.status_code == 200
+        assert res["ETag"] != info
@@ -3,6 +3,7 @@ import csv
 import argparse
 import json
 import os
+import uuid
 
 #DEFAULT_URL = 'http://127.0.0.1:8001'
 DEFAULT_URL = 'http://ark.frick.org:8080'
@@ -32,14 +33,26 @@ PUT = 'put'
 class ArkAPIError(Exception):
     pass
 
-def query_generic(method, url, **kwargs):
+
+RETRIES = 3
+# Seconds to wait for a response before giving up (and retrying mints)
+TIMEOUT = 60
+
+
+def query_generic(method, url, retries=0, **kwargs):
     url = DEFAULT_URL + '/' + url
-    if method == GET:
-        response = requests.get(url)
-    elif method == POST:
-        response = requests.post(url, **kwargs)
-    elif method == PUT:
-        response = requests.put(url, **kwargs)
+    for attempt in range(retries + 1):
+        try:
+            if method == GET:
+                response = requests.get(url, timeout=TIMEOUT)
+            elif method == POST:
+                response = requests.post(url, timeout=TIMEOUT, **kwargs)
+            elif method == PUT:
+                response = requests.put(url, timeout=TIMEOUT, **kwargs)
+            break
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
     if response.status_code == 200:
         return response.json()
     else:
@@ -57,6 +70,13 @@ def authorized(method, url, data):
     auth = DEFAULT_KEY
     return query_generic(method, url, json=data, headers={'Authorization': auth})
 
+
+def authorized_mint(url, data):
+    # Retries reuse the Idempotency-Key, so a timed out mint is never repeated
+    headers = {'Authorization': DEFAULT_KEY, 'Idempotency-Key': str(uuid.uuid4())}
+    return query_generic(POST, url, retries=RETRIES, json=data, headers=headers)
+
+
 def update(data: dict):
     assert data['ark'], "Must include --ark argument"
     return authorized(PUT, 'update', data)
@@ -64,7 +84,7 @@ def update(data: dict):
 def mint(data: dict):
     assert data['naan'], "Must include --naan argument for mint operation"
     assert data['shoulder'], "Must include --shoulder argument for mint operation"
-    return authorized(POST, 'mint', data)
+    return authorized_mint('mint', data)
 
 def csv2json(csvfile):
     reader = csv.DictReader(open(csvfile, 'rt'))
@@ -92,7 +112,7 @@ def mint_csv(data: dict):
     assert data['naan'], "Must include --naan argument for bulk operations"
     assert len(data.keys()) == 2, "Only --csv argument is required for bulk update"
     mint_data = csv2json(data['csv'])
-    return authorized(POST, 'bulk_mint', {
+    return authorized_mint('bulk_mint', {
         'data': mint_data,
         'naan': data['naan']
     })